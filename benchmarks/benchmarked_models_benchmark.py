@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# Time to load N benchmarked models scored against the same actuals.tsv:
+# the previous implementation, which parsed the actuals for every model and
+# compared sorted lists of ids, versus the current one, which shares the
+# indexed actuals between the models.
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import ModelDataManager, ACTUALS_FILE, SCORES_BM_FILE
+
+BASEDIR = 'benchmark'
+
+
+def previous_load(file_system, model_path):
+    # The previous BenchmarkedModelData.to_data_frame
+    def indexed_data_frame(path):
+        df = pd.read_csv(os.path.join(file_system.basedir, path), sep='\t', index_col=False)
+        assert df.duplicated('id').sum() == 0, "id column is not unique"
+        return df.set_index('id')
+
+    df_actuals = indexed_data_frame(os.path.join(BASEDIR, ACTUALS_FILE))
+    df_scores = indexed_data_frame(os.path.join(model_path, SCORES_BM_FILE))
+    assert sorted(df_actuals.index) == sorted(df_scores.index), \
+        "Indices for actuals and scores do not match"
+    df = pd.merge(df_actuals, df_scores, left_index=True, right_index=True)
+    return df.dropna(how='any')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--models", type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        file_system = LocalFileSystem(tmpdir)
+        random_state = np.random.RandomState(0)
+        # String ids, in a different order in every file
+        ids = np.array(['id%d' % i for i in xrange(args.rows)], dtype=object)
+        actuals = pd.DataFrame({'id': ids, 'actual': random_state.rand(args.rows) < 0.3},
+                               columns=['id', 'actual'])
+        os.makedirs(os.path.join(tmpdir, BASEDIR))
+        actuals.to_csv(os.path.join(tmpdir, BASEDIR, ACTUALS_FILE), sep='\t', index=False)
+        model_paths = []
+        for i in xrange(args.models):
+            model_path = os.path.join(BASEDIR, 'model_%d' % i)
+            os.makedirs(os.path.join(tmpdir, model_path))
+            scores = pd.DataFrame({'id': ids[random_state.permutation(args.rows)],
+                                   'pred_score': random_state.rand(args.rows)},
+                                  columns=['id', 'pred_score'])
+            scores.to_csv(os.path.join(tmpdir, model_path, SCORES_BM_FILE), sep='\t', index=False)
+            model_paths.append(model_path)
+
+        start = time.time()
+        for model_path in model_paths:
+            previous_load(file_system, model_path)
+        previous_time = time.time() - start
+
+        start = time.time()
+        manager = ModelDataManager(file_system)
+        for model_path in model_paths:
+            manager.get_model(model_path).to_data_frame()
+        shared_time = time.time() - start
+
+        print "%d models, %d rows each" % (args.models, args.rows)
+        print "%12s %12s %9s" % ("previous (s)", "shared (s)", "speedup")
+        print "%12.3f %12.3f %8.1fx" % (previous_time, shared_time, previous_time / shared_time)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# Time to list the models of a local tree of many models, each a directory
+# with scores, a few artifacts and some history: the old os.walk and getctime
+# of every file, then the manifest listing cold, warm, and after one model was
+# added.
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from topmodel import file_system
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import is_model_file
+
+
+def make_tree(basedir, n_models):
+    for i in xrange(n_models):
+        model_dir = os.path.join(basedir, 'team%d' % (i % 100), 'model%d' % i)
+        os.makedirs(os.path.join(model_dir, 'history'))
+        for name in ['scores.tsv', 'histogram.json', 'metrics.json', 'bootstrap-50.json',
+                     'history/2016-01-01.histogram.json']:
+            open(os.path.join(model_dir, name), 'w').close()
+
+
+def walk_listing(basedir):
+    # What LocalFileSystem.list_name_modified used to do
+    names_and_modified = {}
+    for dirpath, _, filenames in os.walk(basedir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            names_and_modified[path[len(basedir + '/'):]] = time.ctime(os.path.getctime(path))
+    return names_and_modified
+
+
+def timed(name, f):
+    start = time.time()
+    result = f()
+    print "%s: %.2fs, %d files" % (name, time.time() - start, len(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--models", type=int, default=10000)
+    args = parser.parse_args()
+
+    basedir = tempfile.mkdtemp()
+    try:
+        make_tree(basedir, args.models)
+        # Listings right after the tree was made would otherwise not be reused
+        file_system.RACY_SECONDS = -1
+        fs = LocalFileSystem(basedir)
+        timed("os.walk and getctime", lambda: walk_listing(basedir))
+        timed("manifest, cold", lambda: fs.list_name_modified('', is_model_file))
+        timed("manifest, warm", lambda: fs.list_name_modified('', is_model_file))
+        open(os.path.join(basedir, 'team0', 'model0', 'actuals.tsv'), 'w').close()
+        timed("manifest, one new file", lambda: fs.list_name_modified('', is_model_file))
+        timed("manifest, one team", lambda: fs.list_name_modified('team1', is_model_file))
+    finally:
+        shutil.rmtree(basedir)
+
+
+if __name__ == '__main__':
+    main()
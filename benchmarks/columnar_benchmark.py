@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Time to load a model's scores from scores.tsv versus its binary columnar
+# copy. "cold" is the first load in a new process, "warm" a second load in
+# the same process.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import ModelData
+
+MODEL_PATH = 'big_model'
+
+
+def load_time(file_system):
+    start = time.time()
+    ModelData(file_system, MODEL_PATH).to_data_frame()
+    return time.time() - start
+
+
+def measure(basedir, fmt):
+    # Runs in the child process
+    file_system = LocalFileSystem(basedir)
+    if fmt == 'tsv':
+        # Hide the columns without deleting them
+        os.rename(os.path.join(basedir, MODEL_PATH, 'scores.columns'),
+                  os.path.join(basedir, 'hidden.columns'))
+    try:
+        cold = load_time(file_system)
+        warm = load_time(file_system)
+    finally:
+        if fmt == 'tsv':
+            os.rename(os.path.join(basedir, 'hidden.columns'),
+                      os.path.join(basedir, MODEL_PATH, 'scores.columns'))
+    print "%8s %10.3f %10.3f" % (fmt, cold, warm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--measure", nargs=2, metavar=("BASEDIR", "FORMAT"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    basedir = tempfile.mkdtemp()
+    try:
+        random_state = np.random.RandomState(0)
+        scores = random_state.rand(args.rows)
+        df = pd.DataFrame({'actual': random_state.rand(args.rows) < scores,
+                           'pred_score': scores})
+        model_data = ModelData(LocalFileSystem(basedir), MODEL_PATH)
+        model_data.save_data_frame(df)
+        model_data.save_columns()
+
+        print "%d rows" % args.rows
+        print "%8s %10s %10s" % ("format", "cold (s)", "warm (s)")
+        for fmt in ['tsv', 'columns']:
+            subprocess.check_call([sys.executable, __file__, "--measure", basedir, fmt])
+    finally:
+        shutil.rmtree(basedir)
+
+
+if __name__ == "__main__":
+    main()
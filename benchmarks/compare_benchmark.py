@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Wall clock time to compute the metrics of the models on the /compare page,
+# one after another as before, versus in a process pool, as the number of
+# models grows. Nothing is cached between runs.
+
+import argparse
+import functools
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import ModelData, ModelDataManager, BOOTSTRAP_FILE, HISTOGRAM_FILE
+from topmodel.precompute import MetricsComputer, init_worker
+
+N_BOOTSTRAP_SAMPLES = 10
+
+
+def remove_artifacts(file_system, model_paths):
+    for model_path in model_paths:
+        for filename in [HISTOGRAM_FILE, BOOTSTRAP_FILE % N_BOOTSTRAP_SAMPLES]:
+            if file_system.stat(model_path + '/' + filename) is not None:
+                file_system.remove(model_path + '/' + filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--models", default="1,2,4,8",
+                        help="Comma separated numbers of models to compare")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    n_models = map(int, args.models.split(','))
+    tmpdir = tempfile.mkdtemp()
+    file_system = LocalFileSystem(tmpdir)
+    pool = multiprocessing.Pool(args.processes, init_worker,
+                                (functools.partial(LocalFileSystem, tmpdir),))
+    try:
+        random_state = np.random.RandomState(0)
+        model_paths = ['model_%d' % i for i in xrange(max(n_models))]
+        for model_path in model_paths:
+            scores = random_state.rand(args.rows)
+            df = pd.DataFrame({'actual': random_state.rand(args.rows) < scores,
+                               'pred_score': scores})
+            ModelData(file_system, model_path).save_data_frame(df)
+
+        print "%d rows per model, %d processes" % (
+            args.rows, args.processes or multiprocessing.cpu_count())
+        print "%8s %12s %12s %9s" % ("models", "serial (s)", "pool (s)", "speedup")
+        for n in n_models:
+            paths = model_paths[:n]
+
+            remove_artifacts(file_system, paths)
+            manager = ModelDataManager(file_system)
+            start = time.time()
+            for model_path in paths:
+                manager.get_model(model_path).get_metrics(N_BOOTSTRAP_SAMPLES)
+            serial = time.time() - start
+
+            remove_artifacts(file_system, paths)
+            manager = ModelDataManager(file_system)
+            start = time.time()
+            MetricsComputer(manager, pool).get_metrics(paths, N_BOOTSTRAP_SAMPLES)
+            parallel = time.time() - start
+
+            print "%8d %12.3f %12.3f %8.1fx" % (n, serial, parallel, serial / parallel)
+    finally:
+        pool.terminate()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
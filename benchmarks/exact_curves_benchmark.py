@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# Time and peak memory of the exact curves of a large model, next to the
+# histogram metrics, on random scores with most positives above 0.99.
+
+import argparse
+import resource
+import time
+
+import numpy as np
+
+from topmodel import curves
+from topmodel import histogram
+from topmodel.model_data import THRESHOLD_BINS
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--weighted", action="store_true")
+    args = parser.parse_args()
+
+    random_state = np.random.RandomState(0)
+    predicted = 1 - random_state.exponential(0.01, args.rows).clip(0, 1)
+    actual = random_state.rand(args.rows) < predicted ** 100
+    weight = random_state.randint(1, 10, args.rows) if args.weighted else None
+    print "%d rows, %d positives, %.0f MB after generating them" % (
+        args.rows, actual.sum(), max_rss_mb())
+
+    start = time.time()
+    histogram.histogram(histogram.uniform_bin_edges(THRESHOLD_BINS), predicted, actual,
+                        np.ones(args.rows) if weight is None else weight)
+    print "histogram: %.1fs" % (time.time() - start)
+
+    start = time.time()
+    exact = curves.exact_curves(predicted, actual, weight)
+    print "exact curves: %.1fs, %d points kept, AUC %.5f, average precision %.5f" % (
+        time.time() - start, len(exact['thresholds']), exact['auc'], exact['average_precision'])
+    print "peak memory: %.0f MB" % max_rss_mb()
+
+
+if __name__ == '__main__':
+    main()
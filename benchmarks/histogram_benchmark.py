@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Compares the vectorized histogram builder with the per-bin mask loop it
+# replaced, on synthetic scores.
+
+import argparse
+import time
+
+import numpy as np
+
+from topmodel import histogram
+from topmodel.model_data import THRESHOLD_BINS, TOP_THRESHOLDS
+
+
+def loop_thresholds_trues_totals(range_info, bin_list, predicted, actual, weight):
+    # The previous implementation: two masks and two sums for every bin
+    trues, totals, thresholds = [], [], []
+    for i in range(range_info):
+        thresholds.append(bin_list[i + 1])
+        obs_in_bin = (predicted >= bin_list[i]) & (predicted < bin_list[i + 1])
+        true_obs_in_bin = obs_in_bin & actual
+        trues.append(np.sum(weight * true_obs_in_bin))
+        totals.append(np.sum(weight * obs_in_bin))
+    return {'thresholds': thresholds, 'trues': trues, 'totals': totals}
+
+
+def loop_histograms(bin_edges, top_bins, predicted, actual, weight):
+    return [loop_thresholds_trues_totals(len(bin_edges) - 1, bin_edges, predicted, actual, weight),
+            loop_thresholds_trues_totals(len(top_bins) - 1, top_bins, predicted, actual, weight)]
+
+
+def make_scores(n_rows, seed=0):
+    random_state = np.random.RandomState(seed)
+    predicted = random_state.beta(0.5, 2.0, n_rows)
+    predicted[:n_rows // 1000] = 1.0  # exercise the right edge
+    actual = random_state.rand(n_rows) < predicted
+    weight = np.ones(n_rows)
+    return predicted, actual, weight
+
+
+def best_of(repeat, f, *args):
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        result = f(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", default="1000000,10000000,50000000",
+                        help="Comma separated row counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bin_edges = histogram.uniform_bin_edges(THRESHOLD_BINS)
+    top_bins = histogram.top_bin_edges(TOP_THRESHOLDS)
+
+    print "%12s %12s %12s %9s" % ("rows", "loop (s)", "binned (s)", "speedup")
+    for n_rows in map(int, args.rows.split(',')):
+        predicted, actual, weight = make_scores(n_rows)
+        loop_time, expected = best_of(
+            args.repeat, loop_histograms, bin_edges, top_bins, predicted, actual, weight)
+        binned_time, result = best_of(
+            args.repeat, histogram.histograms, [bin_edges, top_bins], predicted, actual, weight)
+        for old, new in zip(expected, result):
+            assert old['trues'] == new['trues'] and old['totals'] == new['totals']
+        print "%12d %12.3f %12.3f %8.1fx" % (
+            n_rows, loop_time, binned_time, loop_time / binned_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Latency of fetching the artifacts of many models from S3: one read_file
+# after another, as before, versus a single read_files. Needs the bucket in
+# config.yaml; the files are written under a temporary prefix and removed.
+
+import argparse
+import os
+import time
+import uuid
+
+from topmodel import settings
+from topmodel.file_system import S3FileSystem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="./config.yaml")
+    parser.add_argument("--models", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=200,
+                        help="Size of each model's file")
+    parser.add_argument("--large-mb", type=int, default=64,
+                        help="Size of a single large file, fetched as ranged GETs")
+    args = parser.parse_args()
+
+    config = settings.read_config(args.config)
+    prefix = 'topmodel-benchmark-%s' % uuid.uuid4().hex
+    file_system = S3FileSystem(config['bucket'], config['aws_access_key'],
+                               config['aws_secret_key'], subdirectory=prefix)
+    try:
+        paths = ['model_%d/histogram.json' % i for i in xrange(args.models)]
+        for path in paths:
+            file_system.write_file(path, os.urandom(args.size_kb * 1024))
+        file_system.write_file('large', os.urandom(args.large_mb * 1024 * 1024))
+
+        print "%-32s %12s %12s" % ("", "serial (s)", "parallel (s)")
+
+        start = time.time()
+        for path in paths:
+            key = file_system.bucket.get_key(file_system.subdirectory + path)
+            key.read()
+        serial = time.time() - start
+        start = time.time()
+        file_system.read_files(paths)
+        parallel = time.time() - start
+        print "%-32s %12.3f %12.3f" % ("%d models x %d KB" % (args.models, args.size_kb),
+                                       serial, parallel)
+
+        start = time.time()
+        file_system.bucket.get_key(file_system.subdirectory + 'large').read()
+        serial = time.time() - start
+        start = time.time()
+        file_system.read_file('large')
+        parallel = time.time() - start
+        print "%-32s %12.3f %12.3f" % ("1 file x %d MB" % args.large_mb, serial, parallel)
+    finally:
+        file_system.remove('')
+
+
+if __name__ == "__main__":
+    main()
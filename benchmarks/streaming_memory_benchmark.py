@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Peak memory of histogramming a large scores.tsv, streamed in chunks versus
+# parsed into one data frame. Each measurement runs in a fresh process.
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import ModelData, CHUNK_SIZE
+
+MODEL_PATH = 'big_model'
+
+
+def write_scores(path, size_bytes, seed=0):
+    # About 28 bytes per row
+    random_state = np.random.RandomState(seed)
+    rows_per_block = 1000000
+    with open(path, 'w') as f:
+        f.write('actual\tpred_score\n')
+        while f.tell() < size_bytes:
+            scores = random_state.rand(rows_per_block)
+            actual = random_state.rand(rows_per_block) < scores
+            f.writelines('%d\t%r\n' % row for row in zip(actual, scores))
+
+
+def measure(basedir, mode, chunk_size):
+    # Runs in the child process
+    model_data = ModelData(LocalFileSystem(basedir), MODEL_PATH, chunk_size=chunk_size)
+    start = time.time()
+    if mode == 'frame':
+        model_data.to_data_frame()
+    model_data.to_histogram_format()
+    elapsed = time.time() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print "%8s %12.0f %10.1f" % (mode, peak_mb, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-gb", type=float, default=5.0)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="Rows per chunk when streaming")
+    parser.add_argument("--modes", default="stream,frame")
+    parser.add_argument("--measure", nargs=2, metavar=("BASEDIR", "MODE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure[0], args.measure[1], args.chunk_size)
+        return
+
+    basedir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(basedir, MODEL_PATH))
+        scores_path = os.path.join(basedir, MODEL_PATH, 'scores.tsv')
+        write_scores(scores_path, int(args.size_gb * 1024 ** 3))
+        print "scores.tsv: %.2f GB" % (os.path.getsize(scores_path) / 1024.0 ** 3)
+        print "%8s %12s %10s" % ("mode", "peak RSS MB", "time (s)")
+        for mode in args.modes.split(','):
+            histogram_path = os.path.join(basedir, MODEL_PATH, 'histogram.json')
+            if os.path.exists(histogram_path):
+                os.remove(histogram_path)
+            subprocess.check_call([sys.executable, __file__, "--measure", basedir, mode,
+                                   "--chunk-size", str(args.chunk_size)])
+    finally:
+        shutil.rmtree(basedir)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,11 @@ setup(name='topmodel',
                         'pyyaml>=3.10',
                         'scikit_learn>=0.14.1',
                         'scipy>=0.13.3',
-                        'mpld3>=0.2'
+                        'mpld3>=0.2',
+                        'scandir; python_version < "3"'
                         ],
       packages=['topmodel'],
+      entry_points={
+          'console_scripts': ['topmodel=topmodel.cli:main'],
+      },
       )
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from topmodel.cache import LRUCache, sizeof
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_bytes=250)
+        for key in ['a', 'b']:
+            cache.put(key, np.zeros(10))  # 80 bytes each
+        cache.get('a')
+        cache.put('c', np.zeros(10))
+        cache.put('d', np.zeros(10))
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.size == 240
+
+    def test_too_big_for_budget(self):
+        cache = LRUCache(max_bytes=100)
+        cache.put('a', np.zeros(10))
+        cache.put('b', np.zeros(100))
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+
+    def test_replace_updates_size(self):
+        cache = LRUCache()
+        cache.put('a', np.zeros(10))
+        cache.put('a', np.zeros(20))
+        assert cache.size == 160
+        cache.pop('a')
+        assert cache.size == 0
+
+    def test_stats(self):
+        cache = LRUCache(max_bytes=100)
+        cache.put('a', np.zeros(10))
+        cache.get('a')
+        cache.get('b')
+        cache.put('c', np.zeros(10))
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 1, 1)
+        assert stats['entries'] == 1 and stats['bytes'] == 80
+
+    def test_sizeof_nested(self):
+        assert sizeof({'a': [1.0, 2.0]}) > sizeof([1.0, 2.0]) > sizeof(1.0)
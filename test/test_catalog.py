@@ -0,0 +1,34 @@
+import unittest
+
+from topmodel.catalog import ModelCatalog, paginate
+
+
+class ModelCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        # 'a' is a model with models under it, and 'a-b' sorts between them
+        self.catalog = ModelCatalog(['b/x', 'a', 'a/c', 'a/d/e', 'a/d/f', 'a-b'])
+
+    def test_children(self):
+        assert self.catalog.children('') == [
+            ('a', True, 3), ('a-b', True, 0), ('b', False, 1)]
+        assert self.catalog.children('a/') == [('a/c', True, 0), ('a/d', False, 2)]
+        assert self.catalog.children('missing') == []
+
+    def test_under_and_contains(self):
+        assert self.catalog.under('a') == ['a/c', 'a/d/e', 'a/d/f']
+        assert 'a' in self.catalog and 'a/d' not in self.catalog
+
+    def test_update_replaces_a_directory(self):
+        self.catalog.update('a', ['a/g'])
+        assert self.catalog.paths == ['a-b', 'a/g', 'b/x']
+        self.catalog.update('', ['c'])
+        assert self.catalog.paths == ['c']
+
+    def test_search(self):
+        assert self.catalog.search('D/') == ['a/d/e', 'a/d/f']
+        assert self.catalog.search('x', 'a') == []
+
+    def test_paginate(self):
+        assert paginate(range(5), 2, page_size=2) == ([2, 3], 3)
+        assert paginate([], 1) == ([], 1)
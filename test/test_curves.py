@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from topmodel import curves
+
+
+def loop_auc_average_precision(predicted, actual, weight):
+    # Reference implementation: one mask per distinct score
+    thresholds = np.unique(predicted)[::-1]
+    true_positives = np.array([np.sum(weight * (actual & (predicted >= t))) for t in thresholds])
+    false_positives = np.array([np.sum(weight * (~actual & (predicted >= t))) for t in thresholds])
+    recalls = true_positives / np.sum(weight * actual)
+    fprs = false_positives / np.sum(weight * ~actual)
+    precisions = true_positives / (true_positives + false_positives)
+    auc = np.trapz(np.append(0, recalls), np.append(0, fprs))
+    average_precision = np.sum(np.diff(np.append(0, recalls)) * precisions)
+    return auc, average_precision
+
+
+class ExactCurvesTest(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        # Rounded, so there are plenty of tied scores
+        self.predicted = np.round(random_state.rand(2000), 2)
+        self.actual = random_state.rand(2000) < self.predicted
+        self.weight = random_state.randint(1, 4, 2000).astype(float)
+
+    def assert_matches_reference(self, weight, **kwargs):
+        exact = curves.exact_curves(self.predicted, self.actual, weight, **kwargs)
+        auc, average_precision = loop_auc_average_precision(
+            self.predicted, self.actual, np.ones(2000) if weight is None else weight)
+        assert np.isclose(exact['auc'], auc)
+        assert np.isclose(exact['average_precision'], average_precision)
+        return exact
+
+    def test_matches_reference(self):
+        exact = self.assert_matches_reference(None)
+        # A point for every distinct score, lowest threshold first
+        assert exact['thresholds'] == sorted(np.unique(self.predicted).tolist())
+        assert exact['recalls'][0] == 1.0 and exact['fprs'][0] == 1.0
+
+    def test_weighted_matches_reference(self):
+        self.assert_matches_reference(self.weight)
+
+    def test_blocks_give_the_same_curves(self):
+        whole = curves.exact_curves(self.predicted, self.actual, self.weight)
+        blocks = curves.exact_curves(self.predicted, self.actual, self.weight, block_size=7)
+        assert np.isclose(whole['auc'], blocks['auc'])
+        assert np.isclose(whole['average_precision'], blocks['average_precision'])
+        assert whole['thresholds'] == blocks['thresholds']
+
+    def test_downsampled(self):
+        predicted = np.random.RandomState(1).rand(100000)
+        exact = curves.exact_curves(predicted, predicted > 0.5, resolution=10)
+        assert len(exact['thresholds']) < 100
+        assert exact['thresholds'][0] == predicted.min()
+        assert exact['auc'] == 1.0 and exact['average_precision'] == 1.0
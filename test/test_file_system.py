@@ -0,0 +1,227 @@
+import io
+import shutil
+import tempfile
+import time
+import unittest
+
+import boto
+import numpy as np
+import pandas as pd
+
+from topmodel import columns
+from topmodel import file_system
+from topmodel.file_system import FileSystem, IteratorFile, LocalFileSystem, S3FileSystem
+
+try:
+    from moto import mock_s3_deprecated
+except ImportError:
+    mock_s3_deprecated = None
+
+
+def assert_string_columns_round_trip(fs):
+    df = pd.DataFrame({'id': ['a1', np.nan, 'Z\xc3\xbcrich', ''],
+                       'pred_score': [0.5, 0.25, np.nan, 1.0]})
+    fs.write_file('scores.tsv', df.to_csv(sep='\t', index=False))
+    columns.write_columns(fs, 'scores.tsv', df)
+    table_columns = columns.read_columns(fs, 'scores.tsv')
+    assert list(table_columns) == ['id', 'pred_score']
+    # Missing values stay missing, as byte strings like read_csv's
+    ids = table_columns['id']
+    assert ids.dtype == object and ids[0] == 'a1' and ids[2] == 'Z\xc3\xbcrich'
+    assert ids[3] == '' and pd.isnull(ids[1])
+    # Stored as the strings' bytes, not padded to the longest
+    assert fs.read_file('scores.columns/id.utf8') == 'a1Z\xc3\xbcrich'
+
+
+class LocalFileSystemTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir_path = tempfile.mkdtemp()
+        self.file_system = LocalFileSystem(self.tmpdir_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir_path)
+
+    def test_memory_map(self):
+        self.file_system.write_file('a/b.txt', 'hello')
+        buf = self.file_system.memory_map('a/b.txt')
+        assert buf[:] == 'hello'
+
+    def test_write_file_from_file_object(self):
+        self.file_system.write_file('a/b.txt', IteratorFile(['hel', '', 'lo']))
+        assert self.file_system.read_file('a/b.txt') == 'hello'
+
+    def test_iterator_file(self):
+        f = IteratorFile(['ab', 'cde', '', 'f'])
+        assert f.read(1) == 'a'
+        assert f.read(3) == 'bcd'
+        assert f.read() == 'ef'
+        assert f.read(2) == ''
+
+    def test_memory_map_missing_or_empty(self):
+        self.file_system.write_file('empty.txt', '')
+        assert self.file_system.memory_map('missing.txt') is None
+        assert self.file_system.memory_map('empty.txt') is None
+
+    def test_memory_map_not_supported(self):
+        assert FileSystem().memory_map('anything') is None
+
+    def test_load_array_from_memory_map(self):
+        for array in [np.arange(10, dtype=np.int16),
+                      np.linspace(0, 1, 7),
+                      np.array([True, False, True]),
+                      np.array([u'a', u'bc'])]:
+            with io.BytesIO() as f:
+                np.save(f, array)
+                self.file_system.write_file('array.npy', f.getvalue())
+            loaded = columns.load_array(self.file_system, 'array.npy')
+            assert loaded.dtype == array.dtype
+            np.testing.assert_array_equal(loaded, array)
+            # A view of the mapped file, not a copy
+            assert not loaded.flags.writeable
+
+    def test_string_columns(self):
+        assert_string_columns_round_trip(self.file_system)
+
+    def test_list_name_modified(self):
+        for path in ['a/scores.tsv', 'a/b/scores.tsv', 'a/b/metrics.json', 'c/scores.tsv',
+                     '.hidden/scores.tsv', 'a/.hidden.tsv']:
+            self.file_system.write_file(path, 'x')
+        assert sorted(self.file_system.list_name_modified()) == \
+            ['a/b/metrics.json', 'a/b/scores.tsv', 'a/scores.tsv', 'c/scores.tsv']
+        assert sorted(self.file_system.list_name_modified('a/b')) == \
+            ['a/b/metrics.json', 'a/b/scores.tsv']
+        is_scores = lambda path: path.endswith('scores.tsv')
+        assert sorted(self.file_system.list_name_modified('a', is_scores)) == \
+            ['a/b/scores.tsv', 'a/scores.tsv']
+
+    def test_list_dir(self):
+        for path in ['a/scores.tsv', 'a/b/scores.tsv', 'a/.hidden/scores.tsv']:
+            self.file_system.write_file(path, 'x')
+        assert self.file_system.list_dir('a') == (['scores.tsv'], ['b'])
+        assert self.file_system.list_dir('missing') == ([], [])
+
+    def test_list_reads_only_modified_directories(self):
+        racy_seconds = file_system.RACY_SECONDS
+        scan_dir = file_system.scan_dir
+        scanned = []
+
+        def counting_scan_dir(path):
+            scanned.append(path[len(self.tmpdir_path):].strip('/'))
+            return scan_dir(path)
+        # Listings right after a change can be reused here
+        file_system.RACY_SECONDS = -1
+        file_system.scan_dir = counting_scan_dir
+        try:
+            self.file_system.write_file('a/scores.tsv', 'x')
+            self.file_system.write_file('b/scores.tsv', 'x')
+            assert sorted(self.file_system.list()) == ['a/scores.tsv', 'b/scores.tsv']
+            assert sorted(scanned) == ['', 'a', 'b']
+
+            del scanned[:]
+            self.file_system.write_file('a/actuals.tsv', 'x')
+            # A new file system, as in another process, reads the manifest
+            listing = LocalFileSystem(self.tmpdir_path).list()
+            assert sorted(listing) == ['a/actuals.tsv', 'a/scores.tsv', 'b/scores.tsv']
+            assert scanned == ['a']
+
+            del scanned[:]
+            shutil.rmtree(self.file_system.abspath('b'))
+            assert sorted(self.file_system.list()) == ['a/actuals.tsv', 'a/scores.tsv']
+            assert scanned == ['']
+        finally:
+            file_system.RACY_SECONDS = racy_seconds
+            file_system.scan_dir = scan_dir
+
+
+@unittest.skipIf(mock_s3_deprecated is None, "needs moto")
+class S3FileSystemTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = mock_s3_deprecated()
+        self.mock.start()
+        boto.connect_s3('key', 'secret').create_bucket('bucket')
+        # moto's in-process mock isn't thread safe, so requests still go
+        # through the pool but one at a time
+        self.file_system = S3FileSystem('bucket', 'key', 'secret', subdirectory='models',
+                                        max_connections=1)
+        self.range_size = file_system.S3_RANGE_SIZE
+        file_system.S3_RANGE_SIZE = 1000
+        self.part_size = file_system.S3_PART_SIZE
+        # The smallest part size S3 allows
+        file_system.S3_PART_SIZE = 5 * 1024 * 1024
+
+    def tearDown(self):
+        file_system.S3_RANGE_SIZE = self.range_size
+        file_system.S3_PART_SIZE = self.part_size
+        self.mock.stop()
+
+    def test_read_files(self):
+        contents = {'a/large': np.random.bytes(5500),
+                    'a/exact': np.random.bytes(2000),
+                    'b/small': 'small',
+                    'b/empty': ''}
+        for path, data in contents.items():
+            self.file_system.write_file(path, data)
+        paths = sorted(contents) + ['missing']
+        assert self.file_system.read_files(paths) == dict(contents, missing=None)
+        assert self.file_system.read_file('a/large') == contents['a/large']
+        assert self.file_system.read_file('missing') is None
+
+    def test_modified(self):
+        before = time.time()
+        self.file_system.write_file('a/small', 'small')
+        assert before - 1 <= self.file_system.modified('a/small') <= time.time() + 1
+        assert self.file_system.modified('missing') is None
+
+    def test_read_files_twice(self):
+        self.file_system.write_file('a/small', 'small')
+        assert self.file_system.read_files(['a/small', 'a/small']) == {'a/small': 'small'}
+
+    def test_read_small_file_with_one_request(self):
+        self.file_system.write_file('a/small', 'small')
+        connection = self.file_system.bucket.connection
+        make_request, methods = connection.make_request, []
+
+        def counted_request(method, *args, **kwargs):
+            methods.append(method)
+            return make_request(method, *args, **kwargs)
+        connection.make_request = counted_request
+        assert self.file_system.read_file('a/small') == 'small'
+        assert methods == ['GET']
+
+    def test_list_dir(self):
+        for path in ['a/scores.tsv', 'a/b/scores.tsv', 'a/b/c/scores.tsv', 'top.tsv']:
+            self.file_system.write_file(path, 'x')
+        assert self.file_system.list_dir('') == (['top.tsv'], ['a'])
+        assert self.file_system.list_dir('a/') == (['scores.tsv'], ['b'])
+        assert self.file_system.list_dir('a/b') == (['scores.tsv'], ['c'])
+
+    def test_read_columns(self):
+        array = np.linspace(0, 1, 500)
+        with io.BytesIO() as f:
+            np.save(f, array)
+            self.file_system.write_file('array.npy', f.getvalue())
+        np.testing.assert_array_equal(
+            columns.load_array(self.file_system, 'array.npy'), array)
+
+    def test_string_columns(self):
+        assert_string_columns_round_trip(self.file_system)
+
+    def test_write_file(self):
+        large = np.random.bytes(2 * file_system.S3_PART_SIZE + 100)
+        self.file_system.write_file('small', u'notes \u2713')
+        self.file_system.write_file('large', large)
+        self.file_system.write_file('streamed', IteratorFile([large[:100], large[100:]]))
+        assert self.file_system.read_file('small') == u'notes \u2713'.encode('utf-8')
+        assert self.file_system.read_file('large') == large
+        assert self.file_system.read_file('streamed') == large
+
+    def test_failed_write_is_cancelled(self):
+        def chunks():
+            yield np.random.bytes(2 * file_system.S3_PART_SIZE)
+            raise ValueError("no more data")
+        with self.assertRaises(ValueError):
+            self.file_system.write_file('failed', IteratorFile(chunks()))
+        assert self.file_system.read_file('failed') is None
+        assert list(self.file_system.bucket.get_all_multipart_uploads()) == []
@@ -0,0 +1,135 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from topmodel import histogram
+from topmodel.model_data import THRESHOLD_BINS, TOP_THRESHOLDS
+
+
+def loop_histogram(bin_list, predicted, actual, weight):
+    # Reference implementation: one mask per bin
+    trues, totals, thresholds = [], [], []
+    for i in range(len(bin_list) - 1):
+        thresholds.append(bin_list[i + 1])
+        obs_in_bin = (predicted >= bin_list[i]) & (predicted < bin_list[i + 1])
+        true_obs_in_bin = obs_in_bin & actual
+        trues.append(np.sum(weight * true_obs_in_bin))
+        totals.append(np.sum(weight * obs_in_bin))
+    return {'thresholds': thresholds, 'trues': trues, 'totals': totals}
+
+
+class HistogramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bin_edges = histogram.uniform_bin_edges(THRESHOLD_BINS)
+        self.top_bins = histogram.top_bin_edges(TOP_THRESHOLDS)
+
+    def assert_same_histograms(self, predicted, actual, weight):
+        result = histogram.histograms(
+            [self.bin_edges, self.top_bins], predicted, actual, weight)
+        for bin_edges, hist in zip([self.bin_edges, self.top_bins], result):
+            expected = loop_histogram(bin_edges, predicted, actual, weight)
+            assert hist == expected
+
+    def test_matches_loop_on_scores_file(self):
+        df = pd.read_csv('./data/test/my_model_name/scores.tsv', sep='\t')
+        self.assert_same_histograms(
+            df['pred_score'], df['actual'], np.ones(len(df)))
+
+    def test_edges(self):
+        # Scores exactly on every edge, just below every edge, 1.0 and
+        # out of range values
+        edges = np.array(self.bin_edges + self.top_bins)
+        predicted = pd.Series(np.concatenate(
+            [edges, np.nextafter(edges, -1), [1.0, -0.5, 1.5, np.inf]]))
+        actual = pd.Series(np.arange(len(predicted)) % 3 == 0)
+        self.assert_same_histograms(predicted, actual, np.ones(len(predicted)))
+
+    def test_score_of_one_is_not_counted(self):
+        hist = histogram.histogram(self.bin_edges, [1.0, 0.5], [True, True], [1, 1])
+        assert sum(hist['totals']) == 1
+
+    def test_integer_weights(self):
+        predicted = pd.Series([0.0, 0.1, 0.5, 0.9, 0.0, 0.1, 0.5, 0.9])
+        actual = pd.Series([True] * 4 + [False] * 4)
+        weight = pd.Series([0, 10, 50, 90, 100, 90, 50, 10])
+        self.assert_same_histograms(predicted, actual, weight)
+        hist = histogram.histogram(self.bin_edges, predicted, actual, weight)
+        assert all(isinstance(t, int) for t in hist['totals'])
+
+    def sketch(self, predicted, actual, weight, chunks=1):
+        accumulator = histogram.SketchAccumulator(THRESHOLD_BINS)
+        for rows in zip(*[np.array_split(column, chunks) for column in [predicted, actual, weight]]):
+            accumulator.add(*rows)
+        return accumulator.histogram()
+
+    def test_quantile_bin_edges(self):
+        # Scores crowded into the top of the range, where uniform bins have
+        # only a few edges
+        predicted = 1 - np.random.RandomState(0).exponential(0.001, 10000)
+        sketch = self.sketch(predicted, predicted > 0.999, np.ones(10000), chunks=3)
+        bin_edges = histogram.quantile_bin_edges(sketch, THRESHOLD_BINS)
+        assert bin_edges[0] == 0.0 and bin_edges[-1] == 1.0
+        assert len(bin_edges) > THRESHOLD_BINS / 2
+        assert sum(edge > 0.99 for edge in bin_edges) > THRESHOLD_BINS / 2
+
+        # Adding up the sketch's bins is the same as binning the scores again
+        rebinned = histogram.rebin_histogram(sketch, bin_edges)
+        expected = loop_histogram(bin_edges, predicted, predicted > 0.999, np.ones(10000))
+        assert rebinned == expected
+
+    def test_quantile_bin_edges_of_a_narrow_range(self):
+        # Scores crowded into the middle of the range, in more chunks than
+        # the sketch has bins for
+        for low, high in [(0.5, 0.51), (0.3, 0.32)]:
+            predicted = np.random.RandomState(0).uniform(low, high, 50000)
+            actual = predicted > (low + high) / 2
+            sketch = self.sketch(predicted, actual, np.ones(50000, dtype=int), chunks=5)
+            assert len(sketch['totals']) <= 4 * histogram.SKETCH_BINS + THRESHOLD_BINS
+            bin_edges = histogram.quantile_bin_edges(sketch, THRESHOLD_BINS)
+            inside = [edge for edge in bin_edges if low <= edge <= high]
+            assert len(inside) > 0.9 * THRESHOLD_BINS
+            totals = histogram.rebin_histogram(sketch, bin_edges)['totals']
+            assert max(totals) < 2 * 50000 / THRESHOLD_BINS
+            rebinned = histogram.rebin_histogram(sketch, bin_edges)
+            assert rebinned == loop_histogram(bin_edges, predicted, actual, np.ones(50000))
+            # And into the uniform bins
+            uniform = histogram.rebin_histogram(
+                sketch, histogram.uniform_bin_edges(THRESHOLD_BINS))
+            assert uniform == histogram.histogram(histogram.uniform_bin_edges(THRESHOLD_BINS),
+                                                  predicted, actual, np.ones(50000, dtype=int))
+
+    def test_merge_sketches(self):
+        predicted = np.random.RandomState(0).uniform(0.2, 0.21, 20000)
+        actual = predicted > 0.205
+        weight = np.ones(20000, dtype=int)
+        parts = [self.sketch(predicted[rows], actual[rows], weight[rows])
+                 for rows in np.array_split(np.arange(20000), 4)]
+        merged = histogram.merge_sketches(parts, THRESHOLD_BINS)
+        assert sum(merged['totals']) == 20000 and sum(merged['trues']) == actual.sum()
+        bin_edges = histogram.quantile_bin_edges(merged, THRESHOLD_BINS)
+        assert sum(0.2 <= edge <= 0.21 for edge in bin_edges) > 0.9 * THRESHOLD_BINS
+        assert histogram.rebin_histogram(merged, bin_edges) == \
+            loop_histogram(bin_edges, predicted, actual, weight)
+
+    def test_quantile_bin_edges_of_one_score(self):
+        sketch = self.sketch([0.5] * 10, [True] * 10, [1] * 10)
+        bin_edges = histogram.quantile_bin_edges(sketch, THRESHOLD_BINS)
+        assert len(bin_edges) >= 3
+        assert sum(histogram.rebin_histogram(sketch, bin_edges)['totals']) == 10
+
+    def test_segment_trues_totals(self):
+        predicted = np.array([0.05, 0.5, 0.55, 0.95, 1.0, 0.5])
+        actual = np.array([True, False, True, True, True, False])
+        segment = np.array([0, 1, 1, 2, 2, 0])
+        weight = np.array([1, 2, 3, 4, 5, 6])
+        index = histogram.bin_index(predicted, self.bin_edges)
+        trues, totals = histogram.segment_trues_totals(
+            segment, 3, index, THRESHOLD_BINS, actual, weight)
+        for i in range(3):
+            expected = loop_histogram(self.bin_edges, predicted[segment == i],
+                                      actual[segment == i], weight[segment == i])
+            assert trues[i].tolist() == expected['trues']
+            assert totals[i].tolist() == expected['totals']
+
@@ -0,0 +1,99 @@
+import json
+import unittest
+
+import numpy as np
+
+from topmodel import hmetrics
+from topmodel.histogram import uniform_bin_edges
+
+
+# Reference implementations: one step per threshold
+def loop_recalls(hist):
+    ret = []
+    trues = sum(hist['trues'])
+    all_trues = trues
+    for i in range(len(hist['thresholds'])):
+        ret.append(trues * 1.0 / all_trues if all_trues != 0 else None)
+        trues -= hist['trues'][i]
+    return ret
+
+
+def loop_fprs(hist):
+    ret = []
+    falses = sum(hist['totals']) - sum(hist['trues'])
+    all_falses = falses
+    for i in range(len(hist['thresholds'])):
+        ret.append(falses * 1.0 / all_falses if all_falses != 0 else None)
+        falses -= (hist['totals'][i] - hist['trues'][i])
+    return ret
+
+
+def loop_precisions(hist):
+    ret = []
+    selected = sum(hist['totals'])
+    trues = sum(hist['trues'])
+    for i in range(len(hist['thresholds'])):
+        ret.append(trues * 1.0 / selected if selected != 0 else None)
+        trues -= hist['trues'][i]
+        selected -= hist['totals'][i]
+    return ret
+
+
+def loop_marginal_precisions(hist):
+    return map(lambda x: x[0] * 1.0 / x[1] if x[1] != 0 else None, zip(hist['trues'], hist['totals']))
+
+
+def loop_logloss(hist):
+    loss = 0.0
+    N = sum(hist['totals'])
+    for i in range(len(hist['thresholds'])):
+        t = hist['trues'][i]
+        f = hist['totals'][i] - t
+        loss += t * \
+            np.log(hist['thresholds'][i]) + f * np.log(1.0 - hist['thresholds'][i])
+    return -loss / N
+
+
+METRICS = [(hmetrics.recalls, hmetrics.recalls_array, loop_recalls),
+           (hmetrics.fprs, hmetrics.fprs_array, loop_fprs),
+           (hmetrics.precisions, hmetrics.precisions_array, loop_precisions),
+           (hmetrics.marginal_precisions, hmetrics.marginal_precisions_array,
+            loop_marginal_precisions)]
+
+
+class HMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.thresholds = uniform_bin_edges(100)[1:]
+        # Fractional weights, with empty bins at both ends
+        self.totals = random_state.rand(20, 100) * 10
+        self.totals[:, :5] = 0
+        self.totals[:, -5:] = 0
+        self.trues = self.totals * random_state.rand(20, 100)
+
+    def hists(self):
+        return [{'thresholds': self.thresholds,
+                 'trues': trues.tolist(),
+                 'totals': totals.tolist()}
+                for trues, totals in zip(self.trues, self.totals)]
+
+    def test_same_json_as_loops(self):
+        for hist in self.hists():
+            for metric, _, loop_metric in METRICS:
+                assert json.dumps(metric(hist)) == json.dumps(loop_metric(hist))
+            assert json.dumps(hmetrics.logloss(hist)) == json.dumps(loop_logloss(hist))
+
+    def test_replicate_matrix(self):
+        hists = self.hists()
+        for _, array_metric, loop_metric in METRICS:
+            values = hmetrics.to_list(array_metric(self.trues, self.totals))
+            assert json.dumps(values) == json.dumps(map(loop_metric, hists))
+        loglosses = hmetrics.logloss_array(self.thresholds, self.trues, self.totals)
+        assert json.dumps(loglosses.tolist()) == json.dumps(map(loop_logloss, hists))
+
+    def test_divide_by_zero(self):
+        hist = {'thresholds': [0.5, 1.0], 'trues': [0, 0], 'totals': [0, 0]}
+        for metric, _, loop_metric in METRICS:
+            assert metric(hist) == loop_metric(hist)
+        assert hmetrics.recalls(hist) == [None, None]
@@ -0,0 +1,79 @@
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join
+
+import pandas as pd
+
+from topmodel import columns
+from topmodel import ingest
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import (
+    BOOTSTRAP_FILE, HISTOGRAM_FILE, BenchmarkedModelData, ModelDataManager)
+
+
+class IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir_path = tempfile.mkdtemp()
+        self.inputs_path = tempfile.mkdtemp()
+        self.file_system = LocalFileSystem(self.tmpdir_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir_path)
+        shutil.rmtree(self.inputs_path)
+
+    def ingest(self, paths, **kwargs):
+        return ingest.run(self.file_system, functools.partial(LocalFileSystem, self.tmpdir_path),
+                          paths, processes=2, n_bootstrap_samples=5, **kwargs)
+
+    def assert_precomputed(self, model_data):
+        assert model_data.read_artifact(HISTOGRAM_FILE, model_data.fingerprint()) is not None
+        fingerprint = model_data.fingerprint(n_bootstrap_samples=5, seed=None)
+        assert model_data.read_artifact(BOOTSTRAP_FILE % 5, fingerprint) is not None
+
+    def test_ingests_models(self):
+        shutil.copy('./data/test/my_model_name/scores.tsv', join(self.inputs_path, 'first.tsv'))
+        os.mkdir(join(self.inputs_path, 'alt'))
+        shutil.copy('./data/test/alt_format_model/scores.tsv', join(self.inputs_path, 'alt'))
+        invalid = join(self.inputs_path, 'invalid.tsv')
+        pd.DataFrame({'pred_score': [0.5, 1.5], 'actual': [True, False]}).to_csv(
+            invalid, sep='\t', index=False)
+
+        failed = self.ingest([join(self.inputs_path, 'first.tsv'),
+                              join(self.inputs_path, 'alt', 'scores.tsv'), invalid],
+                             directory='models')
+        assert failed == ['models/invalid']
+        manager = ModelDataManager(self.file_system)
+        assert sorted(manager.models) == ['models/alt', 'models/first']
+        for model_data in manager.models.values():
+            self.assert_precomputed(model_data)
+            assert columns.read_columns(self.file_system, model_data.scores_path()) is not None
+
+    def test_ingests_benchmarked_models(self):
+        actuals = join(self.inputs_path, 'actuals.tsv')
+        pd.DataFrame({'id': [1, 2, 3, 3], 'actual': [True, False, False, True]}).to_csv(
+            actuals, sep='\t', index=False)
+        scores = join(self.inputs_path, 'model.tsv')
+        pd.DataFrame({'id': [3, 1, 2, 1], 'pred_score': [0.9, 0.1, 0.2, 0.3]}).to_csv(
+            scores, sep='\t', index=False)
+
+        assert self.ingest([scores], directory='benchmarked', actuals=actuals) == []
+        model_data = ModelDataManager(self.file_system).get_model('benchmarked/model')
+        assert isinstance(model_data, BenchmarkedModelData)
+        self.assert_precomputed(model_data)
+        # The last of the repeated ids are kept
+        df = model_data.to_data_frame().sort_index()
+        assert df['pred_score'].tolist() == [0.3, 0.2, 0.9]
+        assert df['actual'].tolist() == [True, False, True]
+
+    def test_validate(self):
+        with self.assertRaises(ValueError):
+            ingest.validate(pd.DataFrame({'pred_score': [0.5]}))
+        with self.assertRaises(ValueError):
+            ingest.validate(pd.DataFrame({'pred_score': [0.5], 'actual': [2]}))
+        with self.assertRaises(ValueError):
+            ingest.validate(pd.DataFrame({'score': [0.5], 'trues': [-1], 'falses': [1]}))
+        ingest.validate(pd.DataFrame({'pred_score': [0.5], 'id': [1]}), benchmarked=True)
@@ -1,10 +1,32 @@
+import calendar
+import contextlib
+import json
+import os
 import shutil
 import tempfile
+import threading
 import unittest
 from os.path import join
 
-from topmodel.model_data import ModelData
+import numpy as np
+import pandas as pd
+
+from topmodel.model_data import (
+    ADAPTIVE_BINNING, BenchmarkedModelData, ModelData, ModelDataManager, PartitionedModelData,
+    THRESHOLD_BINS, upload_window)
+from topmodel.cache import LRUCache, sizeof
 from topmodel.file_system import LocalFileSystem
+from topmodel import histogram
+
+
+@contextlib.contextmanager
+def mock_max_segments(max_segments):
+    original = histogram.MAX_SEGMENTS
+    histogram.MAX_SEGMENTS = max_segments
+    try:
+        yield
+    finally:
+        histogram.MAX_SEGMENTS = original
 
 
 class ModelDataTest(unittest.TestCase):
@@ -36,3 +58,595 @@ class ModelDataTest(unittest.TestCase):
         model_data.set_notes(note)
         print model_data.get_notes()
         assert model_data.get_notes() == note
+
+    def assert_same_bootstrap_bands(self, model_data, n_samples=300, rows_model_data=None):
+        # Percentile bands of the cumulative counts (which the curves are
+        # built from) from resampling the histogram should match the ones
+        # from resampling the data frame rows (of rows_model_data, if the
+        # model's rows aren't observations), to within sampling noise.
+        np.random.seed(0)
+        row_resampled = [(rows_model_data or model_data).to_histogram_format(resample=True)
+                         for _ in xrange(n_samples)]
+        row_totals = np.array([hist['totals'] for hist in row_resampled])
+        row_trues = np.array([hist['trues'] for hist in row_resampled])
+        trues, totals = model_data.to_bootstrap_histograms(n_samples, seed=0)
+        assert trues.shape == totals.shape == (n_samples, THRESHOLD_BINS)
+
+        for expected, actual in [(row_totals, totals), (row_trues, trues)]:
+            expected = expected.cumsum(axis=1)[:, :-1]
+            actual = actual.cumsum(axis=1)[:, :-1]
+            varies = expected.std(axis=0) > 0
+            expected, actual = expected[:, varies], actual[:, varies]
+            std = expected.std(axis=0)
+            for q in [5, 50, 95]:
+                diff = np.percentile(expected, q, axis=0) - np.percentile(actual, q, axis=0)
+                assert (np.abs(diff) < 0.5 * std + 1).all()
+            assert (np.abs(expected.mean(axis=0) - actual.mean(axis=0)) < 0.35 * std).all()
+            assert (np.abs(actual.std(axis=0) / std - 1) < 0.25).all()
+
+    def test_bootstrap_matches_row_resampling(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        self.assert_same_bootstrap_bands(model_data)
+
+    def test_weighted_bootstrap_matches_row_resampling(self):
+        random_state = np.random.RandomState(1)
+        scores = random_state.rand(1000)
+        df = pd.DataFrame({'pred_score': scores,
+                           'actual': random_state.rand(1000) < scores,
+                           'weight': random_state.randint(1, 5, 1000)})
+        model_data = ModelData(self.file_system, 'weighted_model')
+        model_data.save_data_frame(df)
+        self.assert_same_bootstrap_bands(model_data)
+
+    def test_aggregated_scores(self):
+        # The same observations, one per row and counted by score
+        random_state = np.random.RandomState(0)
+        scores = (np.floor(random_state.rand(5000) * 100) + 0.5) / 100
+        rows = pd.DataFrame({'pred_score': scores, 'actual': random_state.rand(5000) < scores})
+        aggregated = pd.DataFrame({
+            'trues': rows.groupby('pred_score')['actual'].sum().astype(int),
+            'falses': (~rows['actual']).groupby(rows['pred_score']).sum().astype(int)})
+        aggregated = aggregated.rename_axis('score').reset_index()
+        rows_model_data = ModelData(self.file_system, 'rows')
+        rows_model_data.save_data_frame(rows)
+        model_data = ModelData(self.file_system, 'aggregated')
+        model_data.save_data_frame(aggregated[['score', 'trues', 'falses']])
+        model_data.unload()
+
+        # Kept aggregated, rather than as a row per score and actual
+        assert len(model_data.to_data_frame()) == len(aggregated)
+        hist, rows_hist = model_data.to_histogram_format(), rows_model_data.to_histogram_format()
+        assert hist['trues'] == rows_hist['trues'] and hist['totals'] == rows_hist['totals']
+        assert hist['high_end_hist'] == rows_hist['high_end_hist']
+        # Bootstrapped observation by observation
+        model_data.unload()
+        self.assert_same_bootstrap_bands(model_data, rows_model_data=rows_model_data)
+        trues, totals = model_data.to_bootstrap_histograms(3, seed=0)
+        assert (totals.sum(axis=1) == 5000).all()
+        assert model_data.get_exact_curves()['auc'] == \
+            rows_model_data.get_exact_curves()['auc']
+
+    def test_save_data_frame_in_chunks(self):
+        df = pd.DataFrame({'pred_score': np.linspace(0, 1, 11),
+                           'actual': np.arange(11) % 2 == 0})
+        model_data = ModelData(self.file_system, 'chunked_model', chunk_size=3)
+        model_data.save_data_frame(df)
+        assert self.file_system.read_file('chunked_model/scores.tsv') == \
+            df.to_csv(sep='\t', index=False)
+
+    def test_bootstrap_is_reproducible(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        first = json.dumps(model_data.to_bootstrap_format(5, seed=42))
+        self.file_system.remove('my_other_model_name/bootstrap-5.json')
+        assert json.dumps(model_data.to_bootstrap_format(5, seed=42)) == first
+
+    def test_histogram_recomputed_when_scores_change(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        ModelData(self.file_system, 'my_other_model_name').to_histogram_format()
+        cached = json.loads(self.file_system.read_file('my_other_model_name/histogram.json'))
+        assert sum(cached['totals']) == 1000
+
+        df = pd.DataFrame({'actual': [True, False], 'pred_score': [0.5, 0.25]})
+        with open(join(self.tmpdir_path, 'my_other_model_name', 'scores.tsv'), 'w') as f:
+            df.to_csv(f, sep='\t', index=False)
+        hist = ModelData(self.file_system, 'my_other_model_name').to_histogram_format()
+        assert sum(hist['totals']) == 2
+
+    def test_artifacts_reused_when_unchanged(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        ModelData(self.file_system, 'my_other_model_name').get_metrics(3)
+        # Without a data frame, only the cached artifacts can be used
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        model_data.to_data_frame = None
+        assert len(model_data.get_metrics(3)) == 4
+        assert model_data.read_artifact('bootstrap-3.json', model_data.fingerprint()) is None
+
+    def test_exact_curves_are_cached(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        exact = ModelData(self.file_system, 'my_other_model_name').get_exact_curves()
+        assert 0 <= exact['auc'] <= 1
+        # Without a data frame, only the cached curves can be used
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        model_data.iter_chunks = None
+        assert model_data.get_exact_curves() == exact
+
+    def test_segment_histograms(self):
+        df = pd.DataFrame({'actual': np.arange(300) % 3 == 0,
+                           'pred_score': np.linspace(0, 1, 300, endpoint=False),
+                           'country': np.array(['US', 'GB', 'FR'])[np.arange(300) % 7 % 3],
+                           'user': np.arange(300)})
+        self.file_system.write_file('segmented/scores.tsv', df.to_csv(sep='\t', index=False))
+        model_data = ModelData(self.file_system, 'segmented', chunk_size=70)
+        with mock_max_segments(100):
+            segments = model_data.get_segment_histograms()
+        assert segments['skipped'] == ['user']
+        [country] = segments['columns']
+        bin_edges = [0.0] + segments['thresholds']
+        for i, segment in enumerate(country['segments']):
+            rows = df[df['country'] == segment]
+            expected = histogram.histogram(bin_edges, rows['pred_score'], rows['actual'],
+                                           np.ones(len(rows)))
+            assert country['trues'][i] == expected['trues']
+            assert country['totals'][i] == expected['totals']
+
+        metrics = model_data.get_segment_metrics('country')
+        assert [segment for segment, _ in metrics] == ['US', 'GB', 'FR']
+        assert all(0 <= segment_metrics['auc'] <= 1 for _, segment_metrics in metrics)
+        # Cached next to the histogram
+        model_data = ModelData(self.file_system, 'segmented')
+        model_data.iter_chunks = None
+        with mock_max_segments(100):
+            assert model_data.get_segment_histograms() == json.loads(json.dumps(segments))
+
+    def test_non_ascii_segments(self):
+        df = pd.DataFrame({'actual': [True, False, True],
+                           'pred_score': [0.2, 0.4, 0.6],
+                           'city': ['Z\xc3\xbcrich', 'Z\xc3\xbcrich', 'Paris']})
+        self.file_system.write_file('cities/scores.tsv', df.to_csv(sep='\t', index=False))
+        model_data = ModelData(self.file_system, 'cities')
+        [city] = model_data.get_segment_histograms()['columns']
+        assert city['segments'] == [u'Z\xfcrich', u'Paris']
+        assert [segment for segment, _ in model_data.get_segment_metrics('city')] == \
+            [u'Z\xfcrich', u'Paris']
+
+    def test_scores_read_once_for_histogram_and_bootstrap(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        # Adaptive bins are only known after the histogram's pass
+        for binning, passes in [(None, 1), (ADAPTIVE_BINNING, 2)]:
+            kwargs = {'binning': binning} if binning else {}
+            model_data = ModelData(self.file_system, 'my_other_model_name', chunk_size=70,
+                                   **kwargs)
+            model_data.unload()
+            iterated = []
+            iter_chunks = model_data.iter_chunks
+            model_data.iter_chunks = lambda **kwargs: iterated.append(1) or iter_chunks(**kwargs)
+            model_data.to_histogram_format()
+            trues, totals = model_data.to_bootstrap_histograms(5, seed=0)
+            assert len(iterated) == passes
+            # Only the counts of the (bin, actual) cells were kept
+            df = model_data.to_data_frame()
+            assert model_data.binned_rows.counts.sum() == len(df)
+            # and they resample like the rows
+            expected_trues, expected_totals = histogram.bootstrap_trues_totals(
+                histogram.bin_index(df['pred_score'], model_data.bin_edges()), THRESHOLD_BINS,
+                df['actual'], np.ones(len(df)), 5, seed=0)
+            assert (trues == expected_trues).all() and (totals == expected_totals).all()
+
+    def test_rows_that_weigh_differently_are_binned_apart(self):
+        df = pd.DataFrame({'pred_score': np.linspace(0, 1, 300, endpoint=False),
+                           'actual': np.arange(300) % 3 == 0,
+                           'weight': np.arange(300) % 2 + 1.0})
+        model_data = ModelData(self.file_system, 'weighted', chunk_size=70)
+        model_data.save_data_frame(df)
+        model_data.unload()
+        model_data.to_histogram_format()
+        # Not kept from the histogram's pass
+        assert model_data.binned_rows is None
+        trues, totals = model_data.to_bootstrap_histograms(5, seed=0)
+        index, actual, weight = model_data.binned_rows
+        assert (weight == df['weight'].values).all()
+        assert np.allclose(totals.sum(axis=1).mean(), df['weight'].sum(), rtol=0.1)
+
+    def test_streamed_histogram(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name', chunk_size=70)
+        hist = model_data.to_histogram_format()
+        # The scores were never parsed all at once
+        assert model_data.data_frame is None
+
+        df = model_data.to_data_frame()
+        expected = histogram.histogram(histogram.uniform_bin_edges(THRESHOLD_BINS),
+                                       df['pred_score'], df['actual'], np.ones(len(df)))
+        assert hist['trues'] == expected['trues']
+        assert hist['totals'] == expected['totals']
+
+    def test_columns(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        expected = model_data.to_data_frame()
+        model_data.save_columns()
+
+        # Only the columns are left to read from
+        self.file_system.remove('my_other_model_name/scores.tsv')
+        df = ModelData(self.file_system, 'my_other_model_name').to_data_frame()
+        assert list(df.columns) == list(expected.columns)
+        assert df.equals(expected)
+
+    def test_columns_are_histogrammed_without_copies(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        expected = ModelData(self.file_system, 'my_other_model_name')
+        expected_hist = expected.compute_histogram()
+        expected.save_columns()
+        # A missing score, which is dropped from the views too
+        df = expected.to_data_frame().copy()
+        df.loc[0, 'pred_score'] = np.nan
+        expected.save_data_frame(df)
+        expected.save_columns()
+
+        model_data = ModelData(self.file_system, 'my_other_model_name', chunk_size=70)
+        chunks = list(model_data.iter_chunks(views=True))
+        assert sum(len(chunk) for chunk in chunks) == len(df) - 1
+        # Read-only views of the mapped file (but for the rows of the first
+        # chunk, which had a missing score)
+        assert not chunks[1]['pred_score'].values.flags.writeable
+        assert not chunks[1]['actual'].values.flags.writeable
+        hist = model_data.compute_histogram()
+        assert sum(hist['totals']) == sum(expected_hist['totals']) - 1
+        trues, totals = model_data.to_bootstrap_histograms(3, seed=0)
+        assert (totals.sum(axis=1) == len(df) - 1).all()
+
+    def test_stale_columns_are_ignored(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        ModelData(self.file_system, 'my_other_model_name').save_columns()
+        with open(join(self.tmpdir_path, 'my_other_model_name', 'scores.tsv'), 'w') as f:
+            f.write('actual\tpred_score\nTrue\t0.5\n')
+        df = ModelData(self.file_system, 'my_other_model_name').to_data_frame()
+        assert len(df) == 1
+
+    def test_benchmarked_columns(self):
+        shutil.copytree('./data/titanic', join(self.tmpdir_path, 'titanic'))
+        model_data = BenchmarkedModelData(self.file_system, 'titanic/good_model')
+        expected = model_data.to_data_frame()
+        model_data.save_columns()
+        self.file_system.remove('titanic/actuals.tsv')
+        self.file_system.remove('titanic/good_model/scores_bm.tsv')
+        df = BenchmarkedModelData(self.file_system, 'titanic/good_model').to_data_frame()
+        assert df.equals(expected)
+
+    def test_benchmarked_scores_in_any_order(self):
+        shutil.copytree('./data/titanic', join(self.tmpdir_path, 'titanic'))
+        expected = BenchmarkedModelData(self.file_system, 'titanic/good_model').to_data_frame()
+        scores_path = join(self.tmpdir_path, 'titanic/good_model/scores_bm.tsv')
+        with open(scores_path) as f:
+            lines = f.read().splitlines()
+        with open(scores_path, 'w') as f:
+            f.write('\n'.join(lines[:1] + lines[:0:-1]) + '\n')
+        df = BenchmarkedModelData(self.file_system, 'titanic/good_model').to_data_frame()
+        assert df.sort_index().equals(expected.sort_index())
+
+    def test_benchmarked_ids_must_match(self):
+        shutil.copytree('./data/titanic', join(self.tmpdir_path, 'titanic'))
+        scores_path = join(self.tmpdir_path, 'titanic/good_model/scores_bm.tsv')
+        scores = pd.read_csv(scores_path, sep='\t')
+        # An id without an actual
+        shifted = scores.copy()
+        shifted['id'] = shifted['id'] + 1
+        shifted.to_csv(scores_path, sep='\t', index=False)
+        with self.assertRaises(AssertionError):
+            BenchmarkedModelData(self.file_system, 'titanic/good_model').to_data_frame()
+        # An actual without a score
+        scores.iloc[:-1].to_csv(scores_path, sep='\t', index=False)
+        with self.assertRaises(AssertionError):
+            BenchmarkedModelData(self.file_system, 'titanic/good_model').to_data_frame()
+
+    def save_parts(self, model_path, df, n_parts):
+        for i, part in enumerate(np.array_split(df, n_parts)):
+            self.file_system.write_file(
+                '%s/scores/part-%05d.tsv' % (model_path, i), part.to_csv(sep='\t', index=False))
+
+    def test_partitioned_histogram(self):
+        df = ModelData(LocalFileSystem('./data/test'), 'my_other_model_name').to_data_frame()
+        expected = ModelData(LocalFileSystem('./data/test'), 'my_other_model_name').compute_histogram()
+        self.save_parts('partitioned', df, 3)
+        for processes in [1, 2]:
+            model_data = PartitionedModelData(self.file_system, 'partitioned', processes=processes)
+            assert model_data.compute_histogram() == expected
+            for i in range(3):
+                self.file_system.remove('partitioned/scores/part-%05d.histogram.json' % i)
+        assert len(model_data.to_data_frame()) == len(df)
+
+    def test_adaptive_binning(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name', binning=ADAPTIVE_BINNING)
+        hist = model_data.to_histogram_format()
+        df = model_data.to_data_frame()
+        bin_edges = [0.0] + hist['thresholds']
+        assert hist == dict(histogram.histogram(bin_edges, df['pred_score'], df['actual'],
+                                                np.ones(len(df))),
+                            high_end_hist=hist['high_end_hist'])
+        metrics = model_data.get_metrics(3, seed=42)
+        assert all(sample['thresholds'] == hist['thresholds'] for sample in metrics)
+
+        # The bins are kept with the histogram, apart from uniformly binned ones
+        cached = ModelData(self.file_system, 'my_other_model_name', binning=ADAPTIVE_BINNING)
+        cached.iter_chunks = None
+        assert cached.to_histogram_format() == hist
+        uniform = ModelData(self.file_system, 'my_other_model_name').to_histogram_format()
+        assert uniform['thresholds'] == histogram.uniform_bin_edges(THRESHOLD_BINS)[1:]
+
+    def test_partitioned_adaptive_binning(self):
+        df = ModelData(LocalFileSystem('./data/test'), 'my_other_model_name').to_data_frame()
+        expected = ModelData(LocalFileSystem('./data/test'), 'my_other_model_name',
+                             binning=ADAPTIVE_BINNING).compute_histogram()
+        self.save_parts('partitioned', df, 3)
+        model_data = PartitionedModelData(self.file_system, 'partitioned', processes=1,
+                                          binning=ADAPTIVE_BINNING)
+        assert model_data.compute_histogram() == expected
+
+    def test_drift_of_daily_parts(self):
+        df = ModelData(LocalFileSystem('./data/test'), 'my_other_model_name').to_data_frame()
+        days = ['2017-01-0%d' % day for day in range(1, 5)]
+        for day, part in zip(days, np.array_split(df, 4)):
+            self.file_system.write_file('daily/scores/part-%s.tsv' % day,
+                                        part.to_csv(sep='\t', index=False))
+        model_data = PartitionedModelData(self.file_system, 'daily', processes=1)
+        drift = model_data.get_drift(n_windows=2)
+        assert [point['window'] for point in drift] == days
+        assert [point['first_window'] for point in drift] == days[:1] + days[:3]
+
+        parts = np.array_split(df, 4)
+        for i, point in enumerate(drift):
+            rows = pd.concat(parts[max(i - 1, 0):i + 1])
+            assert point['count'] == len(rows)
+            assert point['trues'] == rows['actual'].sum()
+            at_half = rows[rows['pred_score'] >= 0.5]
+            assert np.isclose(point['precisions'][0], at_half['actual'].mean())
+            assert 0 <= point['auc'] <= 1
+
+    def test_drift_of_uploads(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        # An earlier upload of the model, of only 2 rows
+        earlier = model_data.histogram_of_chunks(
+            [pd.DataFrame({'actual': [True, False], 'pred_score': [0.5, 0.25]})])
+        model_data.write_window_histogram('2000-01-01', earlier)
+        # Uploaded on 2017-03-04, and first looked at later
+        uploaded = calendar.timegm((2017, 3, 4, 12, 0, 0))
+        os.utime(join(self.tmpdir_path, 'my_other_model_name', 'scores.tsv'),
+                 (uploaded, uploaded))
+        assert upload_window(uploaded) == '2017-03-04'
+        drift = model_data.get_drift(n_windows=1)
+        assert [point['count'] for point in drift] == [2, 1000]
+        assert [point['window'] for point in drift] == ['2000-01-01', '2017-03-04']
+
+    def test_drift_keeps_every_upload_of_a_day(self):
+        scores_path = join(self.tmpdir_path, 'my_other_model_name', 'scores.tsv')
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        for hour in [9, 17]:
+            uploaded = calendar.timegm((2017, 3, 4, hour, 0, 0))
+            os.utime(scores_path, (uploaded, uploaded))
+            ModelData(self.file_system, 'my_other_model_name').compute_histogram()
+            # Uploaded again
+            df = pd.DataFrame({'actual': [True, False], 'pred_score': [0.5, 0.25]})
+            df.to_csv(scores_path, sep='\t', index=False)
+
+        drift = ModelData(self.file_system, 'my_other_model_name').get_drift()
+        assert [point['window'] for point in drift] == ['2017-03-04', upload_window()]
+        assert [point['count'] for point in drift] == [1002, 1004]
+
+    def test_drift_counts_an_upload_once(self):
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        # A window written with an older artifact format
+        earlier = model_data.histogram_of_chunks(
+            [pd.DataFrame({'actual': [True, False], 'pred_score': [0.5, 0.25]})])
+        fingerprint = dict(model_data.window_fingerprint(), format_version=0)
+        self.file_system.write_file(
+            'my_other_model_name/history/2000-01-01.histogram.json',
+            json.dumps(dict(earlier, fingerprint=fingerprint)))
+        model_data.compute_histogram()
+        # Histogrammed again, eg. after it was converted to columns
+        model_data.save_columns()
+        ModelData(self.file_system, 'my_other_model_name').compute_histogram()
+
+        drift = ModelData(self.file_system, 'my_other_model_name').get_drift(n_windows=2)
+        assert [point['count'] for point in drift] == [2, 1002]
+
+    def test_partitioned_only_recomputes_changed_parts(self):
+        df = ModelData(LocalFileSystem('./data/test'), 'my_other_model_name').to_data_frame()
+        self.save_parts('partitioned', df, 3)
+        PartitionedModelData(self.file_system, 'partitioned').to_histogram_format()
+        self.save_parts('partitioned', df.iloc[:10], 1)
+
+        model_data = PartitionedModelData(self.file_system, 'partitioned')
+        computed = []
+        compute_part_histogram = model_data.compute_part_histogram
+        model_data.compute_part_histogram = lambda path: computed.append(path) or \
+            compute_part_histogram(path)
+        hist = model_data.to_histogram_format()
+        assert computed == ['partitioned/scores/part-00000.tsv']
+        assert sum(hist['totals']) == 10 + sum(len(part) for part in np.array_split(df, 3)[1:])
+
+
+class ModelDataManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir_path = tempfile.mkdtemp()
+        self.file_system = LocalFileSystem(self.tmpdir_path)
+        for model_name in ['my_model_name', 'my_other_model_name']:
+            shutil.copytree('./data/test/' + model_name,
+                            join(self.tmpdir_path, model_name))
+        shutil.copytree('./data/titanic', join(self.tmpdir_path, 'titanic'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir_path)
+
+    def test_finds_models(self):
+        manager = ModelDataManager(self.file_system)
+        assert sorted(manager.models.keys()) == [
+            'my_model_name', 'my_other_model_name',
+            'titanic/good_model', 'titanic/random_model']
+
+    def test_finds_converted_models(self):
+        ModelData(self.file_system, 'my_other_model_name').save_columns()
+        self.file_system.remove('my_other_model_name/scores.tsv')
+        manager = ModelDataManager(self.file_system)
+        assert 'my_other_model_name' in manager.models
+
+    def test_finds_partitioned_models(self):
+        df = pd.DataFrame({'pred_score': [0.1, 0.9], 'actual': [False, True]})
+        for model_path in ['partitioned', 'my_other_model_name']:
+            self.file_system.write_file(model_path + '/scores/part-00000.tsv',
+                                        df.to_csv(sep='\t', index=False))
+        manager = ModelDataManager(self.file_system)
+        assert isinstance(manager.get_model('partitioned'), PartitionedModelData)
+        # scores.tsv wins over parts
+        assert type(manager.get_model('my_other_model_name')) is ModelData
+
+    def test_refresh_keeps_unchanged_models(self):
+        manager = ModelDataManager(self.file_system)
+        model_data = manager.get_model('my_other_model_name')
+        model_data.to_data_frame()
+        manager.refresh()
+        assert manager.get_model('my_other_model_name') is model_data
+        assert model_data.data_frame is not None
+
+    def test_refresh_picks_up_changes(self):
+        manager = ModelDataManager(self.file_system)
+        model_data = manager.get_model('my_other_model_name')
+        manager.versions['my_other_model_name'] = 'an older upload'
+        self.file_system.remove('my_model_name')
+        manager.refresh()
+        assert manager.get_model('my_other_model_name') is not model_data
+        assert 'my_model_name' not in manager.models
+
+    def test_stale_catalog_is_listed_once(self):
+        manager = ModelDataManager(self.file_system, ttl=60)
+        manager.last_refresh -= 60
+        listing, done = threading.Event(), threading.Event()
+        refreshes = []
+
+        def refresh(directory=''):
+            refreshes.append(directory)
+            listing.set()
+            done.wait(10)
+        manager.refresh = refresh
+        thread = threading.Thread(target=manager.refresh_if_stale)
+        thread.start()
+        assert listing.wait(10)
+        # Others use the catalog there is while it's listed
+        manager.refresh_if_stale()
+        assert refreshes == ['']
+        done.set()
+        thread.join()
+
+    def test_browse_and_search(self):
+        manager = ModelDataManager(self.file_system)
+        assert manager.browse('') == (False, [
+            ('my_model_name', True, 0), ('my_other_model_name', True, 0), ('titanic', False, 2)])
+        assert manager.browse('titanic/good_model') == (True, [])
+        assert manager.search('MODEL', 'titanic') == ['titanic/good_model', 'titanic/random_model']
+
+    def test_lazy_discovery(self):
+        manager = ModelDataManager(self.file_system, lazy=True)
+        assert manager.models == {}
+        is_model, entries = manager.browse('')
+        assert not is_model
+        assert entries == [('my_model_name', None, None), ('my_other_model_name', None, None),
+                           ('titanic', None, None)]
+        # Only the model browsed to (and the actuals it shares) is listed
+        assert manager.browse('titanic/good_model') == (True, [])
+        assert manager.models.keys() == ['titanic/good_model']
+        assert isinstance(manager.models['titanic/good_model'], BenchmarkedModelData)
+        assert manager.versions['titanic/good_model'][1] is not None
+        assert manager.get_model('my_model_name').model_path == 'my_model_name'
+        assert manager.search('random') == ['titanic/random_model']
+
+    def test_refresh_of_a_directory(self):
+        manager = ModelDataManager(self.file_system)
+        self.file_system.remove('titanic/random_model')
+        self.file_system.remove('my_model_name')
+        manager.refresh('titanic')
+        assert 'titanic/random_model' not in manager.models
+        # Models outside the directory aren't forgotten until it's listed
+        assert 'my_model_name' in manager.models
+        manager.refresh()
+        assert 'my_model_name' not in manager.models
+
+    def test_refresh_removed(self):
+        manager = ModelDataManager(self.file_system)
+        listed = []
+        list_name_modified = self.file_system.list_name_modified
+        self.file_system.list_name_modified = lambda path, *args: \
+            listed.append(path) or list_name_modified(path, *args)
+        self.file_system.remove('titanic/random_model')
+        manager.refresh_removed('titanic/random_model')
+        self.file_system.remove('my_model_name/scores.tsv')
+        manager.refresh_removed('my_model_name/scores.tsv')
+        assert listed == ['titanic/random_model/', 'my_model_name/']
+        assert 'titanic/random_model' not in manager.models
+        assert 'my_model_name' not in manager.models
+        assert 'titanic/good_model' in manager.models
+
+    def test_shared_cache_is_bounded(self):
+        # Room for either data frame, but not both
+        sizes = [sizeof(ModelData(self.file_system, 'my_other_model_name').to_data_frame()),
+                 sizeof(BenchmarkedModelData(self.file_system, 'titanic/good_model').to_data_frame())]
+        cache = LRUCache(max_bytes=max(sizes) + 100)
+        manager = ModelDataManager(self.file_system, cache=cache)
+        first = manager.get_model('my_other_model_name')
+        first.to_data_frame()
+        assert first.data_frame is not None
+        manager.get_model('titanic/good_model').to_data_frame()
+        assert first.data_frame is None
+        assert cache.size <= cache.max_bytes
+        assert cache.stats()['evictions'] > 0
+
+    def test_benchmarked_models_share_actuals(self):
+        manager = ModelDataManager(self.file_system)
+        good = manager.get_model('titanic/good_model')
+        random = manager.get_model('titanic/random_model')
+        good.to_data_frame()
+        # Only the scores are read for the second model
+        self.file_system.remove('titanic/actuals.tsv')
+        assert len(random.to_data_frame()) == len(good.to_data_frame())
+        assert random.indexed_actuals() is good.indexed_actuals()
+
+    def test_prefetch(self):
+        model_paths = ['my_other_model_name', 'titanic/good_model']
+        expected = [ModelDataManager(self.file_system).get_model(model_path).get_metrics(10)
+                    for model_path in model_paths]
+        manager = ModelDataManager(self.file_system)
+        manager.prefetch(model_paths + ['titanic/random_model'], n_bootstrap_samples=10)
+        for model_path, metrics in zip(model_paths, expected):
+            model_data = manager.get_model(model_path)
+            assert model_data.histogram is not None
+            assert json.dumps(model_data.get_metrics(10), sort_keys=True) == \
+                json.dumps(metrics, sort_keys=True)
+            assert model_data.data_frame is None
+        # Nothing to prefetch for a model that hasn't been computed yet
+        assert manager.get_model('titanic/random_model').histogram is None
+
+    def test_new_upload_is_not_served_from_cache(self):
+        cache = LRUCache()
+        old = ModelData(self.file_system, 'my_other_model_name', cache=cache, modified='old')
+        old.to_data_frame()
+        new = ModelData(self.file_system, 'my_other_model_name', cache=cache, modified='new')
+        assert new.data_frame is None
+        assert old.data_frame is not None
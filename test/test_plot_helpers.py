@@ -0,0 +1,27 @@
+import unittest
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # Must be called before importing pyplot
+import matplotlib.pyplot as plt
+
+from topmodel import plot_helpers
+
+
+class PlotHelpersTest(unittest.TestCase):
+
+    def test_score_histogram_bars_fill_uneven_bins(self):
+        # Adaptive bins, narrow where the scores are
+        thresholds = [0.5, 0.9, 0.95, 1.0]
+        for plot in [plot_helpers.plot_scores_histogram_log,
+                     plot_helpers.plot_absolute_score_histogram]:
+            _, ax = plt.subplots()
+            patches = ax.patches
+            plot(thresholds, [4, 3, 2, 1], 'Score', true_counts=[1, 1, 1, 1], ax=ax)
+            falses, trues = patches[:4], patches[4:]
+            # The bars of each bin side by side, from its lower edge to its upper edge
+            np.testing.assert_allclose([bar.get_x() for bar in trues], [0.0, 0.5, 0.9, 0.95])
+            np.testing.assert_allclose([bar.get_x() + 2 * bar.get_width() for bar in trues],
+                                       thresholds)
+            np.testing.assert_allclose([bar.get_x() for bar in falses],
+                                       [0.25, 0.7, 0.925, 0.975])
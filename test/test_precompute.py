@@ -0,0 +1,114 @@
+import functools
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+import unittest
+from os.path import join
+
+from topmodel import precompute
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import (
+    ADAPTIVE_BINNING, BOOTSTRAP_FILE, HISTOGRAM_FILE, BenchmarkedModelData, ModelData,
+    ModelDataManager)
+
+
+class PrecomputeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir_path = tempfile.mkdtemp()
+        self.file_system = LocalFileSystem(self.tmpdir_path)
+        shutil.copytree('./data/test/my_other_model_name',
+                        join(self.tmpdir_path, 'my_other_model_name'))
+        shutil.copytree('./data/titanic', join(self.tmpdir_path, 'titanic'))
+        self.pool = multiprocessing.Pool(
+            2, precompute.init_worker, (functools.partial(LocalFileSystem, self.tmpdir_path),))
+        self.precomputer = precompute.Precomputer(
+            ModelDataManager(self.file_system), self.pool, n_bootstrap_samples=5)
+
+    def tearDown(self):
+        self.pool.terminate()
+        self.pool.join()
+        shutil.rmtree(self.tmpdir_path)
+
+    def poll_until_done(self):
+        self.precomputer.poll()
+        while self.precomputer.pending:
+            time.sleep(0.1)
+            self.precomputer.poll()
+
+    def assert_precomputed(self, model_data):
+        assert model_data.read_artifact(HISTOGRAM_FILE, model_data.fingerprint()) is not None
+        fingerprint = model_data.fingerprint(n_bootstrap_samples=5, seed=None)
+        assert model_data.read_artifact(BOOTSTRAP_FILE % 5, fingerprint) is not None
+
+    def test_precomputes_new_and_changed_models(self):
+        self.poll_until_done()
+        manager = self.precomputer.manager
+        assert sorted(self.precomputer.done) == sorted(manager.models)
+        for model_data in manager.models.values():
+            self.assert_precomputed(model_data)
+
+        # Nothing to do until a model changes
+        self.precomputer.poll()
+        assert self.precomputer.pending == {}
+        self.precomputer.done['my_other_model_name'] = 'an older upload'
+        self.precomputer.poll()
+        assert self.precomputer.pending.keys() == ['my_other_model_name']
+
+    def test_failed_model_is_skipped(self):
+        self.file_system.write_file('broken_model/scores.tsv', 'not\ta model\n')
+        self.poll_until_done()
+        assert 'broken_model' in self.precomputer.done
+        self.assert_precomputed(self.precomputer.manager.get_model('my_other_model_name'))
+
+    def test_run_once(self):
+        precompute.run(self.file_system, functools.partial(LocalFileSystem, self.tmpdir_path),
+                       processes=1, n_bootstrap_samples=5, once=True)
+        self.assert_precomputed(ModelData(self.file_system, 'my_other_model_name'))
+
+    def test_run_once_with_adaptive_binning(self):
+        precompute.run(self.file_system, functools.partial(LocalFileSystem, self.tmpdir_path),
+                       processes=1, n_bootstrap_samples=5, once=True, binning=ADAPTIVE_BINNING)
+        self.assert_precomputed(
+            ModelData(self.file_system, 'my_other_model_name', binning=ADAPTIVE_BINNING))
+
+    def test_metrics_computer(self):
+        manager = self.precomputer.manager
+        metrics_computer = precompute.MetricsComputer(manager, self.pool)
+        model_paths = ['my_other_model_name', 'titanic/good_model']
+        done, computing = metrics_computer.get_metrics(model_paths, 0, timeout=0)
+        assert sorted(done.keys() + computing) == model_paths
+
+        done, computing = metrics_computer.get_metrics(model_paths, 0)
+        assert computing == [] and metrics_computer.pending == {}
+        for model_path in model_paths:
+            model_class = BenchmarkedModelData if model_path.startswith('titanic') else ModelData
+            expected = model_class(self.file_system, model_path).get_metrics(0)
+            assert json.dumps(done[model_path], sort_keys=True) == \
+                json.dumps(expected, sort_keys=True)
+            # Kept in the model's cache
+            assert manager.get_model(model_path).metrics[0] is done[model_path]
+
+    def test_metrics_computer_uses_prefetched_artifacts(self):
+        self.poll_until_done()
+        manager = ModelDataManager(self.file_system)
+        metrics_computer = precompute.MetricsComputer(manager, self.pool)
+        model_paths = ['my_other_model_name', 'titanic/good_model']
+        manager.prefetch(model_paths, n_bootstrap_samples=5)
+        # Computed from the prefetched artifacts, without a worker
+        done, computing = metrics_computer.get_metrics(model_paths, 5, timeout=0)
+        assert sorted(done) == model_paths and computing == []
+        assert metrics_computer.pending == {}
+        for model_path in model_paths:
+            assert len(done[model_path]) == 6
+
+    def test_comparing_keeps_the_precomputed_bootstrap(self):
+        self.poll_until_done()
+        # A comparison draws fewer samples than the model page
+        ModelData(self.file_system, 'my_other_model_name').get_metrics(3)
+        model_data = ModelData(self.file_system, 'my_other_model_name')
+        self.assert_precomputed(model_data)
+        model_data.to_data_frame = None
+        assert len(model_data.get_metrics(5)) == 6
@@ -1,4 +1,19 @@
+import base64
+import gzip
+import io
+import json
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from topmodel.file_system import LocalFileSystem
+from topmodel.model_data import ModelData
 from topmodel_server import app
+from web import get_model_data_manager
+from web.views import api
+import matplotlib.pyplot as plt
 import unittest
 
 
@@ -16,6 +31,16 @@ class TopModelRouteTest(unittest.TestCase):
         html = resp.data
         assert 'stroke-width' in html
 
+    def test_compare_reports_models_still_computing(self):
+        app.config['COMPARE_TIMEOUT'] = 0
+        try:
+            resp = self.app.get(
+                '/compare?model[]=data/test/alt_format_model/&model[]=data/test/integer_targets/')
+        finally:
+            app.config['COMPARE_TIMEOUT'] = 30
+        assert 'Still computing the metrics of' in resp.data
+        assert 'data/test/alt_format_model' in resp.data
+
     def test_basic_model(self):
         resp = self.app.get('/model/data/test/my_model_name/')
         html = resp.data
@@ -23,8 +48,110 @@ class TopModelRouteTest(unittest.TestCase):
         # Make sure the notes are displayed on the page
         assert 'Test model notes' in html
 
+    def test_exact_curves(self):
+        resp = self.app.get('/model/data/test/my_model_name/?exact=1')
+        assert resp.status_code == 200
+        assert 'Average precision' in resp.data
+
+    def test_segments(self):
+        resp = self.app.get('/model/data/test/segmented_model/segments')
+        assert resp.status_code == 200
+        assert 'country' in resp.data and 'GB' in resp.data
+        assert 'Precision/Recall curve' in resp.data
+
+    def test_segments_without_metadata_columns(self):
+        resp = self.app.get('/model/data/test/my_model_name/segments')
+        assert resp.status_code == 200
+
+    def test_drift(self):
+        resp = self.app.get('/model/data/test/my_model_name/drift?windows=3')
+        assert resp.status_code == 200
+        assert 'Precision at 0.5' in resp.data
+
+    def test_client_rendering(self):
+        server = self.app.get('/model/data/test/my_model_name/')
+        client = self.app.get('/model/data/test/my_model_name/?render=client')
+        assert 'drawCurves' in client.data and 'drawCurves' not in server.data
+        assert len(client.data) < len(server.data)
+
+    def test_model_page_is_rendered_once(self):
+        self.app.get('/model/data/test/my_other_model_name/')
+        with app.app_context():
+            model_data = get_model_data_manager().get_model('data/test/my_other_model_name')
+        assert len(model_data.rendered) == 1
+        # and the figures drawn were released
+        assert plt.get_fignums() == []
+
     def test_integer_targets(self):
         """Test that it doesn't crash if the targets are '0' instead of 'False'"""
         resp = self.app.get('/model/data/test/integer_targets/')
         html = resp.data
         assert 'stroke-width' in html
+
+    def test_model_index(self):
+        index = json.loads(self.app.get('/api/models').data)
+        assert [(entry['path'], entry['model']) for entry in index['entries']] == [('data', False)]
+        test_models = json.loads(self.app.get('/api/models?prefix=data/test/').data)
+        assert {'path': 'data/test/my_model_name', 'model': True, 'models': 0} in \
+            test_models['entries']
+        found = json.loads(self.app.get('/api/models?q=other_MODEL').data)
+        assert [entry['path'] for entry in found['entries']] == ['data/test/my_other_model_name']
+        assert found['pages'] == 1
+
+    def test_metrics_api(self):
+        url = '/api/model/data/test/my_model_name/metrics?bootstrap=5'
+        resp = self.app.get(url)
+        assert resp.status_code == 200 and resp.headers['ETag']
+        metrics = json.loads(resp.data)
+        assert 0.5 < metrics['auc'] <= 1
+        assert len(metrics['bootstrap']) == 5
+        assert metrics['top_metrics']['thresholds'][-1] == 1
+        # Not sent again until the model changes
+        resp = self.app.get(url, headers={'If-None-Match': resp.headers['ETag']})
+        assert resp.status_code == 304 and resp.data == ''
+
+    def test_metrics_api_compact_and_compressed(self):
+        url = '/api/model/data/test/my_model_name/metrics?bootstrap=5'
+        samples = json.loads(self.app.get(url).data)['bootstrap']
+        resp = self.app.get(url + '&encoding=base64', headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        encoded = json.loads(gzip.GzipFile(fileobj=io.BytesIO(resp.data)).read())['bootstrap']
+        precisions = np.frombuffer(base64.b64decode(encoded['precisions']['data']), dtype='<f4')
+        assert encoded['precisions']['shape'] == [5, len(samples[0]['precisions'])]
+        np.testing.assert_allclose(
+            precisions.reshape(encoded['precisions']['shape']),
+            np.array([sample['precisions'] for sample in samples], dtype=float), rtol=1e-6)
+        assert self.app.get('/api/model/missing/metrics').status_code == 404
+
+    def test_metrics_api_etag_of_encoding(self):
+        url = '/api/model/data/test/my_model_name/metrics'
+        identity = self.app.get(url)
+        compressed = self.app.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert identity.headers['ETag'] != compressed.headers['ETag']
+        resp = self.app.get(url, headers={'If-None-Match': compressed.headers['ETag'],
+                                          'Accept-Encoding': 'gzip'})
+        assert resp.status_code == 304
+        # A cached body in the other encoding is sent again
+        resp = self.app.get(url, headers={'If-None-Match': identity.headers['ETag'],
+                                          'Accept-Encoding': 'gzip'})
+        assert resp.status_code == 200 and resp.headers['Content-Encoding'] == 'gzip'
+
+    def test_metrics_json_is_finite(self):
+        tmpdir_path = tempfile.mkdtemp()
+        try:
+            model_data = ModelData(LocalFileSystem(tmpdir_path), 'certain')
+            # A false in the last bin, whose threshold is 1, has an infinite logloss
+            model_data.save_data_frame(pd.DataFrame({'actual': [True, False, True],
+                                                     'pred_score': [0.2, 0.995, 0.6]}))
+            assert np.isinf(model_data.get_metrics()['logloss'])
+            body = json.dumps(api.metrics_json(model_data, 2, api.LIST_ENCODING),
+                              allow_nan=False)
+            assert json.loads(body)['metrics']['logloss'] is None
+        finally:
+            shutil.rmtree(tmpdir_path)
+
+    def test_cache_stats(self):
+        self.app.get('/model/data/test/my_other_model_name/')
+        stats = json.loads(self.app.get('/cache').data)
+        assert stats['hits'] > 0
+        assert stats['bytes'] <= stats['max_bytes']
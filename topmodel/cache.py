@@ -0,0 +1,88 @@
+# In-memory LRU cache shared by the ModelData of a process, bounded by the
+# (estimated) number of bytes it holds.
+
+import collections
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def sizeof(value):
+    """
+    Estimate of the memory used by a value, including what it refers to, for
+    the kinds of values we cache: data frames, arrays, and (nested) lists,
+    tuples and dicts of numbers and strings.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class LRUCache(object):
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            value, size = self.entries.pop(key)
+            self.entries[key] = (value, size)
+            return value
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = sizeof(value)
+        with self.lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                value, size = self.entries.pop(key)
+                self.size -= size
+                return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries),
+                    'bytes': self.size,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,85 @@
+# An index of model paths, kept sorted so that the models under a directory
+# are found by binary search: browsing a directory a level at a time, or a
+# page of search results, doesn't go through every model.
+
+import bisect
+
+# Entries of the model index sent at a time
+PAGE_SIZE = 50
+
+
+class ModelCatalog(object):
+    """
+    Sorted model paths. The paths under a directory 'a/b' are the range
+    ['a/b/', 'a/b0') of the list, since '0' is the character after '/'.
+    """
+
+    def __init__(self, paths=()):
+        self.paths = sorted(paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        i = bisect.bisect_left(self.paths, path)
+        return i < len(self.paths) and self.paths[i] == path
+
+    def update(self, directory, paths):
+        # Replace the paths in (or of) the directory with paths, eg. after
+        # only it was listed again
+        directory = directory.strip('/')
+        if directory:
+            start, end = self.span(directory)
+            kept = [path for path in self.paths[:start] + self.paths[end:] if path != directory]
+        else:
+            kept = []
+        self.paths = sorted(kept + list(paths))
+
+    def span(self, directory):
+        # (start, end) of the paths under the directory
+        if not directory:
+            return 0, len(self.paths)
+        return (bisect.bisect_left(self.paths, directory + '/'),
+                bisect.bisect_left(self.paths, directory + '0'))
+
+    def under(self, directory):
+        start, end = self.span(directory.strip('/'))
+        return self.paths[start:end]
+
+    def children(self, directory):
+        """
+        The entries directly in a directory, in order: (path, is a model,
+        number of models under it), where a path can be a model and also
+        have models under it. Jumps over the models under each entry, so
+        this takes a binary search per entry rather than going through
+        every model under the directory.
+        """
+        directory = directory.strip('/')
+        prefix = directory + '/' if directory else ''
+        i, end = self.span(directory)
+        # {path: [is a model, models under it]}. A model 'a' and the
+        # models under 'a/' needn't be next to each other ('a-b' is between).
+        entries = {}
+        while i < end:
+            name = self.paths[i][len(prefix):].split('/', 1)[0]
+            path = prefix + name
+            entry = entries.setdefault(path, [False, 0])
+            if self.paths[i] == path:
+                entry[0] = True
+                i += 1
+            else:
+                start, i = self.span(path)
+                entry[1] = i - start
+        return [(path, is_model, n_models)
+                for path, (is_model, n_models) in sorted(entries.items())]
+
+    def search(self, query, directory=''):
+        # Models under the directory whose path contains query, ignoring case
+        query = query.lower()
+        return [path for path in self.under(directory) if query in path.lower()]
+
+
+def paginate(entries, page, page_size=PAGE_SIZE):
+    # (the entries on a page, numbered from 1, and the number of pages)
+    pages = max(1, (len(entries) + page_size - 1) // page_size)
+    return entries[(page - 1) * page_size:page * page_size], pages
@@ -0,0 +1,103 @@
+# Command line tools for managing the models in a topmodel file system
+
+import argparse
+import functools
+import glob
+import signal
+import sys
+
+from topmodel import ingest
+from topmodel import precompute
+from topmodel.file_system import get_file_system
+from topmodel.model_data import ModelDataManager, BINNINGS, UNIFORM_BINNING
+
+
+def convert(file_system, args):
+    manager = ModelDataManager(file_system)
+    for model_path in args.model_paths:
+        model_path = model_path.rstrip('/')
+        if model_path not in manager.models:
+            raise SystemExit("No model at %s" % model_path)
+        manager.models[model_path].save_columns()
+        print "Converted %s" % model_path
+
+
+def precompute_models(file_system, args):
+    # Exit normally when terminated (eg. by the server), so the worker
+    # processes are stopped too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    precompute.run(
+        file_system, functools.partial(get_file_system, not args.remote),
+        processes=args.processes, interval=args.interval,
+        n_bootstrap_samples=args.bootstrap_samples, once=args.once, binning=args.binning)
+
+
+def ingest_models(file_system, args):
+    # Globs are expanded here too, for shells that don't, or quoted ones
+    paths = sorted(set(path for pattern in args.paths for path in glob.glob(pattern)))
+    if not paths:
+        raise SystemExit("No files match %s" % ' '.join(args.paths))
+    try:
+        failed = ingest.run(
+            file_system, functools.partial(get_file_system, not args.remote), paths,
+            directory=args.to, actuals=args.actuals, processes=args.processes,
+            n_bootstrap_samples=args.bootstrap_samples, binning=args.binning)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if failed:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="topmodel", description="Manage topmodel models")
+    parser.add_argument(
+        "--remote", "-r", action="store_true", default=False, help="Use data from S3")
+    subparsers = parser.add_subparsers()
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="Write a binary columnar copy of the models' TSV files next to them")
+    convert_parser.add_argument("model_paths", nargs="+", metavar="model_path")
+    convert_parser.set_defaults(func=convert)
+
+    precompute_parser = subparsers.add_parser(
+        "precompute", help="Compute the histograms and bootstrap samples of new and changed models")
+    precompute_parser.add_argument(
+        "--processes", type=int, default=None, help="Worker processes (default: one per CPU)")
+    precompute_parser.add_argument(
+        "--interval", type=float, default=precompute.POLL_INTERVAL,
+        help="Seconds between checks for new models")
+    precompute_parser.add_argument(
+        "--bootstrap-samples", type=int, default=precompute.N_BOOTSTRAP_SAMPLES)
+    precompute_parser.add_argument(
+        "--once", action="store_true", default=False,
+        help="Precompute the models there are now, then exit")
+    precompute_parser.add_argument(
+        "--binning", choices=BINNINGS, default=UNIFORM_BINNING,
+        help="Equal width histogram bins, or bins adapted to the scores")
+    precompute_parser.set_defaults(func=precompute_models)
+
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Validate local scores files, and write and precompute them as models")
+    ingest_parser.add_argument(
+        "paths", nargs="+", metavar="path",
+        help="Scores files (or globs of them), each a model named after the file")
+    ingest_parser.add_argument(
+        "--to", default="", help="Directory of the file system to write the models to")
+    ingest_parser.add_argument(
+        "--actuals", default=None,
+        help="Actuals (id and actual) to benchmark the scores (id and pred_score) against")
+    ingest_parser.add_argument(
+        "--processes", type=int, default=None, help="Worker processes (default: one per CPU)")
+    ingest_parser.add_argument(
+        "--bootstrap-samples", type=int, default=precompute.N_BOOTSTRAP_SAMPLES)
+    ingest_parser.add_argument(
+        "--binning", choices=BINNINGS, default=UNIFORM_BINNING,
+        help="Equal width histogram bins, or bins adapted to the scores")
+    ingest_parser.set_defaults(func=ingest_models)
+
+    args = parser.parse_args(argv)
+    args.func(get_file_system(not args.remote), args)
+
+
+if __name__ == "__main__":
+    main()
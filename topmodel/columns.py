@@ -0,0 +1,195 @@
+# Binary columnar copies of the TSV files: `scores.tsv` can have a
+# `scores.columns/` directory next to it with one .npy file per column, which
+# loads much faster than parsing the TSV.
+#
+# `scores.columns/source.json` is written last and records the columns and
+# the size and version of the TSV they were converted from. Columns whose TSV
+# has changed since are ignored. String columns are stored as their UTF-8
+# bytes, in a `.utf8` file, with a `.npy` of where each value starts and ends
+# and a `.missing.npy` of which are missing.
+
+import collections
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS_SUFFIX = '.columns'
+SOURCE_FILE = 'source.json'
+# Files of a string column besides its .npy of offsets
+STRINGS_SUFFIX = '.utf8'
+MISSING_SUFFIX = '.missing.npy'
+
+
+def columns_path(path):
+    # scores.tsv -> scores.columns
+    return os.path.splitext(path)[0] + COLUMNS_SUFFIX
+
+
+def source_path(path):
+    return os.path.join(columns_path(path), SOURCE_FILE)
+
+
+def tsv_path(key):
+    """
+    The TSV a key in a file system listing stands for: the key itself, or
+    the TSV that the columns were converted from for a source.json key.
+    """
+    columns_dir, filename = os.path.split(key)
+    if filename == SOURCE_FILE and columns_dir.endswith(COLUMNS_SUFFIX):
+        return columns_dir[:-len(COLUMNS_SUFFIX)] + '.tsv'
+    return key
+
+
+def column_file(path, name, suffix='.npy'):
+    return os.path.join(columns_path(path), name + suffix)
+
+
+def encode_strings(values):
+    """
+    An object column (eg. of ids) as (offsets, data, missing): its values'
+    UTF-8 bytes one after another in data, where each starts and ends, and
+    which are missing. Smaller than fixed width unicode, which pads every
+    value to the longest, and loads without pickle.
+    """
+    missing = pd.isnull(values)
+    encoded = ['' if is_missing else
+               value.encode('utf-8') if isinstance(value, unicode) else str(value)
+               for value, is_missing in zip(values, missing)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, ''.join(encoded), missing
+
+
+def decode_strings(offsets, data, missing):
+    # The byte strings (as read_csv gives) of encode_strings, with NaN where
+    # they are missing
+    offsets = offsets.tolist()
+    values = np.empty(len(offsets) - 1, dtype=object)
+    values[:] = [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    values[np.asarray(missing, dtype=bool)] = np.nan
+    return values
+
+
+def write_array(file_system, path, array):
+    with io.BytesIO() as f:
+        np.save(f, array)
+        f.seek(0)
+        file_system.write_file(path, f)
+
+
+def write_columns(file_system, path, df):
+    # Write the columns of df, as read from the TSV at `path`, next to it
+    strings = []
+    for name in df.columns:
+        values = df[name].values
+        if values.dtype == object:
+            offsets, data, missing = encode_strings(values)
+            write_array(file_system, column_file(path, name), offsets)
+            file_system.write_file(column_file(path, name, STRINGS_SUFFIX), data)
+            write_array(file_system, column_file(path, name, MISSING_SUFFIX), missing)
+            strings.append(name)
+        else:
+            write_array(file_system, column_file(path, name), values)
+    source = {'columns': list(df.columns), 'strings': strings, 'source': file_system.stat(path)}
+    file_system.write_file(source_path(path), json.dumps(source))
+
+
+def read_columns(file_system, path):
+    """
+    The columns converted from the TSV at `path`, as an ordered dict of
+    arrays, or None if there are none or the TSV has changed since.
+    """
+    raw = file_system.read_file(source_path(path))
+    if raw is None:
+        return None
+    source = json.loads(raw)
+    stat = file_system.stat(path)
+    if stat is not None and json.loads(json.dumps(stat)) != source['source']:
+        return None
+
+    # Columns written before strings were encoded are fixed width unicode
+    strings = set(source.get('strings', []))
+    paths = [column_file(path, name) for name in source['columns']]
+    paths += [column_file(path, name, suffix) for name in source['columns'] if name in strings
+              for suffix in [STRINGS_SUFFIX, MISSING_SUFFIX]]
+    buffers = dict((column_path, file_system.memory_map(column_path)) for column_path in paths)
+    if any(buf is None for buf in buffers.values()):
+        # Can't be memory mapped, so fetch all the files at once
+        buffers = dict((column_path, io.BytesIO(contents))
+                       for column_path, contents in file_system.read_files(paths).items())
+
+    arrays = collections.OrderedDict()
+    for name in source['columns']:
+        array = buffer_array(buffers[column_file(path, name)])
+        if name in strings:
+            data = buffers[column_file(path, name, STRINGS_SUFFIX)]
+            missing = buffer_array(buffers[column_file(path, name, MISSING_SUFFIX)])
+            array = decode_strings(array, data.getvalue() if isinstance(data, io.BytesIO)
+                                   else data[:], missing)
+        arrays[name] = array
+    return arrays
+
+
+def load_array(file_system, path):
+    """
+    Load a .npy file. If the file system can memory map it, the array is a
+    read-only view of the mapped file rather than a copy.
+    """
+    buf = file_system.memory_map(path)
+    if buf is None:
+        buf = io.BytesIO(file_system.read_file(path))
+    return buffer_array(buf)
+
+
+def buffer_array(buf):
+    # A .npy file in a buffer, as a view of it rather than a copy: of the
+    # mapped file, for a memory map
+    version = np.lib.format.read_magic(buf)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buf)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buf)
+    count, offset = int(np.prod(shape)), buf.tell()
+    if isinstance(buf, io.BytesIO):
+        buf = buf.getvalue()
+    array = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+
+class ColumnChunk(object):
+    """
+    Rows of columns read by read_columns, as views of their (memory mapped)
+    arrays. Building a DataFrame of them would copy every column, so the
+    histogram and binning code takes these instead: they have as much of a
+    DataFrame's interface as that needs, and as drop_missing needs.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    @property
+    def columns(self):
+        return list(self.arrays)
+
+    def __len__(self):
+        return len(self.arrays.values()[0]) if self.arrays else 0
+
+    def __getitem__(self, key):
+        # A column as a Series sharing its array, some of the columns, or
+        # the rows of a boolean mask (a copy)
+        if isinstance(key, basestring):
+            return pd.Series(self.arrays[key], copy=False)
+        if isinstance(key, list):
+            return ColumnChunk(collections.OrderedDict((name, self.arrays[name]) for name in key))
+        return ColumnChunk(collections.OrderedDict(
+            (name, values[key]) for name, values in self.arrays.items()))
+
+    def get(self, key, default=None):
+        return self[key] if key in self.arrays else default
+
+    def iteritems(self):
+        for name in self.arrays:
+            yield name, self[name]
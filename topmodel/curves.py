@@ -0,0 +1,122 @@
+# Exact ROC and precision/recall curves, AUC and average precision, from the
+# scores themselves rather than from a histogram of them: the curves have a
+# point at every distinct score.
+#
+# The true and false rows' scores are sorted separately (O(n log n)), after
+# which the weighted count of each at or above any threshold is a binary
+# search. The distinct scores are then visited from the highest down a block
+# at a time, so besides the sorted scores only a block's worth of points is
+# in memory at once. The curves that are kept are downsampled for plotting.
+
+import numpy as np
+
+# Downsampled curves keep a point for every cell of a grid this fine that
+# the curve passes through
+CURVE_RESOLUTION = 500
+# Roughly how many distinct scores of each class are handled at a time
+BLOCK_SIZE = 1000000
+
+
+class SortedScores(object):
+    """
+    The scores of the true (or false) rows, sorted, to count (or add up the
+    weights of) the scores at or above any threshold. `scores` is sorted in
+    place, so with 100M rows there is no second copy of them.
+    """
+
+    def __init__(self, scores, weights=None):
+        if weights is None:
+            scores.sort()
+            self.scores = scores
+            self.weights_above = None
+        else:
+            order = np.argsort(scores, kind='mergesort')
+            self.scores = scores[order]
+            # Weight of scores[i:] for every i, and 0 past the end
+            self.weights_above = np.append(np.cumsum(weights[order][::-1])[::-1], 0.0)
+
+    def count_above(self, thresholds):
+        index = np.searchsorted(self.scores, thresholds, side='left')
+        if self.weights_above is None:
+            return (len(self.scores) - index).astype(float)
+        return self.weights_above[index]
+
+    def between(self, low, high):
+        # The scores in [low, high)
+        start, end = np.searchsorted(self.scores, [low, high], side='left')
+        return self.scores[start:end]
+
+
+def _divide(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator != 0, numerator / denominator, np.nan)
+
+
+def _first_in_cell(xs, ys, previous_cell, resolution):
+    # Which points are the first to fall into their grid cell, coming from
+    # previous_cell
+    cells = np.floor(xs * resolution) * (resolution + 1) + np.floor(ys * resolution)
+    with np.errstate(invalid='ignore'):
+        return cells != np.concatenate([[previous_cell], cells[:-1]]), cells[-1]
+
+
+def exact_curves(predicted, actual, weight=None, resolution=CURVE_RESOLUTION,
+                 block_size=BLOCK_SIZE):
+    """
+    Exact AUC and average precision of the scores, and their ROC and
+    precision/recall curves downsampled to about `resolution` points along
+    each axis, in order of increasing threshold like the histogram metrics.
+    Average precision is the sum over thresholds of the precision times the
+    increase in recall, without interpolation.
+    """
+    predicted = np.asarray(predicted, dtype=float)
+    actual = np.asarray(actual, dtype=bool)
+    if weight is not None:
+        weight = np.asarray(weight, dtype=float)
+        if len(weight) == 0 or (weight == weight[0]).all():
+            # The same weight everywhere doesn't change any of the rates
+            weight = None
+    trues = SortedScores(predicted[actual], None if weight is None else weight[actual])
+    falses = SortedScores(predicted[~actual], None if weight is None else weight[~actual])
+    all_trues = trues.count_above(-np.inf)
+    all_falses = falses.count_above(-np.inf)
+
+    # Blocks of scores [edges[i], edges[i + 1]), the last one unbounded
+    edges = np.unique(np.concatenate([trues.scores[::block_size], falses.scores[::block_size]]))
+    edges = np.append(edges, np.inf)
+
+    auc, average_precision = 0.0, 0.0
+    previous_fpr, previous_recall = 0.0, 0.0
+    roc_cell, pr_cell = np.nan, np.nan
+    kept = {'thresholds': [], 'recalls': [], 'fprs': [], 'precisions': []}
+    for i in xrange(len(edges) - 2, -1, -1):
+        thresholds = np.unique(np.concatenate([trues.between(edges[i], edges[i + 1]),
+                                               falses.between(edges[i], edges[i + 1])]))[::-1]
+        true_positives = trues.count_above(thresholds)
+        false_positives = falses.count_above(thresholds)
+        recalls = _divide(true_positives, all_trues)
+        fprs = _divide(false_positives, all_falses)
+        precisions = true_positives / (true_positives + false_positives)
+
+        auc += np.trapz(np.concatenate([[previous_recall], recalls]),
+                        np.concatenate([[previous_fpr], fprs]))
+        average_precision += np.sum(
+            np.diff(np.concatenate([[previous_recall], recalls])) * precisions)
+        previous_fpr, previous_recall = fprs[-1], recalls[-1]
+
+        new_roc_cell, roc_cell = _first_in_cell(fprs, recalls, roc_cell, resolution)
+        new_pr_cell, pr_cell = _first_in_cell(recalls, precisions, pr_cell, resolution)
+        keep = new_roc_cell | new_pr_cell
+        if i == 0:
+            # Always keep the lowest threshold, where every row is selected
+            keep[-1] = True
+        for name, values in [('thresholds', thresholds), ('recalls', recalls),
+                             ('fprs', fprs), ('precisions', precisions)]:
+            kept[name].append(values[keep])
+
+    curves = dict((name, [None if np.isnan(v) else v
+                          for v in np.concatenate(values + [[]])[::-1].tolist()])
+                  for name, values in kept.items())
+    curves['auc'] = float(auc)
+    curves['average_precision'] = float(average_precision)
+    return curves
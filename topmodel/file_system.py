@@ -1,29 +1,104 @@
 # File abstraction to allow both S3 and local to be used
 
-import StringIO
-import math
+import calendar
+import cStringIO
+import collections
+import json
+import mmap
 import os
+import shutil
 import subprocess
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 
 # for s3 from python
+import boto.utils
+from boto.exception import S3ResponseError
 from boto.s3.connection import S3Connection
+from boto.s3.multipart import MultiPartUpload
+from boto.s3.prefix import Prefix
+
+from topmodel import settings
+
+try:
+    from os import scandir
+except ImportError:
+    # The backport, on Python 2
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# S3 objects larger than this are downloaded as concurrent ranged GETs of
+# this size
+S3_RANGE_SIZE = 8 * 1024 * 1024
+# Simultaneous requests (and open connections) to S3
+S3_MAX_CONNECTIONS = 16
+# S3 objects larger than this are uploaded in parts of this size
+S3_PART_SIZE = 50 * 1024 * 1024
+# Parts of a multipart upload that are held in memory at once
+S3_MAX_UPLOAD_PARTS = 4
+
+# Where a local file system keeps the contents of its directories between
+# listings, relative to its base directory. It's in a directory of its own
+# so that replacing it doesn't modify the base directory.
+MANIFEST_FILE = '.topmodel/manifest.json'
+# A directory modified this recently (in seconds) before it was listed can
+# change again without its modified time changing, so its listing isn't
+# reused
+RACY_SECONDS = 2
+
 
 class FileSystem(object):
 
     def read_file(self, path):
         raise NotImplemented
 
+    def read_files(self, paths):
+        # {path: contents} for several files, None for the missing ones.
+        # File systems where reads are slow fetch them concurrently.
+        return dict((path, self.read_file(path)) for path in paths)
+
+    def open_file(self, path):
+        # A file-like object to read the file from in pieces, without holding
+        # all of it in memory. None if the file doesn't exist.
+        raise NotImplemented
+
+    def memory_map(self, path):
+        # Optional: a read-only buffer of the file's contents backed by the
+        # page cache, usable both as a file-like object and with
+        # np.frombuffer. None if the file system can't do it, in which case
+        # use read_file or open_file.
+        return None
+
     def write_file(self, path, data):
+        # data is a string or a file-like object to copy the file from
         raise NotImplemented
 
     def list(self, path):
         raise NotImplemented
 
-    def list_name_modified(self, path):
+    def list_name_modified(self, path, file_filter=None):
+        # {path: modified} of the files under path, or of only those whose
+        # path file_filter accepts
+        raise NotImplemented
+
+    def list_dir(self, path):
+        # (file names, directory names) directly in a directory
+        raise NotImplemented
+
+    def stat(self, path):
+        # (size, version) of a file, where the version (a modified time or
+        # an ETag) changes whenever the file is rewritten. None if the file
+        # doesn't exist.
+        raise NotImplemented
+
+    def modified(self, path):
+        # When a file was last written, in seconds since the epoch. None if
+        # the file doesn't exist.
         raise NotImplemented
 
     def remove(self, path):
@@ -37,76 +112,213 @@ class S3FileSystem(FileSystem):
                  aws_access_key_id,
                  aws_secret_access_key,
                  security_token=None,
-                 subdirectory=''):
-        conn = S3Connection(
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            security_token=security_token)
-        self.bucket = conn.get_bucket(bucket_name)
+                 subdirectory='',
+                 max_connections=S3_MAX_CONNECTIONS):
+        self.bucket_name = bucket_name
+        self.connection_args = {'aws_access_key_id': aws_access_key_id,
+                                'aws_secret_access_key': aws_secret_access_key,
+                                'security_token': security_token}
+        self.max_connections = max_connections
+        self.local = threading.local()
+        self.pool = None
+        self.pool_pid = None
+        self.pool_lock = threading.Lock()
+        # Fail early if the bucket doesn't exist
+        conn = S3Connection(**self.connection_args)
+        self.local.bucket = conn.get_bucket(bucket_name)
+        self.local.pid = os.getpid()
         self.subdirectory = subdirectory
         if subdirectory and not subdirectory.endswith('/'):
             self.subdirectory += '/'
 
+    @property
+    def bucket(self):
+        # boto connections can't be shared between threads (or with a forked
+        # process), so each thread has its own, which keeps its HTTP
+        # connection open between requests
+        bucket = getattr(self.local, 'bucket', None)
+        if bucket is None or self.local.pid != os.getpid():
+            conn = S3Connection(**self.connection_args)
+            bucket = self.local.bucket = conn.get_bucket(self.bucket_name, validate=False)
+            self.local.pid = os.getpid()
+        return bucket
+
+    def map(self, f, items):
+        # [f(item) for item in items], at most max_connections at a time
+        items = list(items)
+        if len(items) <= 1:
+            return map(f, items)
+        return self.thread_pool().map(f, items)
+
+    def thread_pool(self):
+        # The pool's threads don't survive a fork, so a forked process
+        # starts its own pool
+        with self.pool_lock:
+            if self.pool is None or self.pool_pid != os.getpid():
+                self.pool = ThreadPool(self.max_connections)
+                self.pool_pid = os.getpid()
+            return self.pool
+
     def read_file(self, path):
-        key = self.bucket.get_key(self.subdirectory + path)
-        if key is None:
-            return None
-        return key.read()
+        return self.read_files([path])[path]
 
-    def write_file(self, path, data):
-        key = self.bucket.get_key(self.subdirectory + path)
-        if key is None:
-            key = self.bucket.new_key(self.subdirectory + path)
+    def read_files(self, paths):
+        # Get the first range of every key at once, then the rest of the
+        # large ones as more ranged GETs, also all at once. The first GET
+        # says how large the key is, so small keys take one request.
+        unique_paths = list(collections.OrderedDict.fromkeys(paths))
+        firsts = self.map(self.read_first_range, unique_paths)
+        ranges = [(key, start, min(start + S3_RANGE_SIZE, key.size))
+                  for key, first in firsts if key is not None
+                  for start in xrange(len(first), key.size, S3_RANGE_SIZE)]
+        parts = self.map(lambda key_range: self.read_range(*key_range), ranges)
+
+        key_parts = collections.defaultdict(list)
+        for (key, _, _), part in zip(ranges, parts):
+            key_parts[key.name].append(part)
+        return dict((path, None if key is None else ''.join([first] + key_parts[key.name]))
+                    for path, (key, first) in zip(unique_paths, firsts))
+
+    def read_first_range(self, path):
+        # (key, its first S3_RANGE_SIZE bytes), or (None, None) if it's
+        # missing. The key's size and ETag are those of the response.
+        key = self.bucket.new_key(self.subdirectory + path)
+        try:
+            return key, key.get_contents_as_string(
+                headers={'Range': 'bytes=0-%d' % (S3_RANGE_SIZE - 1)})
+        except S3ResponseError as e:
+            if e.status == 404:
+                return None, None
+            if e.status == 416:
+                # Only an empty key has no first byte
+                key.size = 0
+                return key, ''
+            raise
+
+    def read_range(self, key, start, end):
+        # Bytes [start, end) of the key, from this thread's connection. The
+        # ETag has to match, so the parts all come from the same upload.
+        if start == 0 and end == key.size:
+            headers = {}
+        else:
+            headers = {'Range': 'bytes=%d-%d' % (start, end - 1)}
+        headers['If-Match'] = key.etag
+        return self.bucket.new_key(key.name).get_contents_as_string(headers=headers)
 
-        # Take the data (a giant string), and turn it into a file IO stream
-        # we can read from
-        f = StringIO.StringIO()
-        f.write(data)
-        f.seek(0)
+    def open_file(self, path):
+        # Reading a key streams the body of the GET
+        return self.bucket.get_key(self.subdirectory + path)
 
-        # Count the number of chunks we're going to have to upload
-        size = len(data)
-        # By default, set the chunk size to 50MB
-        chunk_size = 1024 * 1024 * 50
-        chunks = int(math.ceil(size/float(chunk_size)))
+    def write_file(self, path, data):
+        # data is a string, or a file-like object that is uploaded a part at
+        # a time as it is read, so it never has to be in memory all at once
+        key_name = self.subdirectory + path
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        # Unlike StringIO, cStringIO reads from the string without copying it
+        f = cStringIO.StringIO(data) if isinstance(data, str) else data
 
-        # Start the multipart upload
-        upload = self.bucket.initiate_multipart_upload(key)
+        part = f.read(S3_PART_SIZE)
+        next_part = f.read(S3_PART_SIZE)
+        if not next_part:
+            # Small enough for a single PUT
+            self.bucket.new_key(key_name).set_contents_from_string(part)
+            return
 
+        upload = self.bucket.initiate_multipart_upload(key_name)
+        # Bounds the parts read but not uploaded yet, and so the memory used
+        in_flight = threading.BoundedSemaphore(S3_MAX_UPLOAD_PARTS)
+        results = []
         try:
-            # Upload chunk by chunk, using the StringIO object instantiated above
-            # we can reference the offset we want to upload.
-            for i in range(chunks):
-                bytes = min(chunk_size, size - (i * chunk_size))
-                upload.upload_part_from_file(f, part_num=i+1, size=bytes)
+            part_num = 1
+            while part:
+                in_flight.acquire()
+                results.append(self.thread_pool().apply_async(
+                    self.upload_part, (upload, part_num, part, in_flight)))
+                if any(result.ready() and not result.successful() for result in results):
+                    break
+                part, next_part = next_part, f.read(S3_PART_SIZE)
+                part_num += 1
+            for result in results:
+                result.get()
         except:
+            for result in results:
+                result.wait()
             upload.cancel_upload()
             raise
         else:
             upload.complete_upload()
 
+    def upload_part(self, upload, part_num, part, in_flight):
+        try:
+            # The upload was started on another thread's connection
+            thread_upload = MultiPartUpload(self.bucket)
+            thread_upload.key_name, thread_upload.id = upload.key_name, upload.id
+            thread_upload.upload_part_from_file(
+                cStringIO.StringIO(part), part_num, size=len(part))
+        finally:
+            in_flight.release()
+
     def list(self, path=''):
         subdirlen = len(self.subdirectory)
         return [key.name[subdirlen:] for key in self.bucket.list(self.subdirectory + path)]
 
-    def list_name_modified(self, path=''):
+    def list_name_modified(self, path='', file_filter=None):
         model_names_and_modified = {}
         subdirlen = len(self.subdirectory)
         for key in self.bucket.list(self.subdirectory + path):
-            model_names_and_modified[key.name[subdirlen:]] = key.last_modified
+            name = key.name[subdirlen:]
+            if file_filter is None or file_filter(name):
+                model_names_and_modified[name] = key.last_modified
         return model_names_and_modified
 
+    def list_dir(self, path=''):
+        # One level of keys, with everything deeper in a "directory" listed
+        # as a single common prefix of them
+        prefix = self.subdirectory
+        if path.strip('/'):
+            prefix += path.strip('/') + '/'
+        files, dirs = [], []
+        for item in self.bucket.list(prefix, delimiter='/'):
+            name = item.name[len(prefix):]
+            if isinstance(item, Prefix):
+                dirs.append(name.rstrip('/'))
+            else:
+                files.append(name)
+        return files, dirs
+
+    def stat(self, path):
+        key = self.bucket.get_key(self.subdirectory + path)
+        if key is None:
+            return None
+        return (key.size, key.etag)
+
+    def modified(self, path):
+        key = self.bucket.get_key(self.subdirectory + path)
+        if key is None:
+            return None
+        return calendar.timegm(time.strptime(key.last_modified, boto.utils.RFC1123))
+
     def remove(self, path):
         keys = self.bucket.get_all_keys(prefix=self.subdirectory + path)
         self.bucket.delete_keys(keys)
 
 
 class LocalFileSystem(FileSystem):
+    """
+    Files under a directory, by default the project's. Listings skip hidden
+    files and directories (eg. .git), and remember the contents of every
+    directory in a manifest file, so a directory that hasn't been modified
+    since isn't read again.
+    """
 
     def __init__(self, basedir=None):
         if basedir is None:
             basedir = PROJECT_ROOT
         self.basedir = basedir
+        self.manifest_lock = threading.Lock()
+        self.manifest = {}
+        self.manifest_modified = None
 
     def read_file(self, path):
         try:
@@ -115,31 +327,202 @@ class LocalFileSystem(FileSystem):
         except IOError:
             return None
 
+    def open_file(self, path):
+        try:
+            return open(self.abspath(path), 'rb')
+        except IOError:
+            return None
+
+    def memory_map(self, path):
+        try:
+            with open(self.abspath(path), 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, ValueError):
+            # ValueError: empty files can't be mapped
+            return None
+
     def write_file(self, path, data):
         # Make the intermediate directories if they don't exist
         path_dir = os.path.dirname(self.abspath(path))
         if not os.path.exists(path_dir):
             os.makedirs(path_dir)
         with open(self.abspath(path), 'w') as f:
+            if hasattr(data, 'read'):
+                return shutil.copyfileobj(data, f)
             return f.write(data)
 
     def list(self, path=''):
-        walker = os.walk(os.path.join(self.basedir, path))
-        return [
-            os.path.join(dirpath, filename)[len(self.basedir + '/'):]
-            for dirpath, _, filenames in walker
-            for filename in filenames
-        ]
-
-    def list_name_modified(self, path=''):
+        return self.list_files(path)
+
+    def list_name_modified(self, path='', file_filter=None):
         model_names_and_modified = {}
-        filenames = self.list()
-        for name in filenames:
-            model_names_and_modified[name] = time.ctime(os.path.getctime(name))
+        for name in self.list_files(path):
+            if file_filter is None or file_filter(name):
+                try:
+                    changed = os.stat(self.abspath(name)).st_ctime
+                except OSError:
+                    # Removed since the directory was listed
+                    continue
+                model_names_and_modified[name] = time.ctime(changed)
         return model_names_and_modified
 
+    def list_dir(self, path=''):
+        try:
+            return scan_dir(self.abspath(path))
+        except OSError:
+            return [], []
+
+    def list_files(self, path=''):
+        """
+        The (non-hidden) files under path, reading only the directories that
+        were modified since the last listing, and the manifest of the others.
+        """
+        with self.manifest_lock:
+            manifest = self.read_manifest()
+            manifest_dir = os.path.dirname(self.abspath(MANIFEST_FILE))
+            if not os.path.isdir(manifest_dir):
+                # Before the directories are listed, because creating it
+                # modifies the base directory
+                try:
+                    os.makedirs(manifest_dir)
+                except OSError:
+                    pass
+            listed, paths = {}, []
+            start = time.time()
+            stack = [path.strip('/')]
+            while stack:
+                dir_path = stack.pop()
+                try:
+                    modified = os.stat(self.abspath(dir_path)).st_mtime
+                except OSError:
+                    continue
+                entry = manifest.get(dir_path)
+                if entry is None or entry['modified'] != modified or \
+                        entry['listed'] - modified <= RACY_SECONDS:
+                    try:
+                        files, dirs = scan_dir(self.abspath(dir_path))
+                    except OSError:
+                        continue
+                    entry = {'modified': modified, 'listed': start, 'files': files, 'dirs': dirs}
+                listed[dir_path] = entry
+                dir_prefix = dir_path + '/' if dir_path else ''
+                paths.extend([dir_prefix + name for name in entry['files']])
+                stack.extend([dir_prefix + name for name in entry['dirs']])
+
+            if any(manifest.get(dir_path) != entry for dir_path, entry in listed.items()):
+                # Directories outside path keep their entries
+                prefix = path.strip('/')
+                manifest = dict((dir_path, entry) for dir_path, entry in manifest.items()
+                                if prefix and not is_under(dir_path, prefix))
+                manifest.update(listed)
+                self.write_manifest(manifest)
+            return paths
+
+    def read_manifest(self):
+        # The manifest is only parsed again when it was replaced (eg. by
+        # another process). Every entry is checked against its directory, so
+        # an out of date manifest only means more directories are read.
+        try:
+            modified = os.stat(self.abspath(MANIFEST_FILE)).st_mtime
+        except OSError:
+            return {}
+        if modified != self.manifest_modified:
+            try:
+                self.manifest = json.loads(self.read_file(MANIFEST_FILE) or '{}')
+            except ValueError:
+                self.manifest = {}
+            self.manifest_modified = modified
+        return self.manifest
+
+    def write_manifest(self, manifest):
+        # Renamed into place, so a process listing at the same time never
+        # reads half of it
+        manifest_path = self.abspath(MANIFEST_FILE)
+        temporary_path = '%s.%d' % (manifest_path, os.getpid())
+        try:
+            with open(temporary_path, 'w') as f:
+                f.write(json.dumps(manifest))
+            os.rename(temporary_path, manifest_path)
+            self.manifest = manifest
+            self.manifest_modified = os.stat(manifest_path).st_mtime
+        except (IOError, OSError, ValueError):
+            # eg. a read-only directory, or file names that aren't UTF-8:
+            # every directory is read again next time
+            pass
+
+    def stat(self, path):
+        try:
+            stat = os.stat(self.abspath(path))
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime)
+
+    def modified(self, path):
+        try:
+            return os.stat(self.abspath(path)).st_mtime
+        except OSError:
+            return None
+
     def remove(self, path):
         subprocess.check_call(["rm", "-r", self.abspath(path)])
 
     def abspath(self, path):
         return os.path.join(self.basedir, path)
+
+
+def scan_dir(path):
+    # (file names, directory names) in a directory, without the hidden ones
+    # and without following links to directories, like os.walk
+    files, dirs = [], []
+    if scandir is not None:
+        for entry in scandir(path):
+            if not entry.name.startswith('.'):
+                (dirs if entry.is_dir(follow_symlinks=False) else files).append(entry.name)
+    else:
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            if not name.startswith('.'):
+                is_dir = os.path.isdir(full_path) and not os.path.islink(full_path)
+                (dirs if is_dir else files).append(name)
+    return files, dirs
+
+
+def is_under(path, dir_path):
+    return path == dir_path or path.startswith(dir_path.rstrip('/') + '/')
+
+
+class IteratorFile(object):
+    """
+    Read-only file-like object over the strings from an iterator, for
+    streaming output to `write_file` as it is generated.
+    """
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        pieces, length = [self.buffer], len(self.buffer)
+        while size < 0 or length < size:
+            try:
+                piece = next(self.iterator)
+            except StopIteration:
+                break
+            pieces.append(piece)
+            length += len(piece)
+        data = ''.join(pieces)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def get_file_system(local, config_file='./config.yaml'):
+    # The file system the server uses: the project directory, or the S3
+    # bucket from the config file
+    if local:
+        return LocalFileSystem()
+    config = settings.read_config(config_file)
+    return S3FileSystem(config['bucket'],
+                        config['aws_access_key'],
+                        config['aws_secret_key'])
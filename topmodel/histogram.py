@@ -0,0 +1,497 @@
+# Vectorized construction of the (thresholds, trues, totals) histograms that
+# all of the metrics are computed from.
+
+import numpy as np
+import pandas as pd
+
+# Adaptive binning first counts the scores in a sketch (see SketchAccumulator)
+# of bins with at most about 1/SKETCH_BINS of the scores each, made up of
+# cells that split every uniform bin into SKETCH_CELLS
+SKETCH_BINS = 4096
+SKETCH_CELLS = 2 ** 32
+
+# Columns with more distinct values than this aren't broken down into
+# segments (eg. ids), since their histograms would take too much space
+MAX_SEGMENTS = 1000
+
+
+def uniform_bin_edges(n_bins):
+    return map(lambda x: x * 1.0 / n_bins, range(0, n_bins + 1))
+
+
+def top_bin_edges(top_thresholds):
+    return [0.0] + list(top_thresholds)
+
+
+def quantile_bin_edges(sketch, n_bins):
+    """
+    Choose about `n_bins` bins with equal numbers of scores in each, from the
+    edges of a sketch histogram (see SketchAccumulator). The edges always
+    start at 0 and end at 1, and bracket the lowest and highest scores.
+    """
+    edges = np.asarray([0.0] + list(sketch['thresholds']))
+    totals = np.asarray(sketch['totals'], dtype=float)
+    cumulative = np.cumsum(totals)
+    if len(cumulative) == 0 or cumulative[-1] <= 0:
+        return uniform_bin_edges(n_bins)
+
+    # Upper edge of the sketch bin in which each quantile is reached
+    quantiles = cumulative[-1] * np.arange(1, n_bins) / float(n_bins)
+    index = np.searchsorted(cumulative, quantiles, side='left') + 1
+    nonempty = np.flatnonzero(totals)
+    index = np.concatenate([[0, len(edges) - 1, nonempty[0], nonempty[-1]], index])
+    return edges[np.unique(index)].tolist()
+
+
+def rebin_histogram(hist, bin_edges):
+    """
+    Add up the bins of a histogram into coarser ones. Every one of the
+    coarser `bin_edges` must be an edge of the histogram's bins.
+    """
+    edges = [0.0] + list(hist['thresholds'])
+    positions = dict((edge, i) for i, edge in enumerate(edges))
+    starts = [positions[edge] for edge in bin_edges[:-1]]
+    trues = np.add.reduceat(np.asarray(hist['trues']), starts)
+    totals = np.add.reduceat(np.asarray(hist['totals']), starts)
+    return {'thresholds': list(bin_edges[1:]),
+            'trues': trues.tolist(),
+            'totals': totals.tolist()}
+
+
+def bin_index(predicted, bin_edges):
+    """
+    For every score, return the index i of the half-open bin
+    [bin_edges[i], bin_edges[i + 1]) it falls into, or -1 if it isn't in any
+    bin. Scores equal to the last edge (usually 1.0) are not in any bin.
+    """
+    predicted = np.asarray(predicted, dtype=float)
+    edges = np.asarray(bin_edges, dtype=float)
+    n_bins = len(edges) - 1
+    step = (edges[-1] - edges[0]) / n_bins
+    if not np.allclose(np.diff(edges), step):
+        index = np.digitize(predicted, edges) - 1
+    else:
+        # Equal width bins: compute the bin arithmetically instead of with a
+        # binary search, then compare against the neighbouring edges so
+        # rounding can't move a score across an edge.
+        with np.errstate(invalid='ignore'):
+            guess = np.floor((predicted - edges[0]) / step)
+            # fmax/fmin (unlike clip) also map NaN scores to a valid bin;
+            # they are marked as outside all bins below
+            np.fmin(np.fmax(guess, 0, out=guess), n_bins - 1, out=guess)
+            guess = guess.astype(np.intp)
+            index = guess - (predicted < edges[guess])
+            index += predicted >= edges[guess + 1]
+        index[np.isnan(predicted)] = -1
+    index[index >= n_bins] = -1
+    return index
+
+
+def trues_totals(index, n_bins, actual, weight):
+    """
+    Weighted count of the true observations and of all observations in each
+    bin, in a single bincount pass. Observations with index -1 are dropped.
+    """
+    weight = np.asarray(weight)
+    # One cell per (bin, actual) pair, plus two leading cells for index -1
+    cells = (index + 1) * 2 + np.asarray(actual, dtype=bool)
+    counts = np.bincount(cells, weights=np.asarray(weight, dtype=float),
+                         minlength=2 * (n_bins + 1))
+    trues, totals = cells_trues_totals(counts)
+    # Integer weights stay integers
+    if weight.dtype.kind in 'iu':
+        trues, totals = trues.astype(weight.dtype), totals.astype(weight.dtype)
+    return trues, totals
+
+
+def count_cells(index, n_bins, trues, falses):
+    """
+    The (bin, actual) cells of trues_totals, from aggregated rows that are
+    each a number of true and of false observations with the same score,
+    without a row per observation.
+    """
+    trues, falses = np.asarray(trues), np.asarray(falses)
+    minlength = n_bins + 1
+    # Whole numbers of observations stay integers
+    integers = trues.dtype.kind in 'iu' and falses.dtype.kind in 'iu'
+    counts = np.empty(2 * minlength, dtype=np.int64 if integers else float)
+    counts[1::2] = np.bincount(index + 1, weights=np.asarray(trues, dtype=float),
+                               minlength=minlength)
+    counts[::2] = np.bincount(index + 1, weights=np.asarray(falses, dtype=float),
+                              minlength=minlength)
+    return counts
+
+
+def count_row_cells(index, n_bins, actual):
+    # The (bin, actual) cells of trues_totals, counting every row once
+    cells = (index + 1) * 2 + np.asarray(actual, dtype=bool)
+    return np.bincount(cells, minlength=2 * (n_bins + 1))
+
+
+def cells_trues_totals(counts):
+    # (trues, totals) by bin of (bin, actual) cell counts, or of rows of them
+    counts = counts[..., 2:]
+    trues = counts[..., 1::2]
+    return trues, counts[..., ::2] + trues
+
+
+def histogram(bin_edges, predicted, actual, weight):
+    n_bins = len(bin_edges) - 1
+    index = bin_index(predicted, bin_edges)
+    trues, totals = trues_totals(index, n_bins, actual, weight)
+    return {'thresholds': list(bin_edges[1:]),
+            'trues': trues.tolist(),
+            'totals': totals.tolist()}
+
+
+def histograms(bin_edge_sets, predicted, actual, weight):
+    """
+    Build one histogram per list of bin edges, converting the columns to
+    arrays only once.
+    """
+    predicted = np.asarray(predicted, dtype=float)
+    actual = np.asarray(actual, dtype=bool)
+    weight = np.asarray(weight)
+    return [histogram(bin_edges, predicted, actual, weight)
+            for bin_edges in bin_edge_sets]
+
+
+class HistogramAccumulator(object):
+    """
+    Histograms over one or more lists of bin edges, built up from the rows a
+    chunk at a time so the rows never have to be in memory all at once.
+    """
+
+    def __init__(self, bin_edge_sets):
+        self.bin_edge_sets = bin_edge_sets
+        # Empty (float) histograms until the first chunk is added
+        self.trues = [np.zeros(len(bin_edges) - 1) for bin_edges in bin_edge_sets]
+        self.totals = [np.zeros(len(bin_edges) - 1) for bin_edges in bin_edge_sets]
+        self.empty = True
+
+    def add(self, predicted, actual, weight):
+        predicted = np.asarray(predicted, dtype=float)
+        actual = np.asarray(actual, dtype=bool)
+        weight = np.asarray(weight)
+        self.add_histograms([
+            trues_totals(bin_index(predicted, bin_edges), len(bin_edges) - 1, actual, weight)
+            for bin_edges in self.bin_edge_sets])
+
+    def add_counts(self, predicted, trues, falses):
+        # Aggregated rows, of `trues` true and `falses` false observations
+        predicted = np.asarray(predicted, dtype=float)
+        self.add_histograms([
+            cells_trues_totals(count_cells(
+                bin_index(predicted, bin_edges), len(bin_edges) - 1, trues, falses))
+            for bin_edges in self.bin_edge_sets])
+
+    def add_histograms(self, trues_and_totals):
+        for i, (trues, totals) in enumerate(trues_and_totals):
+            if self.empty:
+                self.trues[i], self.totals[i] = trues, totals
+            else:
+                self.trues[i] = self.trues[i] + trues
+                self.totals[i] = self.totals[i] + totals
+        self.empty = False
+
+    def histograms(self):
+        return [{'thresholds': list(bin_edges[1:]),
+                 'trues': trues.tolist(),
+                 'totals': totals.tolist()}
+                for bin_edges, trues, totals in zip(self.bin_edge_sets, self.trues, self.totals)]
+
+
+class SketchAccumulator(object):
+    """
+    A quantile sketch of the scores, built up a chunk of rows at a time, as
+    a histogram whose bins follow the scores. Every bin is a range of cells
+    of 1 / (uniform_bins * SKETCH_CELLS), so a bin has the exact trues and
+    totals of the scores in it, and narrow bins can be found wherever the
+    scores are, however close together. Bins without scores can be split,
+    so sketches merge by adding: only edges inside another sketch's bins
+    with scores are left out. Once there are more than 4 * `max_bins` bins,
+    neighbouring ones are merged into bins of at most about 1 / `max_bins`
+    of the scores, never across the edges of the `uniform_bins` equal width
+    bins, which the sketch can then be added up into too.
+    """
+
+    def __init__(self, uniform_bins, max_bins=SKETCH_BINS):
+        self.uniform_bins = uniform_bins
+        self.max_bins = max_bins
+        self.n_cells = uniform_bins * SKETCH_CELLS
+        # Edges of the bins, in cells, and their trues and totals
+        self.edges = np.arange(uniform_bins + 1, dtype=np.int64) * SKETCH_CELLS
+        self.trues = np.zeros(uniform_bins, dtype=np.int64)
+        self.totals = np.zeros(uniform_bins, dtype=np.int64)
+
+    def add(self, predicted, actual, weight):
+        weight = np.asarray(weight)
+        self.add_cells(predicted, weight * np.asarray(actual, dtype=bool), weight)
+
+    def add_counts(self, predicted, trues, falses):
+        # Aggregated rows, of `trues` true and `falses` false observations
+        trues = np.asarray(trues)
+        self.add_cells(predicted, trues, trues + np.asarray(falses))
+
+    def add_histogram(self, hist):
+        # Merge in a histogram of another sketch with the same uniform bins
+        edges = np.rint(np.asarray([0.0] + list(hist['thresholds'])) * self.n_cells)
+        self.merge(edges.astype(np.int64), np.asarray(hist['trues']),
+                   np.asarray(hist['totals']))
+
+    def add_cells(self, predicted, trues, totals):
+        # Every score in the cell it falls into, which (like in bin_index) is
+        # checked against the cell's edges so rounding can't move it out
+        predicted = np.asarray(predicted, dtype=float)
+        with np.errstate(invalid='ignore'):
+            guess = np.floor(predicted * self.n_cells)
+            np.fmin(np.fmax(guess, 0, out=guess), self.n_cells - 1, out=guess)
+            cell = guess.astype(np.int64)
+            cell -= predicted < guess / self.n_cells
+            cell += predicted >= (guess + 1) / self.n_cells
+            # Like the last edge of any bins, 1.0 isn't in a cell
+            inside = (predicted >= 0) & (predicted < 1) & (cell >= 0) & (cell < self.n_cells)
+        cell = cell[inside]
+        trues, totals = np.asarray(trues)[inside], np.asarray(totals)[inside]
+        # Integer weights stay integers
+        dtype = np.result_type(self.totals, trues, totals, np.int64)
+
+        # Scores in bins that have scores already are added to them. Only
+        # the ones in empty bins are counted by cell, to be merged in.
+        n_bins = len(self.totals)
+        index = np.searchsorted(self.edges, cell, side='right') - 1
+        empty = ((self.totals == 0) & (self.trues == 0))[index]
+        self.trues = self.trues + np.bincount(
+            index, weights=np.where(empty, 0, trues), minlength=n_bins).astype(dtype)
+        self.totals = self.totals + np.bincount(
+            index, weights=np.where(empty, 0, totals), minlength=n_bins).astype(dtype)
+        if not empty.any():
+            return
+        cell, trues, totals = cell[empty], trues[empty], totals[empty]
+
+        cells, index = np.unique(cell, return_inverse=True)
+        cell_trues = np.bincount(index, weights=trues).astype(dtype)
+        cell_totals = np.bincount(index, weights=totals).astype(dtype)
+        # The cells with scores, and the empty bins between them
+        edges = np.column_stack([cells, cells + 1]).ravel()
+        edges = merge_sorted(edges[np.append(True, edges[1:] != edges[:-1])],
+                             self.edges[[0, -1]])
+        bin_trues = np.zeros(len(edges) - 1, dtype=dtype)
+        bin_totals = np.zeros(len(edges) - 1, dtype=dtype)
+        position = np.searchsorted(edges, cells)
+        bin_trues[position], bin_totals[position] = cell_trues, cell_totals
+        self.merge(edges, bin_trues, bin_totals)
+
+    def merge(self, edges, trues, totals):
+        sketches = [(self.edges, self.trues, self.totals), (edges, trues, totals)]
+        # The edges of either sketch that are edges of the other one too, or
+        # inside one of its empty bins
+        merged_edges = merge_sorted(self.edges, edges)
+        keep = np.ones(len(merged_edges), dtype=bool)
+        for sketch_edges, sketch_trues, sketch_totals in sketches:
+            position = np.searchsorted(sketch_edges, merged_edges, side='right') - 1
+            containing = np.minimum(position, len(sketch_totals) - 1)
+            keep &= ((sketch_edges[position] == merged_edges) |
+                     ((sketch_totals[containing] == 0) & (sketch_trues[containing] == 0)))
+        merged_edges = merged_edges[keep]
+
+        # Every bin of a sketch with scores is inside one of the merged bins,
+        # so those add up the sketch's running sums at their edges
+        merged_trues, merged_totals = 0, 0
+        for sketch_edges, sketch_trues, sketch_totals in sketches:
+            position = np.searchsorted(sketch_edges, merged_edges, side='right') - 1
+            merged_trues = merged_trues + np.diff(np.append(0, np.cumsum(sketch_trues))[position])
+            merged_totals = merged_totals + np.diff(
+                np.append(0, np.cumsum(sketch_totals))[position])
+        self.edges, self.trues, self.totals = merged_edges, merged_trues, merged_totals
+        if len(self.totals) > 4 * self.max_bins:
+            self.compress()
+
+    def compress(self):
+        totals = self.totals
+        nonempty = (totals != 0) | (self.trues != 0)
+        # Bins with scores are grouped by the uniform bin they're in and the
+        # 1 / max_bins of the scores they start in
+        before = np.cumsum(totals) - totals
+        group = np.floor(before * float(self.max_bins) / max(totals.sum(), 1))
+        key = (self.edges[:-1] // SKETCH_CELLS) * (self.max_bins + 1) + group
+        # Empty bins are in a group if both the bins with scores next to them
+        # are
+        n_bins = len(totals)
+        last = np.maximum.accumulate(np.where(nonempty, np.arange(n_bins), -1))
+        following = np.minimum.accumulate(
+            np.where(nonempty, np.arange(n_bins), n_bins)[::-1])[::-1]
+        previous_key = np.where(last >= 0, key[np.maximum(last, 0)], -1)
+        next_key = np.where(following < n_bins, key[np.minimum(following, n_bins - 1)], -2)
+        in_group = previous_key == next_key
+        same_uniform_bin = self.edges[1:-1] % SKETCH_CELLS != 0
+        merged = same_uniform_bin & (
+            (~nonempty[:-1] & ~nonempty[1:]) |
+            (in_group[:-1] & in_group[1:] & (previous_key[:-1] == previous_key[1:])))
+        keep = np.concatenate([[True], ~merged, [True]])
+        starts = np.flatnonzero(keep[:-1])
+        self.edges = self.edges[keep]
+        self.trues = np.add.reduceat(self.trues, starts)
+        self.totals = np.add.reduceat(self.totals, starts)
+
+    def histogram(self):
+        return {'thresholds': (self.edges[1:] / float(self.n_cells)).tolist(),
+                'trues': self.trues.tolist(),
+                'totals': self.totals.tolist()}
+
+
+def merge_sorted(a, b):
+    # The distinct values of two sorted arrays, sorted, without sorting again
+    merged = np.empty(len(a) + len(b), dtype=np.result_type(a, b))
+    merged[np.arange(len(a)) + np.searchsorted(b, a)] = a
+    merged[np.arange(len(b)) + np.searchsorted(a, b, side='right')] = b
+    return merged[np.append(True, merged[1:] != merged[:-1])]
+
+
+def merge_sketches(hists, uniform_bins):
+    """
+    The sketch of all the rows of several sketches (see SketchAccumulator),
+    eg. of the parts of a model.
+    """
+    accumulator = SketchAccumulator(uniform_bins)
+    for hist in hists:
+        accumulator.add_histogram(hist)
+    return accumulator.histogram()
+
+
+def segment_trues_totals(segment, n_segments, index, n_bins, actual, weight):
+    """
+    Like trues_totals, but of every segment at once, in a single bincount
+    pass over (segment, bin, actual) cells. Returns (trues, totals) arrays
+    of shape (n_segments, n_bins).
+    """
+    weight = np.asarray(weight)
+    # (n_bins + 1) * 2 cells per segment, the first two for index -1
+    cells = (np.asarray(segment) * (n_bins + 1) + index + 1) * 2 + np.asarray(actual, dtype=bool)
+    counts = np.bincount(cells, weights=np.asarray(weight, dtype=float),
+                         minlength=n_segments * (n_bins + 1) * 2)
+    counts = counts.reshape(n_segments, n_bins + 1, 2)[:, 1:]
+    trues = counts[:, :, 1]
+    totals = counts[:, :, 0] + trues
+    if weight.dtype.kind in 'iu':
+        trues, totals = trues.astype(weight.dtype), totals.astype(weight.dtype)
+    return trues, totals
+
+
+class SegmentHistogramAccumulator(object):
+    """
+    A histogram for every value (segment) of a column, built up a chunk of
+    rows at a time. Segments are named by their values as strings, so they
+    can be JSON keys. Gives up on the column once it has more than
+    `max_segments` values.
+    """
+
+    def __init__(self, n_bins, max_segments=MAX_SEGMENTS):
+        self.n_bins = n_bins
+        self.max_segments = max_segments
+        # segment -> row of trues and totals
+        self.rows = {}
+        self.segments = []
+        self.trues = np.zeros((0, n_bins))
+        self.totals = np.zeros((0, n_bins))
+        self.too_many = False
+
+    def add(self, values, index, actual, weight):
+        # `index` is the bin of every row, as from bin_index
+        if self.too_many:
+            return
+        codes, uniques = pd.factorize(values)
+        rows = []
+        for value in uniques:
+            # read_csv gives byte strings, which may not be ASCII
+            segment = value.decode('utf-8', 'replace') if isinstance(value, str) else unicode(value)
+            if segment not in self.rows:
+                self.rows[segment] = len(self.segments)
+                self.segments.append(segment)
+            rows.append(self.rows[segment])
+        if len(self.segments) > self.max_segments:
+            self.too_many = True
+            self.trues = self.totals = None
+            return
+
+        trues, totals = segment_trues_totals(
+            codes, len(uniques), index, self.n_bins, actual, weight)
+        grow = len(self.segments) - len(self.trues)
+        if grow:
+            self.trues = np.vstack([self.trues, np.zeros((grow, self.n_bins), trues.dtype)])
+            self.totals = np.vstack([self.totals, np.zeros((grow, self.n_bins), totals.dtype)])
+        # Different values can have the same name (eg. 1 and 1.0)
+        np.add.at(self.trues, rows, trues)
+        np.add.at(self.totals, rows, totals)
+
+    def histograms(self):
+        return {'segments': self.segments,
+                'trues': self.trues.tolist(),
+                'totals': self.totals.tolist()}
+
+
+def merge_histograms(hists):
+    """
+    The histogram of all the rows of several histograms with the same bins,
+    eg. of the parts of a model. Trues and totals add up, so it is the same
+    as the histogram of all the rows at once.
+    """
+    trues = np.sum([hist['trues'] for hist in hists], axis=0)
+    totals = np.sum([hist['totals'] for hist in hists], axis=0)
+    return {'thresholds': list(hists[0]['thresholds']),
+            'trues': trues.tolist(),
+            'totals': totals.tolist()}
+
+
+def get_random_state(seed=None):
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    return np.random.RandomState(seed)
+
+
+def bootstrap_trues_totals(index, n_bins, actual, weight, n_samples, seed=None):
+    """
+    Histograms of `n_samples` resamples of the rows with replacement, drawn
+    from the already binned rows. Returns (trues, totals) arrays of shape
+    (n_samples, n_bins).
+
+    When every row has the same weight, resampling rows is the same as a
+    multinomial draw over the (bin, actual) cells, so no per-row work is done
+    per sample. Otherwise each sample is a bincount over resampled row indices.
+    """
+    random_state = get_random_state(seed)
+    weight = np.asarray(weight)
+    n_rows = len(index)
+    n_cells = 2 * (n_bins + 1)
+    # Same cells as trues_totals: rows outside all bins still take part in
+    # the resampling, they just aren't counted.
+    cells = (index + 1) * 2 + np.asarray(actual, dtype=bool)
+
+    if n_rows == 0:
+        counts = np.zeros((n_samples, n_cells), dtype=weight.dtype)
+    elif (weight == weight[0]).all():
+        cell_counts = np.bincount(cells, minlength=n_cells)
+        counts = bootstrap_cells(cell_counts, n_samples, random_state) * weight[0]
+    else:
+        counts = np.empty((n_samples, n_cells), dtype=weight.dtype)
+        for i in xrange(n_samples):
+            rows = random_state.randint(0, n_rows, n_rows)
+            counts[i] = np.bincount(cells[rows], weights=weight[rows],
+                                    minlength=n_cells)
+    return cells_trues_totals(counts)
+
+
+def bootstrap_cells(cell_counts, n_samples, seed=None):
+    """
+    Resamples of the observations counted in `cell_counts` with replacement,
+    as a multinomial draw over the cells: an array of shape (n_samples,
+    cells). Takes the same time however many observations there are, so
+    aggregated rows are bootstrapped observation by observation without
+    a row per observation. The counts are rounded to whole observations.
+    """
+    random_state = get_random_state(seed)
+    n_observations = int(round(np.sum(cell_counts)))
+    if n_observations == 0:
+        return np.zeros((n_samples, len(cell_counts)), dtype=int)
+    probabilities = np.asarray(cell_counts, dtype=float) / np.sum(cell_counts)
+    return random_state.multinomial(n_observations, probabilities, size=n_samples)
@@ -1,55 +1,95 @@
 import numpy as np
 
+# Every metric comes in two flavours: one taking a histogram dict of lists
+# and returning a list (with None where the metric is undefined), and an
+# array version taking `trues` and `totals` arrays of shape (bins,) or
+# (replicates, bins) and returning an array of the same shape, with NaN where
+# the metric is undefined.
+#
+# The array versions accumulate in the same order as a loop over thresholds
+# would, so both flavours give exactly the same numbers.
 
-def recalls(hist):
+
+def to_list(values):
+    # NaN (undefined) becomes None, nested for 2d arrays
+    values = np.asarray(values, dtype=float)
+    if values.ndim > 1:
+        return [to_list(row) for row in values]
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def _total(counts):
+    # Sum over the bins (kept as a trailing axis of length 1)
+    return np.asarray(counts).cumsum(axis=-1)[..., -1:]
+
+
+def _remaining(counts, total=None):
+    # Count at or above each threshold: the total, minus each bin in turn
+    counts = np.asarray(counts)
+    if total is None:
+        total = _total(counts)
+    return np.concatenate([total, -counts[..., :-1]], axis=-1).cumsum(axis=-1)
+
+
+def _divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator != 0, numerator / denominator, np.nan)
+
+
+def recalls_array(trues, totals):
     # true positive rate
     # TP / (TP + FN)
-    ret = []
-    trues = sum(hist['trues'])
-    all_trues = trues
-    for i in range(len(hist['thresholds'])):
-        ret.append(trues * 1.0 / all_trues if all_trues != 0 else None)
-        trues -= hist['trues'][i]
-    return ret
+    remaining_trues = _remaining(trues)
+    return _divide(remaining_trues, remaining_trues[..., :1])
 
 
-def fprs(hist):
+def fprs_array(trues, totals):
     # FP / (FP + TN)
+    all_falses = _total(totals) - _total(trues)
+    remaining_falses = _remaining(np.asarray(totals) - np.asarray(trues), all_falses)
+    return _divide(remaining_falses, remaining_falses[..., :1])
+
+
+def precisions_array(trues, totals):
+    return _divide(_remaining(trues), _remaining(totals))
+
+
+def marginal_precisions_array(trues, totals):
+    return _divide(trues, totals)
+
+
+def logloss_array(thresholds, trues, totals):
+    thresholds = np.asarray(thresholds, dtype=float)
+    trues = np.asarray(trues)
+    falses = np.asarray(totals) - trues
+    with np.errstate(divide='ignore', invalid='ignore'):
+        losses = trues * np.log(thresholds) + falses * np.log(1.0 - thresholds)
+        loss = losses.cumsum(axis=-1)[..., -1]
+        return -loss / _total(totals)[..., 0]
+
+
+def recalls(hist):
+    return to_list(recalls_array(hist['trues'], hist['totals']))
+
+
+def fprs(hist):
     # thresholds is being used as the threshold
     # ones selected that aren't true / all selected
-    ret = []
-    falses = sum(hist['totals']) - sum(hist['trues'])
-    all_falses = falses
-    for i in range(len(hist['thresholds'])):
-        ret.append(falses * 1.0 / all_falses if all_falses != 0 else None)
-        falses -= (hist['totals'][i] - hist['trues'][i])
-    return ret
+    return to_list(fprs_array(hist['trues'], hist['totals']))
 
 
 def precisions(hist):
-    ret = []
-    selected = sum(hist['totals'])
-    trues = sum(hist['trues'])
-    for i in range(len(hist['thresholds'])):
-        ret.append(trues * 1.0 / selected if selected != 0 else None)
-        trues -= hist['trues'][i]
-        selected -= hist['totals'][i]
-    return ret
+    return to_list(precisions_array(hist['trues'], hist['totals']))
 
 
 def marginal_precisions(hist):
-    return map(lambda x: x[0] * 1.0 / x[1] if x[1] != 0 else None, zip(hist['trues'], hist['totals']))
+    return to_list(marginal_precisions_array(hist['trues'], hist['totals']))
 
 
 def logloss(hist):
-    loss = 0.0
-    N = sum(hist['totals'])
-    for i in range(len(hist['thresholds'])):
-        t = hist['trues'][i]
-        f = hist['totals'][i] - t
-        loss += t * \
-            np.log(hist['thresholds'][i]) + f * np.log(1.0 - hist['thresholds'][i])
-    return -loss / N
+    return logloss_array(hist['thresholds'], hist['trues'], hist['totals'])
 
 
 def auc(fprs, tprs):
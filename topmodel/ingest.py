@@ -0,0 +1,157 @@
+# Bulk ingestion of local scores files as models: every file is validated,
+# written to the file system as a model with a columnar copy of its scores,
+# and precomputed, in a pool of worker processes.
+
+import multiprocessing
+import os
+import time
+import traceback
+
+import pandas as pd
+
+from topmodel import columns
+from topmodel import precompute
+from topmodel.model_data import (
+    ACTUALS_FILE, AGGREGATED_COLUMNS, BenchmarkedModelData, ModelData, SCORES_BM_FILE,
+    SCORES_FILE, UNIFORM_BINNING, drop_missing, is_aggregated, score_column)
+from topmodel.precompute import N_BOOTSTRAP_SAMPLES
+
+
+def model_name(path):
+    # fraud_v2.tsv -> fraud_v2, and fraud_v2/scores.tsv -> fraud_v2
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name in [os.path.splitext(SCORES_FILE)[0], os.path.splitext(SCORES_BM_FILE)[0]]:
+        name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return name
+
+
+def validate(df, benchmarked=False):
+    """
+    Raise a ValueError if the scores of a model can't be used: they need a
+    pred_score (or for the alternate format, a score) between 0 and 1, and
+    unless they are benchmarked, actuals (or counts of trues and falses).
+    """
+    scores = score_column(df)
+    if is_aggregated(df):
+        counts = [column for column in AGGREGATED_COLUMNS if column != scores]
+        required = list(AGGREGATED_COLUMNS)
+    else:
+        counts = [column for column in ['weight'] if column in df.columns]
+        required = [scores] if benchmarked else [scores, 'actual']
+    if benchmarked:
+        required.append('id')
+    missing = [column for column in required if column not in df.columns]
+    if missing:
+        raise ValueError("missing columns: %s" % ', '.join(missing))
+    if not len(df):
+        raise ValueError("no scores")
+
+    values = df[scores].values
+    if values.dtype.kind not in 'iuf' or not ((values >= 0) & (values <= 1)).all():
+        raise ValueError("%s isn't a number between 0 and 1 everywhere" % scores)
+    for column in counts:
+        values = df[column].values
+        if values.dtype.kind not in 'iuf' or (values < 0).any():
+            raise ValueError("%s isn't a non-negative number everywhere" % column)
+    if 'actual' in df.columns and not df['actual'].isin([0, 1]).all():
+        raise ValueError("actual isn't True/False (or 1/0) everywhere")
+
+
+def read_scores(path, benchmarked=False):
+    # A local scores file, validated, with the rows whose ids are repeated
+    # dropped (but the last) for a benchmarked model
+    df = drop_missing(pd.read_csv(path, sep='\t'))
+    validate(df, benchmarked=benchmarked)
+    if 'id' in df.columns:
+        df = df.drop_duplicates('id', keep='last')
+    return df
+
+
+def save_model(model_data, df):
+    # The TSV, and a columnar copy of it, which is what's read from then on
+    model_data.save_data_frame(df)
+    columns.write_columns(model_data.file_system, model_data.scores_path(), df)
+
+
+def ingest_model(args):
+    """
+    Runs in a worker process. Returns (model path, rows, seconds, error),
+    with the error, if there was one, as a string.
+    """
+    path, model_path, benchmarked, n_bootstrap_samples, binning = args
+    start = time.time()
+    try:
+        df = read_scores(path, benchmarked=benchmarked)
+        model_class = BenchmarkedModelData if benchmarked else ModelData
+        model_data = model_class(precompute.worker_file_system, model_path, binning=binning)
+        save_model(model_data, df)
+        # Read back from the columns as the server will, which for a
+        # benchmarked model also checks that every score has an actual
+        model_data.unload()
+        # histogram.json also has the top thresholds histogram
+        model_data.to_histogram_format()
+        model_data.to_bootstrap_format(n_bootstrap_samples)
+        return model_path, len(df), time.time() - start, None
+    except Exception:
+        return model_path, 0, time.time() - start, traceback.format_exc()
+
+
+def ingest_actuals(file_system, actuals, directory):
+    # The actuals that the benchmarked models in the directory share
+    df = drop_missing(pd.read_csv(actuals, sep='\t'))
+    missing = [column for column in ['id', 'actual'] if column not in df.columns]
+    if missing:
+        raise ValueError("%s is missing columns: %s" % (actuals, ', '.join(missing)))
+    if not df['actual'].isin([0, 1]).all():
+        raise ValueError("actual isn't True/False (or 1/0) everywhere in %s" % actuals)
+    df = df.drop_duplicates('id', keep='last')
+    actuals_path = os.path.join(directory, ACTUALS_FILE)
+    file_system.write_file(actuals_path, df.to_csv(sep='\t', index=False))
+    columns.write_columns(file_system, actuals_path, df)
+    return len(df)
+
+
+def run(file_system, file_system_factory, paths, directory='', actuals=None, processes=None,
+        n_bootstrap_samples=N_BOOTSTRAP_SAMPLES, binning=UNIFORM_BINNING):
+    """
+    Ingest the local scores files at `paths` as models in `directory`, named
+    after the files, in a pool of `processes` workers (by default one per
+    CPU), printing each model as it's done. With `actuals`, the scores are
+    benchmarked against that file, which is written to the directory first.
+    Returns the paths of the models that failed.
+    """
+    start = time.time()
+    tasks = [(path, os.path.join(directory, model_name(path)), actuals is not None,
+              n_bootstrap_samples, binning) for path in paths]
+    model_paths = [task[1] for task in tasks]
+    repeated = sorted(set(path for path in model_paths if model_paths.count(path) > 1))
+    if repeated:
+        raise ValueError("Several files would be ingested as %s" % ', '.join(repeated))
+    if actuals is not None:
+        print "Wrote %d actuals to %s" % (
+            ingest_actuals(file_system, actuals, directory),
+            os.path.join(directory, ACTUALS_FILE))
+
+    pool = multiprocessing.Pool(processes, precompute.init_worker, (file_system_factory,))
+    failed, total_rows = [], 0
+    try:
+        results = pool.imap_unordered(ingest_model, tasks)
+        for done, (model_path, rows, seconds, error) in enumerate(results, 1):
+            if error is None:
+                total_rows += rows
+                print "[%d/%d] Ingested %s: %d rows in %.1fs" % (
+                    done, len(tasks), model_path, rows, seconds)
+            else:
+                failed.append(model_path)
+                print "[%d/%d] Failed to ingest %s\n%s" % (done, len(tasks), model_path, error)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    elapsed = time.time() - start
+    print "Ingested %d models (%d rows) in %.1fs: %.1f models/s, %.0f rows/s" % (
+        len(tasks) - len(failed), total_rows, elapsed,
+        (len(tasks) - len(failed)) / elapsed, total_rows / elapsed)
+    if failed:
+        print "Failed: %s" % ', '.join(sorted(failed))
+    return failed
@@ -1,23 +1,52 @@
+import collections
+import hashlib
 import io
+import multiprocessing
 import os
 import operator
 import sys
 import json
+import threading
 import time
 
 import pandas as pd
 import numpy as np
 
 from topmodel import hmetrics
+from topmodel import columns
+from topmodel import histogram
+from topmodel import curves
+from topmodel.cache import LRUCache
+from topmodel.catalog import ModelCatalog
+from topmodel.file_system import IteratorFile
 
 THRESHOLD_BINS = 100
 
+# How the THRESHOLD_BINS bins are chosen: equal width, or with equal numbers
+# of scores in each, from a sketch of the distribution of the scores
+UNIFORM_BINNING = 'uniform'
+ADAPTIVE_BINNING = 'adaptive'
+BINNINGS = [UNIFORM_BINNING, ADAPTIVE_BINNING]
+
 SCORES_FILE = 'scores.tsv'
+# Partitioned models have their scores in part files in this directory
+SCORES_DIR = 'scores'
+PART_PREFIX = 'part-'
+PART_HISTOGRAM_SUFFIX = '.histogram.json'
 ACTUALS_FILE = 'actuals.tsv'
 SCORES_BM_FILE = 'scores_bm.tsv'
 
 HISTOGRAM_FILE = 'histogram.json'
-BOOTSTRAP_FILE = 'bootstrap.json'
+# Bootstrap samples are kept per number of samples, since the model page and
+# comparisons draw different numbers of them
+BOOTSTRAP_FILE = 'bootstrap-%d.json'
+CURVES_FILE = 'curves.json'
+SEGMENTS_FILE = 'segments.json'
+# The histograms of every upload (or time window) of a model are kept in
+# this directory as <window>.<upload>.histogram.json, for the drift of its
+# metrics
+HISTORY_DIR = 'history'
+WINDOW_HISTOGRAM_SUFFIX = '.histogram.json'
 NOTES_FILE = "notes.txt"
 METADATA_FILE = "metadata.txt"
 
@@ -26,190 +55,1042 @@ TOP_THRESHOLDS = [0.9, 0.95, 0.99, 0.995, 0.9975, 0.999, 0.9995,
 
 BIN_COUNT = 100
 
+# Columns of scores.tsv that aren't metadata to break the metrics down by
+NON_SEGMENT_COLUMNS = ['actual', 'pred_score', 'weight', 'id']
+# Columns of scores in the alternate, aggregated, format
+AGGREGATED_COLUMNS = ['score', 'trues', 'falses']
+
+# Windows merged into each point of the drift of a model's metrics, and the
+# thresholds its precision and recall are tracked at
+DRIFT_WINDOWS = 7
+DRIFT_THRESHOLDS = [0.5, 0.9]
+
+# Rows of scores.tsv parsed at a time when streaming it
+CHUNK_SIZE = 1000000
+
+# Bump when the contents of histogram.json or the bootstrap files change, so
+# artifacts written by older versions are recomputed
+ARTIFACT_FORMAT_VERSION = 3
+
 
 class ModelDataManager(object):
+    """
+    Catalog of the models in a file system. Meant to live as long as the
+    process: `refresh` lists the file system again and only replaces the
+    ModelData of models whose files changed, so the others keep their parsed
+    data. All the models share one LRU cache, which bounds how much memory
+    their data takes.
 
-    def __init__(self, file_system):
+    A lazy catalog doesn't list the whole file system. It lists a directory
+    at a time as it is browsed, and only the files of the models that are
+    looked at (or the directories searched), each again after `ttl`.
+    """
+
+    def __init__(self, file_system, ttl=None, cache=None, binning=UNIFORM_BINNING,
+                 lazy=False):
         self.file_system = file_system
+        self.ttl = ttl
+        self.binning = binning
+        self.lazy = lazy
+        self.cache = cache if cache is not None else LRUCache()
         self.models = {}
         self.names_and_updated = {}
+        self.versions = {}
+        self.catalog = ModelCatalog()
+        # {directory: when the models in it were last listed}
+        self.discovered = {}
+        self.last_refresh = None
+        self.lock = threading.RLock()
+        # Held while the catalog is listed again because it's stale
+        self.refresh_lock = threading.Lock()
+        if not lazy:
+            self.refresh()
 
-        all_models_with_times = self.file_system.list_name_modified().items()
-        scores_hash, scores_bm_hash = self.get_hash_of_models(all_models_with_times)
+    def refresh(self, directory=''):
+        # Lists the models in a directory (by default all of them) again
+        directory = directory.strip('/')
+        listed = self.file_system.list_name_modified(
+            directory + '/' if directory else '', is_model_file)
+        if directory:
+            # Benchmarked models in the directory may share actuals above it
+            for parent in parent_directories(directory):
+                actuals_path = os.path.join(parent, ACTUALS_FILE)
+                stat = self.file_system.stat(actuals_path)
+                if stat is not None:
+                    listed[actuals_path] = stat[1]
+        all_models_with_times = listed.items()
+        scores_hash, scores_bm_hash, parts_hash = self.get_hash_of_models(all_models_with_times)
+        modified_times = dict(all_models_with_times)
 
-        for filepath, time in scores_hash.items():
+        found = {}
+        for filepath, modified in scores_hash.items():
             basedir, _ = os.path.split(filepath)
-            model_data = ModelData(self.file_system, basedir)
-            self.models[basedir] = model_data
-            self.names_and_updated[basedir] = time
+            found[basedir] = (ModelData, modified, modified)
+
+        for model_path, parts_modified in parts_hash.items():
+            # A model with a scores.tsv uses it rather than any parts
+            if model_path not in found:
+                # Changes whenever any of the parts does
+                version = tuple(sorted(parts_modified.items()))
+                found[model_path] = (PartitionedModelData, max(parts_modified.values()), version)
 
-        for filepath, time in scores_bm_hash.items():
+        for filepath, modified in scores_bm_hash.items():
             model_path, _ = os.path.split(filepath)
-            model_data = BenchmarkedModelData(self.file_system, model_path)
-            self.models[model_path] = model_data
-            self.names_and_updated[model_path] = time
+            # Benchmarked models also change when their actuals do
+            actuals_path = os.path.join(os.path.split(model_path)[0], ACTUALS_FILE)
+            version = (modified, modified_times.get(actuals_path))
+            found[model_path] = (BenchmarkedModelData, modified, version)
+
+        with self.lock:
+            for model_path in set(self.models) - set(found):
+                if is_in_directory(model_path, directory):
+                    self.forget(model_path)
+            for model_path, (model_class, modified, version) in found.items():
+                if self.versions.get(model_path) != version:
+                    self.forget(model_path)
+                    self.models[model_path] = model_class(
+                        self.file_system, model_path, cache=self.cache, modified=version,
+                        binning=self.binning)
+                self.names_and_updated[model_path] = modified
+                self.versions[model_path] = version
+            self.catalog.update(directory, found)
+            self.discovered[directory] = time.time()
+            if not directory:
+                self.last_refresh = self.discovered[directory]
+
+    def refresh_if_stale(self):
+        # A lazy catalog lists each directory again when it's next used.
+        # Only one thread lists the file system again, and the others carry
+        # on with the catalog as it is until it's done.
+        if not self.is_stale() or not self.refresh_lock.acquire(False):
+            return
+        try:
+            # Unless another thread just did
+            if self.is_stale():
+                self.refresh()
+        finally:
+            self.refresh_lock.release()
+
+    def is_stale(self):
+        return not self.lazy and self.ttl is not None and \
+            time.time() - self.last_refresh >= self.ttl
+
+    def invalidate(self):
+        # Lists the models again now, or for a lazy catalog, when next used
+        if self.lazy:
+            with self.lock:
+                self.discovered.clear()
+        else:
+            self.refresh()
+
+    def refresh_removed(self, path):
+        # Lists again only what removing path could have changed: the
+        # models under it, the model it was a file of, or for actuals, the
+        # models sharing them
+        path = path.strip('/')
+        directory = path
+        if os.path.basename(path) == ACTUALS_FILE:
+            directory = os.path.dirname(path)
+        else:
+            with self.lock:
+                containing = [model_path for model_path in self.models
+                              if is_in_directory(path, model_path)]
+            if containing:
+                directory = max(containing, key=len)
+        self.refresh(directory)
+
+    def discover(self, directory):
+        # Lists the models in a directory, unless it (or a directory it's
+        # in) was listed less than ttl seconds ago
+        directory = directory.strip('/')
+        now = time.time()
+        with self.lock:
+            fresh = any(is_in_directory(directory, listed) and
+                        (self.ttl is None or now - when < self.ttl)
+                        for listed, when in self.discovered.items())
+        if not fresh:
+            self.refresh(directory)
+
+    def forget(self, model_path):
+        model_data = self.models.pop(model_path, None)
+        if model_data is not None:
+            model_data.unload()
+        self.names_and_updated.pop(model_path, None)
+        self.versions.pop(model_path, None)
+
+    def get_model(self, model_path):
+        if self.lazy:
+            self.discover(model_path)
+        with self.lock:
+            return self.models[model_path]
+
+    def prefetch(self, model_paths, n_bootstrap_samples=0):
+        """
+        Load the cached histograms (and bootstrap samples) of several models
+        before they are used, with one `read_files` for all of them, which
+        fetches them concurrently from S3.
+        """
+        model_datas = [self.get_model(model_path) for model_path in model_paths]
+        filenames = [HISTOGRAM_FILE]
+        if n_bootstrap_samples:
+            filenames.append(BOOTSTRAP_FILE % n_bootstrap_samples)
+        raw_artifacts = self.file_system.read_files(
+            [os.path.join(model_data.model_path, filename)
+             for model_data in model_datas for filename in filenames])
+        for model_data in model_datas:
+            model_data.load_artifacts(
+                dict((filename, raw_artifacts[os.path.join(model_data.model_path, filename)])
+                     for filename in filenames),
+                n_bootstrap_samples)
 
     def get_hash_of_models(self, all_models_with_times):
         scores_hash, actuals_hash, scores_bm_hash = {}, {}, {}
+        # Files converted to columns count as the TSV they came from, if
+        # that isn't there too
+        keys = set(k for k, _ in all_models_with_times)
+        all_models_with_times = [(columns.tsv_path(k), v) for k, v in all_models_with_times
+                                 if k == columns.tsv_path(k) or columns.tsv_path(k) not in keys]
 
         for k, v in all_models_with_times:
             if k.endswith(SCORES_FILE):
                 scores_hash[k] = v
 
+        # {model path: {part path: modified}} of partitioned models
+        parts_hash = collections.defaultdict(dict)
+        for k, v in all_models_with_times:
+            if is_part(k):
+                parts_hash[os.path.dirname(os.path.dirname(k))][k] = v
+
         for k, v in all_models_with_times:
             if k.endswith(ACTUALS_FILE):
                 actuals_hash[k] = v
-        for path, time in actuals_hash.items():
-            basedir = os.path.split(path)[0]
-            for k, v in self.file_system.list_name_modified(basedir).items():
-                if k.endswith(SCORES_BM_FILE):
-                    scores_bm_hash[k] = v
+        # Benchmarked scores anywhere under an actuals directory, found in
+        # the listing we already have rather than by listing again
+        actuals_dirs = set(os.path.split(path)[0] for path in actuals_hash)
+        for k, v in all_models_with_times:
+            if k.endswith(SCORES_BM_FILE) and \
+                    any(k.startswith(basedir) for basedir in actuals_dirs):
+                scores_bm_hash[k] = v
+
+        return scores_hash, scores_bm_hash, dict(parts_hash)
+
+    def browse(self, directory=''):
+        """
+        (whether the directory is a model, and its entries) for the index of
+        the models, where the entries are `ModelCatalog.children`. A lazy
+        catalog lists just this directory, one level deep (with a delimiter,
+        on S3), so whether its subdirectories are models, and how many
+        models they have, is None until they are browsed.
+        """
+        directory = directory.strip('/')
+        if not self.lazy:
+            return directory in self.catalog, self.catalog.children(directory)
+        files, dirs = self.file_system.list_dir(directory)
+        if SCORES_DIR in dirs or any(is_model_file(name) for name in files):
+            self.discover(directory)
+        prefix = directory + '/' if directory else ''
+        entries = [(prefix + name, True if prefix + name in self.catalog else None, None)
+                   for name in sorted(dirs)]
+        return directory in self.catalog, entries
+
+    def search(self, query, directory=''):
+        # Paths of the models in a directory that contain query
+        if self.lazy:
+            self.discover(directory)
+        return self.catalog.search(query, directory)
+
+
+def is_in_directory(path, directory):
+    # Whether path is the directory or under it, '' being the top
+    return not directory or path == directory or path.startswith(directory + '/')
+
+
+def parent_directories(path):
+    # 'a/b/c' -> ['a/b', 'a', '']
+    parents = []
+    while path:
+        path = os.path.dirname(path)
+        parents.append(path)
+    return parents
+
+
+def is_part(path):
+    # Whether path is a part file of a partitioned model, model/scores/part-*.tsv
+    scores_dir, filename = os.path.split(path)
+    return os.path.basename(scores_dir) == SCORES_DIR and \
+        filename.startswith(PART_PREFIX) and filename.endswith('.tsv')
+
+
+def is_model_file(path):
+    # Whether path is one of the files models are found by (rather than
+    # eg. an artifact), or the columnar copy of one
+    if not path.endswith(('.tsv', columns.SOURCE_FILE)):
+        return False
+    path = columns.tsv_path(path)
+    return os.path.basename(path) in [SCORES_FILE, SCORES_BM_FILE, ACTUALS_FILE] or \
+        is_part(path)
+
+
+def is_aggregated(df):
+    # Whether the scores are in the alternate format, "score,trues,falses":
+    # each row is the number of true and of false observations with a score
+    return 'trues' in df.columns
+
+
+def score_column(df):
+    return 'score' if is_aggregated(df) else 'pred_score'
+
+
+def aggregated_rows(df):
+    """
+    Aggregated rows as rows of the usual format, weighted by their counts:
+    one row for the trues and one for the falses of each, rather than one
+    per observation. Only for what needs rows; histograms and bootstrap
+    samples are drawn from the counts themselves.
+    """
+    rows = pd.concat([df, df], ignore_index=True).drop(AGGREGATED_COLUMNS, axis=1)
+    rows['pred_score'] = np.tile(df['score'].values, 2)
+    rows['actual'] = np.repeat([True, False], len(df))
+    rows['weight'] = np.concatenate([df['trues'].values, df['falses'].values])
+    return rows
+
+
+# The rows of a model binned for its bootstrap when they all weigh the
+# same: the number of rows (or of the observations of aggregated rows) in
+# each (bin, actual) cell of histogram.count_cells, and their weight
+BinnedCells = collections.namedtuple('BinnedCells', ['counts', 'weight'])
+
+
+def bin_chunk(df, bin_edges):
+    # The BinnedCells of a chunk, or if its rows weigh differently, the
+    # (bin index, actual, weight) of every row
+    index = histogram.bin_index(df[score_column(df)], bin_edges)
+    n_bins = len(bin_edges) - 1
+    if is_aggregated(df):
+        return BinnedCells(histogram.count_cells(index, n_bins, df['trues'], df['falses']), 1)
+    actual = np.asarray(df['actual'], dtype=bool)
+    weight = df.get('weight')
+    if weight is None or not len(df) or (weight.values == weight.values[0]).all():
+        return BinnedCells(histogram.count_row_cells(index, n_bins, actual),
+                           1 if weight is None or not len(df) else weight.values[0])
+    return (index.astype(np.int16), actual, weight.values)
+
+
+class RowBinner(object):
+    """
+    Adds up the bin_chunk of every chunk of a model's rows into its
+    binned_rows. While every row weighs the same, that's only the counts of
+    its (bin, actual) cells, in constant memory. With `cells_only`, rows that
+    weigh differently are given up on rather than kept.
+    """
+
+    def __init__(self, n_bins, cells_only=False):
+        self.n_bins = n_bins
+        self.cells_only = cells_only
+        # {weight: counts}
+        self.cells = {}
+        self.rows = []
+        self.varying = False
+
+    @property
+    def constant(self):
+        # Whether the rows so far all weigh the same
+        return not self.varying and len(self.cells) <= 1
 
-        return scores_hash, scores_bm_hash
+    def add(self, binned):
+        if not isinstance(binned, BinnedCells):
+            self.varying = True
+            if not self.cells_only:
+                self.rows.append(binned)
+        elif binned.counts.any():
+            counts = self.cells.get(binned.weight)
+            self.cells[binned.weight] = binned.counts if counts is None else counts + binned.counts
 
-    def search(self, target_model):
-        return filter(lambda model: target_model in model.model_path, self.list())
+    def binned_rows(self):
+        if self.constant:
+            if not self.cells:
+                return BinnedCells(np.zeros(2 * (self.n_bins + 1), dtype=np.int64), 1)
+            [(weight, counts)] = self.cells.items()
+            return BinnedCells(counts, weight)
+        rows = self.rows + [cells_rows(counts, weight) for weight, counts in self.cells.items()]
+        return tuple(np.concatenate(arrays) for arrays in zip(*rows))
+
+
+def cells_rows(counts, weight):
+    # BinnedCells as the (bin index, actual, weight) of a row per row (or
+    # observation) they count
+    cells = np.repeat(np.arange(len(counts)), np.round(counts).astype(np.int64))
+    return ((cells // 2 - 1).astype(np.int16), (cells % 2).astype(bool),
+            np.repeat(float(weight), len(cells)))
+
+
+def drop_missing(df):
+    # df, but without going through every row (or making a
+    # copy) when nothing is missing, which is nearly always
+    missing = np.zeros(len(df), dtype=bool)
+    for _, values in df.iteritems():
+        if values.dtype.kind == 'f':
+            missing |= np.isnan(values.values)
+        elif values.dtype.kind not in 'biu':
+            missing |= pd.isnull(values.values)
+    if missing.any():
+        return df[~missing]
+    return df
+
+
+def tsv_chunks(df, chunk_size):
+    # df as a TSV, chunk_size rows at a time
+    for start in xrange(0, max(len(df), 1), chunk_size):
+        yield df.iloc[start:start + chunk_size].to_csv(
+            sep='\t', index=False, header=start == 0)
+
+
+def row_weights(df):
+    if df.get('weight') is None:
+        return np.ones(len(df))
+    return df['weight'].values
+
+
+def cached_attribute(name):
+    # An attribute kept in the model's cache instead of on the instance, so it
+    # counts towards the cache's memory budget and can be evicted
+    def get(self):
+        return self.cache.get(self.cache_key(name))
+
+    def set(self, value):
+        if value is None:
+            self.cache.pop(self.cache_key(name))
+        else:
+            self.cache.put(self.cache_key(name), value)
+    return property(get, set)
 
 
 class ModelData(object):
+    """
+    The scores of a model, and everything computed from them. Parsed and
+    computed data lives in `cache`, keyed on the model path and `modified`
+    (the modified time of the model's files), so entries for an older upload
+    are never used. Without a cache, the model gets a cache of its own.
+
+    With ADAPTIVE_BINNING, the histogram's bins are chosen from the scores, so
+    that they are narrow where the scores are, and stored with it as its
+    thresholds.
+    """
 
-    def __init__(self, file_system, model_path):
+    CACHED_ATTRIBUTES = ['data_frame', 'binned_rows', 'histogram', 'bootstrap', 'metrics',
+                         'exact_curves', 'segments', 'windows', 'rendered']
+
+    data_frame = cached_attribute('data_frame')
+    binned_rows = cached_attribute('binned_rows')
+    histogram = cached_attribute('histogram')
+    # bootstrap samples, by number of samples
+    bootstrap = cached_attribute('bootstrap')
+    # computed metrics, by number of bootstrap samples ('top' for the top thresholds)
+    metrics = cached_attribute('metrics')
+    exact_curves = cached_attribute('exact_curves')
+    # histograms of the segments of the metadata columns
+    segments = cached_attribute('segments')
+    # [(window, histogram)] of the model's history
+    windows = cached_attribute('windows')
+    # fragments of pages drawn from the metrics, by the pages' options
+    rendered = cached_attribute('rendered')
+
+    def __init__(self, file_system, model_path, cache=None, modified=None,
+                 chunk_size=CHUNK_SIZE, binning=UNIFORM_BINNING):
         self.model_path = model_path
         self.file_system = file_system
-        self.data_frame = None
+        self.cache = cache if cache is not None else LRUCache()
+        self.modified = modified
+        self.chunk_size = chunk_size
+        self.binning = binning
+
+    def cache_key(self, name):
+        return (self.model_path, self.modified, name)
+
+    def unload(self):
+        # Drop everything parsed or computed from the model's files
+        for name in self.CACHED_ATTRIBUTES:
+            setattr(self, name, None)
 
     def metrics_from_hist(self, hist):
-        return {
+        return self.metrics_from_hists(
+            hist['thresholds'], [hist['trues']], [hist['totals']])[0]
+
+    def metrics_from_hists(self, thresholds, trues, totals):
+        # Metrics for each row of the (replicates, bins) trues and totals
+        trues, totals = np.asarray(trues), np.asarray(totals)
+        precisions = hmetrics.to_list(hmetrics.precisions_array(trues, totals))
+        recalls = hmetrics.to_list(hmetrics.recalls_array(trues, totals))
+        fprs = hmetrics.to_list(hmetrics.fprs_array(trues, totals))
+        marginal_precisions = hmetrics.to_list(hmetrics.marginal_precisions_array(trues, totals))
+        loglosses = hmetrics.logloss_array(thresholds, trues, totals).tolist()
+        score_distributions, trues = totals.tolist(), trues.tolist()
+        return [{
             # facts about the histogram
-            'thresholds': hist['thresholds'],
-            'score_distribution': hist['totals'],
-            'trues': hist['trues'],
+            'thresholds': thresholds,
+            'score_distribution': score_distributions[i],
+            'trues': trues[i],
             # 3 main metrics
-            'precisions': hmetrics.precisions(hist),
-            'recalls': hmetrics.recalls(hist),
-            'fprs': hmetrics.fprs(hist),
+            'precisions': precisions[i],
+            'recalls': recalls[i],
+            'fprs': fprs[i],
             # extra metrics
-            'marginal_precisions': hmetrics.marginal_precisions(hist),
+            'marginal_precisions': marginal_precisions[i],
             # single number metrics
-            'logloss': hmetrics.logloss(hist)
-        }
+            'logloss': loglosses[i]
+        } for i in xrange(len(trues))]
 
-    def get_metrics(self, n_bootstrap_samples=0):
-        hist = self.to_histogram_format(resample=False)
-        base = self.metrics_from_hist(hist)
+    def get_metrics(self, n_bootstrap_samples=0, seed=None):
+        metrics = self.metrics or {}
+        if n_bootstrap_samples not in metrics:
+            hist = self.to_histogram_format(resample=False)
+            base = self.metrics_from_hist(hist)
 
-        if n_bootstrap_samples == 0:
-            return base
-        else:
-            bootstrapped = self.to_bootstrap_format(n_bootstrap_samples)
-            return [base] + bootstrapped
+            if n_bootstrap_samples == 0:
+                metrics[n_bootstrap_samples] = base
+            else:
+                bootstrapped = self.to_bootstrap_format(n_bootstrap_samples, seed=seed)
+                metrics[n_bootstrap_samples] = [base] + bootstrapped
+            self.metrics = metrics
+        return metrics[n_bootstrap_samples]
+
+    def to_bootstrap_format(self, n_bootstrap_samples, seed=None):
+        bootstraps = self.bootstrap or {}
+        if n_bootstrap_samples in bootstraps:
+            return bootstraps[n_bootstrap_samples]
 
-    def to_bootstrap_format(self, n_bootstrap_samples):
-        bootstrap_path = os.path.join(self.model_path, BOOTSTRAP_FILE)
-        bootstrap_json = self.file_system.read_file(bootstrap_path)
+        filename = BOOTSTRAP_FILE % n_bootstrap_samples
+        fingerprint = self.fingerprint(n_bootstrap_samples=n_bootstrap_samples, seed=seed)
+        artifact = self.read_artifact(filename, fingerprint)
 
-        if bootstrap_json is None or len(json.loads(bootstrap_json)) != n_bootstrap_samples:
-            bootstrap = []
-            for _ in xrange(n_bootstrap_samples):
-                resampled_hist = self.to_histogram_format(resample=True)
-                bootstrap.append(self.metrics_from_hist(resampled_hist))
+        if artifact is None:
+            thresholds = self.bin_edges()[1:]
+            trues, totals = self.to_bootstrap_histograms(n_bootstrap_samples, seed=seed)
+            bootstrap = self.metrics_from_hists(thresholds, trues, totals)
 
-            self.file_system.write_file(bootstrap_path, json.dumps(bootstrap))
+            self.write_artifact(filename, fingerprint, {'samples': bootstrap})
 
         else:
-            bootstrap = json.loads(bootstrap_json)
+            bootstrap = artifact['samples']
 
+        bootstraps[n_bootstrap_samples] = bootstrap
+        self.bootstrap = bootstraps
         return bootstrap
 
+    def load_artifacts(self, raw_artifacts, n_bootstrap_samples=0):
+        # Use the histogram and bootstrap artifacts read ahead of time, as
+        # {filename: contents}, if they are up to date
+        if self.histogram is None:
+            hist = self.parse_artifact(raw_artifacts.get(HISTOGRAM_FILE), self.fingerprint())
+            if hist is not None:
+                self.histogram = hist
+        bootstraps = self.bootstrap or {}
+        if n_bootstrap_samples and n_bootstrap_samples not in bootstraps:
+            fingerprint = self.fingerprint(n_bootstrap_samples=n_bootstrap_samples, seed=None)
+            artifact = self.parse_artifact(
+                raw_artifacts.get(BOOTSTRAP_FILE % n_bootstrap_samples), fingerprint)
+            if artifact is not None:
+                bootstraps[n_bootstrap_samples] = artifact['samples']
+                self.bootstrap = bootstraps
+
+    def to_bootstrap_histograms(self, n_bootstrap_samples, seed=None):
+        # Resampled (trues, totals) histograms, one row per sample. Each row of
+        # the data frame is only binned once, however many samples are drawn.
+        n_bins = len(self.bin_edges()) - 1
+        binned_rows = self.binned_rows
+        if binned_rows is None:
+            binned_rows = self.bin_rows()
+            self.binned_rows = binned_rows
+
+        if isinstance(binned_rows, BinnedCells):
+            # Rows that weigh the same (and the observations of aggregated
+            # rows) are resampled from their counts by (bin, actual) cell
+            counts = histogram.bootstrap_cells(binned_rows.counts, n_bootstrap_samples, seed=seed)
+            return histogram.cells_trues_totals(counts * binned_rows.weight)
+        index, actual, weight = binned_rows
+        return histogram.bootstrap_trues_totals(
+            index, n_bins, actual, weight, n_bootstrap_samples, seed=seed)
+
+    def bin_rows(self):
+        """
+        The BinnedCells of the rows, or if they weigh differently, the (bin
+        index, actual, weight) of every row, which takes a lot less memory
+        than the data frame.
+        """
+        bin_edges = self.bin_edges()
+        binner = RowBinner(len(bin_edges) - 1)
+        for df in self.iter_chunks(views=True):
+            binner.add(bin_chunk(df, bin_edges))
+        return binner.binned_rows()
+
     def get_top_metrics(self):
-        hist = self.to_histogram_format(resample=False)
-        return self.metrics_from_hist(hist['high_end_hist'])
-
-    def check_alt_format(self):
-        # alternate data format is "score,trues,falses"
-        # here we build the DataFrame to match the old scores.tsv
-        # weights are not supported in the alternate format.
-
-        orig_df = self.data_frame
-        if 'trues' in orig_df.columns:
-            true_df = pd.DataFrame(
-                data={'actual': np.repeat(True, len(orig_df)),
-                      'weight': orig_df['trues'],
-                      'pred_score': orig_df['score']})
-            false_df = pd.DataFrame(
-                data={'actual': np.repeat(False, len(orig_df)),
-                      'weight': orig_df['falses'],
-                      'pred_score': orig_df['score']})
-            self.data_frame = pd.concat([true_df, false_df])
+        metrics = self.metrics or {}
+        if 'top' not in metrics:
+            hist = self.to_histogram_format(resample=False)
+            metrics['top'] = self.metrics_from_hist(hist['high_end_hist'])
+            self.metrics = metrics
+        return metrics['top']
+
+    def get_exact_curves(self):
+        # Exact AUC, average precision and (downsampled) curves, computed
+        # from every score rather than from the histogram
+        exact = self.exact_curves
+        if exact is None:
+            fingerprint = self.fingerprint(curve_resolution=curves.CURVE_RESOLUTION)
+            exact = self.read_artifact(CURVES_FILE, fingerprint)
+            if exact is None:
+                predicted, actual, weight = [], [], []
+                for df in self.iter_chunks():
+                    if is_aggregated(df):
+                        df = aggregated_rows(df)
+                    predicted.append(np.asarray(df['pred_score'], dtype=float))
+                    actual.append(np.asarray(df['actual'], dtype=bool))
+                    weight.append(row_weights(df))
+                exact = curves.exact_curves(np.concatenate(predicted), np.concatenate(actual),
+                                            np.concatenate(weight))
+                self.write_artifact(CURVES_FILE, fingerprint, exact)
+            self.exact_curves = exact
+        return exact
+
+    def get_segment_histograms(self):
+        """
+        The histogram of every segment of every metadata column of the
+        scores (any column other than NON_SEGMENT_COLUMNS), as
+        {'thresholds': [...], 'columns': [{'column': name, 'segments': [...],
+        'trues': [[...]], 'totals': [[...]]}], 'skipped': [name]}, with a row
+        of trues and totals per segment. Columns with too many values to
+        break down are skipped.
+        """
+        segments = self.segments
+        if segments is None:
+            fingerprint = self.fingerprint(max_segments=histogram.MAX_SEGMENTS)
+            segments = self.read_artifact(SEGMENTS_FILE, fingerprint)
+            if segments is None:
+                segments = self.compute_segment_histograms()
+                self.write_artifact(SEGMENTS_FILE, fingerprint, segments)
+            self.segments = segments
+        return segments
+
+    def compute_segment_histograms(self):
+        # One pass over the scores, binning every row once for all columns
+        bin_edges = self.bin_edges()
+        accumulators = None
+        for df in self.iter_chunks():
+            if is_aggregated(df):
+                df = aggregated_rows(df)
+            if accumulators is None:
+                accumulators = collections.OrderedDict(
+                    (column, histogram.SegmentHistogramAccumulator(
+                        len(bin_edges) - 1, max_segments=histogram.MAX_SEGMENTS))
+                    for column in df.columns if column not in NON_SEGMENT_COLUMNS)
+            index = histogram.bin_index(df['pred_score'], bin_edges)
+            actual = np.asarray(df['actual'], dtype=bool)
+            weight = row_weights(df)
+            for column, accumulator in accumulators.items():
+                accumulator.add(df[column].values, index, actual, weight)
+
+        accumulators = accumulators or {}
+        return {
+            'thresholds': list(bin_edges[1:]),
+            'columns': [dict(accumulator.histograms(), column=column)
+                        for column, accumulator in accumulators.items()
+                        if not accumulator.too_many],
+            'skipped': [column for column, accumulator in accumulators.items()
+                        if accumulator.too_many],
+        }
+
+    def get_segment_metrics(self, column):
+        """
+        The metrics of every segment of a metadata column, with its auc, as
+        [(segment, metrics)], largest segment first.
+        """
+        segments = self.get_segment_histograms()
+        for column_hists in segments['columns']:
+            if column_hists['column'] == column:
+                break
+        else:
+            raise KeyError(column)
+
+        if not column_hists['segments']:
+            return []
+        metrics = self.metrics_from_hists(
+            segments['thresholds'], column_hists['trues'], column_hists['totals'])
+        for segment_metrics in metrics:
+            # NaN for a segment without trues or without falses
+            segment_metrics['auc'] = hmetrics.auc(
+                np.array(segment_metrics['fprs'], dtype=float),
+                np.array(segment_metrics['recalls'], dtype=float))
+        sizes = np.sum(column_hists['totals'], axis=1)
+        order = np.argsort(-sizes, kind='mergesort')
+        return [(column_hists['segments'][i], metrics[i]) for i in order]
+
+    def iter_chunks(self, views=False):
+        """
+        Iterate over the scores as data frames of at most `chunk_size` rows,
+        cleaned up like to_data_frame's, streaming them from the file system
+        unless the whole data frame is already in memory. With `views`, rows
+        from a columnar copy are columns.ColumnChunks rather than copies.
+        """
+        df = self.data_frame
+        if df is not None:
+            yield df
+            return
+
+        scores_path = os.path.join(self.model_path, SCORES_FILE)
+        for chunk in self.iter_table_chunks(scores_path, views=views):
+            yield chunk
+
+    def iter_table_chunks(self, path, views=False):
+        # The TSV at path, from its columnar copy if it has an up to date
+        # one, as cleaned up data frames (or ColumnChunks, with `views`) of
+        # at most `chunk_size` rows
+        table_columns = columns.read_columns(self.file_system, path)
+        if table_columns is not None:
+            n_rows = len(table_columns.values()[0])
+            for start in xrange(0, n_rows, self.chunk_size):
+                arrays = collections.OrderedDict(
+                    (name, values[start:start + self.chunk_size])
+                    for name, values in table_columns.items())
+                chunk = columns.ColumnChunk(arrays) if views else pd.DataFrame(arrays)
+                yield drop_missing(chunk)
+            return
+
+        f = self.file_system.open_file(path)
+        try:
+            for chunk in pd.read_csv(f, sep='\t', chunksize=self.chunk_size):
+                yield drop_missing(chunk)
+        finally:
+            f.close()
 
     def to_data_frame(self, **kwargs):
-        if self.data_frame is None:
+        df = self.data_frame
+        if df is None:
             scores_path = os.path.join(self.model_path, SCORES_FILE)
-            csv = self.file_system.read_file(scores_path)
-            with io.BytesIO(csv) as f:
-                self.data_frame = pd.read_csv(f, sep='\t', **kwargs)
-            self.data_frame = self.data_frame.dropna(how='any')
+            df = self.read_table(scores_path, **kwargs)
+            df = drop_missing(df)
+            self.data_frame = df
 
-        self.check_alt_format()
-        return self.data_frame
+        return df
 
     def get_thresholds_trues_totals(self, range_info, bin_list, predicted, actual, weight):
-        trues, totals, thresholds = [], [], []
-        for i in range(range_info):
-            thresholds.append(bin_list[i + 1])
-            obs_in_bin = (predicted >= bin_list[i]) & (predicted < bin_list[i + 1])
-            true_obs_in_bin = obs_in_bin & actual
-            trues.append(np.sum(weight * true_obs_in_bin))
-            totals.append(np.sum(weight * obs_in_bin))
-
-        return {'thresholds': thresholds, 'trues': trues, 'totals': totals}
+        return histogram.histogram(bin_list[:range_info + 1], predicted, actual, weight)
 
     def to_histogram_format(self, resample=False):
         # Build histogram of the data quantized to THRESHOLD_BINS bins
         # that's a O(1) size representation
         # If resample is True, sample the data frame with replacement before making histogram.
-        histogram_path = os.path.join(self.model_path, HISTOGRAM_FILE)
-        histogram_json = self.file_system.read_file(histogram_path)
-        # This will force a recalculation of the histogram using the new key names
-        # and ensure that each page will have a top thresholds view.
-        if histogram_json is None or resample or 'high_end_hist' not in histogram_json:
+        hist = self.histogram
+        if hist is not None and not resample:
+            return hist
+
+        # The cached histogram is only used if it was computed from the current
+        # version of the scores, with the current bins.
+        fingerprint = self.fingerprint()
+        hist = None if resample else self.read_artifact(HISTOGRAM_FILE, fingerprint)
+        if hist is None and resample:
             df = self.to_data_frame()
-            if resample:
-                # resample all rows of data frame with replacement
-                df = df.iloc[np.random.randint(0, len(df), len(df))]
-            actual = df.get('actual')
-            predicted = df.get('pred_score')
-            if df.get('weight') is None:
-                weight = np.ones(len(df))
-            else:
-                weight = df['weight']
-            bin_edges = map(
-                lambda x: x * 1.0 / THRESHOLD_BINS, range(0, THRESHOLD_BINS + 1))
+            if is_aggregated(df):
+                # resample the observations that the rows count
+                trues, totals = self.to_bootstrap_histograms(1)
+                return {'thresholds': list(self.bin_edges()[1:]),
+                        'trues': trues[0].tolist(),
+                        'totals': totals[0].tolist()}
+            # resample all rows of data frame with replacement
+            df = df.iloc[np.random.randint(0, len(df), len(df))]
+            return histogram.histogram(
+                self.bin_edges(), df.get('pred_score'), df.get('actual'), row_weights(df))
+
+        elif hist is None:
+            ret = self.compute_histogram()
+            self.write_artifact(HISTOGRAM_FILE, fingerprint, ret)
+            self.histogram = ret
 
-            top_bins = TOP_THRESHOLDS[:]
-            top_bins.insert(0, 0.0)
+            # Return the histogram bins + corresponding "true" and "total" counts
+            return ret
 
-            ret = self.get_thresholds_trues_totals(THRESHOLD_BINS, bin_edges, predicted, actual, weight)
+        else:
+            self.histogram = hist
+            return hist
 
-            # If it's not a resample, calculate the top thresholds and cache the histogram.
-            if not resample:
-                high_end = self.get_thresholds_trues_totals(len(TOP_THRESHOLDS), top_bins, predicted, actual, weight)
-                ret['high_end_hist'] = high_end
+    def bin_edges(self):
+        # The edges of the histogram's bins
+        if self.binning == UNIFORM_BINNING:
+            return histogram.uniform_bin_edges(THRESHOLD_BINS)
+        return [0.0] + list(self.to_histogram_format()['thresholds'])
 
-                self.file_system.write_file(histogram_path, json.dumps(ret))
+    def compute_histogram(self):
+        # Rows that all weigh the same are counted by (bin, actual) cell for
+        # the bootstrap in the same pass over the scores, rather than parsing
+        # them again for it. Adaptive bins are only known at the end, and
+        # rows that weigh differently are binned one by one, so those are
+        # left to bin_rows.
+        binner = None
+        if self.binning == UNIFORM_BINNING:
+            bin_edges = self.bin_edges()
+            binner = RowBinner(len(bin_edges) - 1, cells_only=True)
 
-            # Return the histogram bins + corresponding "true" and "total" counts
-            return ret
+        def chunks():
+            for df in self.iter_chunks(views=True):
+                if binner is not None and binner.constant:
+                    binner.add(bin_chunk(df, bin_edges))
+                yield df
 
+        hist = self.histogram_of_chunks(chunks())
+        # Every upload's histogram is kept, as a window of the day it was
+        # uploaded, so the history doesn't have to be read again. Unless it's
+        # there already, since histogramming the scores again (eg. after they
+        # were converted, or the actuals changed) mustn't count them twice.
+        if not self.has_upload_window(self.read_window_histograms()):
+            self.write_upload_window(hist)
+        if binner is not None and binner.constant:
+            self.binned_rows = binner.binned_rows()
+        return self.finish_histogram(hist)
+
+    def write_upload_window(self, hist):
+        path = self.upload_path()
+        self.write_window_histogram(upload_window(self.file_system.modified(path)), hist,
+                                    self.upload())
+
+    def has_upload_window(self, windows):
+        upload = self.upload()
+        return any(hist.get('upload') == upload for _, hist in windows)
+
+    def upload_path(self):
+        # The uploaded scores: the TSV, or its columnar copy if only that
+        # was uploaded
+        path = self.scores_path()
+        if self.file_system.stat(path) is None:
+            return columns.source_path(path)
+        return path
+
+    def upload(self):
+        # The (size, version) of the uploaded scores
+        return json.loads(json.dumps(self.file_system.stat(self.upload_path())))
+
+    def window_fingerprint(self):
+        # Windows are only merged with windows binned the same way, which a
+        # fingerprint without any sources checks. It leaves out the artifact
+        # format, so that a new format doesn't lose the history.
+        fingerprint = self.fingerprint([])
+        del fingerprint['format_version']
+        return fingerprint
+
+    def write_window_histogram(self, window, hist, upload=None):
+        artifact = dict(hist, fingerprint=self.window_fingerprint(), upload=upload)
+        self.file_system.write_file(window_histogram_path(self.model_path, window, upload),
+                                    json.dumps(artifact))
+
+    def read_window_histograms(self):
+        # [(window, hist)] of the history, in order of window, with the
+        # upload each is of as its 'upload'. A window several uploads were
+        # made in is there once for each of them.
+        history_dir = os.path.join(self.model_path, HISTORY_DIR)
+        paths = sorted((path for path in self.file_system.list(history_dir)
+                        if os.path.dirname(path) == history_dir and
+                        path.endswith(WINDOW_HISTOGRAM_SUFFIX)),
+                       key=lambda path: (history_window(path), path))
+        raw_artifacts = self.file_system.read_files(paths)
+        fingerprint = self.window_fingerprint()
+        windows = []
+        for path in paths:
+            hist = json.loads(raw_artifacts[path]) if raw_artifacts[path] is not None else None
+            if not isinstance(hist, dict):
+                continue
+            # Windows written before the format was left out
+            window_fingerprint = hist.pop('fingerprint', None)
+            if isinstance(window_fingerprint, dict):
+                window_fingerprint.pop('format_version', None)
+            if window_fingerprint == fingerprint:
+                windows.append((history_window(path), hist))
+        return windows
+
+    def get_window_histograms(self):
+        """
+        The histograms of the model's time windows, as [(window, hist)] in
+        order of window. Windows binned differently from the model now are
+        left out.
+        """
+        windows = self.windows
+        if windows is None:
+            windows = self.compute_window_histograms()
+            self.windows = windows
+        return windows
+
+    def compute_window_histograms(self):
+        # A new upload is histogrammed (and its window written) first
+        self.to_histogram_format()
+        windows = self.read_window_histograms()
+        if not self.has_upload_window(windows):
+            # Histogrammed before the history was kept (or binned differently)
+            self.write_upload_window(self.histogram_of_chunks(self.iter_chunks(views=True)))
+            windows = self.read_window_histograms()
+        for _, hist in windows:
+            hist.pop('upload', None)
+        return windows
+
+    def get_drift(self, n_windows=DRIFT_WINDOWS, thresholds=DRIFT_THRESHOLDS):
+        """
+        Metrics over a rolling window of `n_windows` time windows, ending at
+        every window in turn, from the windows' merged histograms, without
+        reading any scores. The precisions and recalls are at the bin edge at
+        or below each of `thresholds`. Undefined metrics are None.
+        """
+        # The uploads made in the same window are added up
+        merged = collections.OrderedDict()
+        for window, hist in self.get_window_histograms():
+            hist = self.uniform_histogram(hist)
+            if window in merged:
+                hist = {'trues': np.add(merged[window]['trues'], hist['trues']),
+                        'totals': np.add(merged[window]['totals'], hist['totals'])}
+            merged[window] = hist
+        windows, hists = merged.keys(), merged.values()
+        bin_edges = histogram.uniform_bin_edges(THRESHOLD_BINS)
+        # Rolling sums, as differences of the running sums
+        trues = np.cumsum([[0.0] * THRESHOLD_BINS] + [hist['trues'] for hist in hists], axis=0)
+        totals = np.cumsum([[0.0] * THRESHOLD_BINS] + [hist['totals'] for hist in hists], axis=0)
+        starts = np.maximum(np.arange(len(hists)) + 1 - n_windows, 0)
+        trues, totals = trues[1:] - trues[starts], totals[1:] - totals[starts]
+
+        precisions = hmetrics.precisions_array(trues, totals)
+        recalls = hmetrics.recalls_array(trues, totals)
+        fprs = hmetrics.fprs_array(trues, totals)
+        # Every score is taken to be the middle of its bin, since the upper
+        # edge of the last bin (1.0) makes the loss of any false infinite
+        midpoints = (np.array(bin_edges[:-1]) + np.array(bin_edges[1:])) / 2
+        loglosses = hmetrics.logloss_array(midpoints, trues, totals)
+        index = np.clip(np.searchsorted(bin_edges, thresholds, side='right') - 1,
+                        0, THRESHOLD_BINS - 1)
+        return [{
+            'window': windows[i],
+            'first_window': windows[starts[i]],
+            'count': float(totals[i].sum()),
+            'trues': float(trues[i].sum()),
+            'auc': hmetrics.to_list([hmetrics.auc(fprs[i], recalls[i])])[0],
+            'logloss': hmetrics.to_list([loglosses[i]])[0],
+            'precisions': hmetrics.to_list(precisions[i, index]),
+            'recalls': hmetrics.to_list(recalls[i, index]),
+        } for i in xrange(len(hists))]
+
+    def uniform_histogram(self, hist):
+        # A histogram binned like this model's, in the uniform bins
+        if self.binning == UNIFORM_BINNING:
+            return hist
+        return histogram.rebin_histogram(hist, histogram.uniform_bin_edges(THRESHOLD_BINS))
+
+    def histogram_of_chunks(self, chunks):
+        # Calculate the top thresholds in the same pass over the scores,
+        # streaming them a chunk at a time. With adaptive binning, the scores
+        # are histogrammed into the bins of a sketch, which finish_histogram
+        # then adds up into the final bins.
+        bin_sets = [histogram.top_bin_edges(TOP_THRESHOLDS)]
+        if self.binning == UNIFORM_BINNING:
+            bin_sets.append(histogram.uniform_bin_edges(THRESHOLD_BINS))
+            accumulators = [histogram.HistogramAccumulator(bin_sets)]
         else:
-            return json.loads(histogram_json)
+            accumulators = [histogram.HistogramAccumulator(bin_sets),
+                            histogram.SketchAccumulator(THRESHOLD_BINS)]
+        for df in chunks:
+            for accumulator in accumulators:
+                if is_aggregated(df):
+                    accumulator.add_counts(df['score'], df['trues'], df['falses'])
+                else:
+                    accumulator.add(df.get('pred_score'), df.get('actual'), row_weights(df))
+        hists = accumulators[0].histograms()
+        ret = hists[1] if len(hists) > 1 else accumulators[1].histogram()
+        ret['high_end_hist'] = hists[0]
+        return ret
+
+    def finish_histogram(self, hist):
+        if self.binning == UNIFORM_BINNING:
+            return hist
+        bin_edges = histogram.quantile_bin_edges(hist, THRESHOLD_BINS)
+        ret = histogram.rebin_histogram(hist, bin_edges)
+        ret['high_end_hist'] = hist['high_end_hist']
+        return ret
+
+    def read_table(self, path, **kwargs):
+        # A TSV, from its columnar copy if it has an up to date one
+        table_columns = columns.read_columns(self.file_system, path)
+        if table_columns is not None:
+            return pd.DataFrame(table_columns)
+        # Parse from a file-like object rather than reading the whole file
+        # into a string first
+        f = self.file_system.open_file(path)
+        try:
+            return pd.read_csv(f, sep='\t', **kwargs)
+        finally:
+            f.close()
+
+    def source_files(self):
+        # The TSVs everything about the model is computed from
+        return [os.path.join(self.model_path, SCORES_FILE)]
+
+    def source_paths(self, source_files=None):
+        # The source files and their columnar copies
+        if source_files is None:
+            source_files = self.source_files()
+        return [path for source_file in source_files
+                for path in [source_file, columns.source_path(source_file)]]
+
+    def save_columns(self):
+        # Convert the source files to columns, next to them
+        for path in self.source_files():
+            if self.file_system.stat(path) is not None:
+                csv = self.file_system.read_file(path)
+                with io.BytesIO(csv) as f:
+                    columns.write_columns(self.file_system, path, pd.read_csv(f, sep='\t'))
+
+    def fingerprint(self, source_files=None, **settings):
+        """
+        Identifies the inputs of a cached artifact: the size and version of
+        every source file (by default all of the model's), the bins, the
+        artifact format, and any `settings` specific to the artifact.
+        Normalized to what it looks like after a round trip through JSON, so
+        it can be compared with a stored one.
+        """
+        fingerprint = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'sources': dict((path, self.file_system.stat(path))
+                            for path in self.source_paths(source_files)),
+            'threshold_bins': THRESHOLD_BINS,
+            'top_thresholds': TOP_THRESHOLDS,
+        }
+        if self.binning != UNIFORM_BINNING:
+            # Artifacts of uniformly binned models stay valid
+            fingerprint['binning'] = self.binning
+        fingerprint.update(settings)
+        return json.loads(json.dumps(fingerprint))
+
+    def read_artifact(self, filename, fingerprint):
+        raw = self.file_system.read_file(os.path.join(self.model_path, filename))
+        return self.parse_artifact(raw, fingerprint)
+
+    def parse_artifact(self, raw, fingerprint):
+        # A cached artifact, or None if it is missing or was computed from
+        # different inputs
+        if raw is None:
+            return None
+        artifact = json.loads(raw)
+        if not isinstance(artifact, dict) or artifact.pop('fingerprint', None) != fingerprint:
+            return None
+        return artifact
+
+    def write_artifact(self, filename, fingerprint, artifact):
+        artifact = dict(artifact, fingerprint=fingerprint)
+        self.file_system.write_file(os.path.join(self.model_path, filename),
+                                    json.dumps(artifact))
+
+    def scores_path(self):
+        # Where the model's own scores are saved
+        return os.path.join(self.model_path, SCORES_FILE)
 
     def save_data_frame(self, df):
+        self.unload()
         self.data_frame = df
-        with io.BytesIO() as f:
-            df.to_csv(f, sep='\t', index=False)
-            scores_path = os.path.join(self.model_path, SCORES_FILE)
-            self.file_system.write_file(scores_path, f.getvalue())
+        # Stream the TSV to the file system as it is generated, rather than
+        # building all of it in memory first
+        self.file_system.write_file(self.scores_path(),
+                                    IteratorFile(tsv_chunks(df, self.chunk_size)))
 
     def get_metadata(self):
         metadata_path = os.path.join(self.model_path, METADATA_FILE)
@@ -232,26 +1113,199 @@ class BenchmarkedModelData(ModelData):
     a matching 'id' column' and 'pred_scores' column. Throws an error
     if the scores and actuals do not completely line up.
     """
+    def source_files(self):
+        return [self.actuals_path(),
+                os.path.join(self.model_path, SCORES_BM_FILE)]
+
+    def scores_path(self):
+        return os.path.join(self.model_path, SCORES_BM_FILE)
+
+    def iter_chunks(self, views=False):
+        # The scores have to be joined with the actuals, so aren't streamed
+        yield self.to_data_frame()
+
+    def actuals_path(self):
+        basedir, _ = os.path.split(self.model_path)
+        return os.path.join(basedir, ACTUALS_FILE)
+
     def indexed_data_frame(self, path, **kwargs):
-        raw = self.file_system.read_file(path)
-        with io.BytesIO(raw) as f:
-            df = pd.read_csv(f, sep='\t', index_col=False, **kwargs)
-        assert df.duplicated('id').sum() == 0, "id column is not unique"
-        return df.set_index('id')
+        df = self.read_table(path, index_col=False, **kwargs).set_index('id')
+        # Checked with the index's hash table, which later lookups reuse
+        assert df.index.is_unique, "id column is not unique"
+        return df
+
+    def indexed_actuals(self, **kwargs):
+        # The actuals are shared by every model in the directory, so they
+        # are cached under the actuals file (and its modified time, for
+        # models from a ModelDataManager) rather than under the model
+        actuals_path = self.actuals_path()
+        if kwargs:
+            return self.indexed_data_frame(actuals_path, **kwargs)
+        actuals_modified = self.modified[1] if isinstance(self.modified, tuple) else None
+        key = (actuals_path, actuals_modified, 'indexed_actuals')
+        df = self.cache.get(key)
+        if df is None:
+            df = self.indexed_data_frame(actuals_path)
+            self.cache.put(key, df)
+        return df
 
     def to_data_frame(self, **kwargs):
-        if self.data_frame is None:
-            basedir, _ = os.path.split(self.model_path)
-            actuals_path = os.path.join(basedir, ACTUALS_FILE)
-            df_actuals = self.indexed_data_frame(actuals_path, **kwargs)
+        df = self.data_frame
+        if df is None:
+            df_actuals = self.indexed_actuals(**kwargs)
             scores_path = os.path.join(self.model_path, SCORES_BM_FILE)
             df_scores = self.indexed_data_frame(scores_path, **kwargs)
-            assert sorted(df_actuals.index) == sorted(df_scores.index), \
+
+            # Both indexes are unique, so they hold the same ids if they are
+            # the same length and every score has an actual
+            if df_actuals.index.equals(df_scores.index):
+                indexer = None
+            else:
+                indexer = df_actuals.index.get_indexer(df_scores.index)
+            assert len(df_actuals) == len(df_scores) and \
+                (indexer is None or (indexer >= 0).all()), \
                 "Indices for actuals and scores do not match"
 
-            self.data_frame = pd.merge(
-                df_actuals, df_scores, left_index=True, right_index=True)
-            self.data_frame = self.data_frame.dropna(how='any')
+            # Same as merging on the index, in the order of the scores
+            df = df_scores
+            for i, name in enumerate(df_actuals.columns):
+                values = df_actuals[name].values
+                df.insert(i, name, values if indexer is None else values.take(indexer))
+            df = drop_missing(df)
+            self.data_frame = df
+
+        return df
+
+
+def part_histogram(model_path_part_path_and_binning):
+    # Runs in a worker process, started with precompute.init_worker.
+    # precompute imports this module, so it can only be imported once this
+    # module has been.
+    from topmodel import precompute
+    model_path, part_path, binning = model_path_part_path_and_binning
+    model_data = PartitionedModelData(precompute.worker_file_system, model_path,
+                                      binning=binning)
+    return model_data.compute_part_histogram(part_path)
+
+
+class PartitionedModelData(ModelData):
+    """
+    Model data stored in part files, `scores/part-*.tsv` (or their columnar
+    copies), eg. one for every shard of a scoring job. Every part has a
+    histogram artifact of its own next to it. Trues and totals add up, so the
+    model's histogram is the sum of its parts', and only the parts that
+    changed are histogrammed again, in parallel in `processes` worker
+    processes (by default one per CPU). With adaptive binning, the parts'
+    histograms are sketches, and the bins are chosen once they are merged.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.processes = kwargs.pop('processes', None)
+        super(PartitionedModelData, self).__init__(*args, **kwargs)
+
+    def source_files(self):
+        scores_dir = os.path.join(self.model_path, SCORES_DIR)
+        paths = set(columns.tsv_path(path) for path in self.file_system.list(scores_dir))
+        return sorted(path for path in paths
+                      if is_part(path) and os.path.dirname(path) == scores_dir)
+
+    def iter_chunks(self, views=False):
+        df = self.data_frame
+        if df is not None:
+            yield df
+            return
+        for part_path in self.source_files():
+            for chunk in self.iter_table_chunks(part_path, views=views):
+                yield chunk
+
+    def to_data_frame(self, **kwargs):
+        df = self.data_frame
+        if df is None:
+            df = pd.concat([self.read_table(part_path, **kwargs)
+                            for part_path in self.source_files()], ignore_index=True)
+            df = drop_missing(df)
+            self.data_frame = df
+
+        return df
+
+    def compute_histogram(self):
+        hists = [hist for _, hist in self.histograms_of_parts()]
+        if self.binning == UNIFORM_BINNING:
+            ret = histogram.merge_histograms(hists)
+        else:
+            ret = histogram.merge_sketches(hists, THRESHOLD_BINS)
+        ret['high_end_hist'] = histogram.merge_histograms(
+            [hist['high_end_hist'] for hist in hists])
+        return self.finish_histogram(ret)
+
+    def histograms_of_parts(self):
+        # [(part path, histogram)], histogramming only the stale parts
+        part_paths = self.source_files()
+        raw_artifacts = self.file_system.read_files(
+            [part_histogram_path(part_path) for part_path in part_paths])
+        hists = dict(
+            (part_path, self.parse_artifact(raw_artifacts[part_histogram_path(part_path)],
+                                            self.fingerprint([part_path])))
+            for part_path in part_paths)
+        stale = [part_path for part_path in part_paths if hists[part_path] is None]
+        hists.update(zip(stale, self.part_histograms(stale)))
+        return [(part_path, hists[part_path]) for part_path in part_paths]
+
+    def compute_window_histograms(self):
+        # Every part is a window, eg. part-2017-01-31.tsv of 2017-01-31, so
+        # adding a day only histograms that day's part
+        return [(part_window(part_path), hist) for part_path, hist in self.histograms_of_parts()]
+
+    def part_histograms(self, part_paths):
+        # Pool workers are daemons, which can't start processes of their own,
+        # so in one (eg. precomputing the model) the parts are histogrammed
+        # one after another
+        processes = min(self.processes or multiprocessing.cpu_count(), len(part_paths))
+        if processes <= 1 or multiprocessing.current_process().daemon:
+            return [self.compute_part_histogram(part_path) for part_path in part_paths]
+        from topmodel import precompute
+        # The workers are forked, so they can be handed this file system
+        file_system = self.file_system
+        pool = multiprocessing.Pool(processes, precompute.init_worker, (lambda: file_system,))
+        try:
+            return pool.map(part_histogram,
+                            [(self.model_path, part_path, self.binning)
+                             for part_path in part_paths])
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def compute_part_histogram(self, part_path):
+        hist = self.histogram_of_chunks(self.iter_table_chunks(part_path, views=True))
+        artifact = dict(hist, fingerprint=self.fingerprint([part_path]))
+        self.file_system.write_file(part_histogram_path(part_path), json.dumps(artifact))
+        return hist
+
+
+def upload_window(modified=None):
+    # The window of an upload: the (UTC) day it was uploaded, given when the
+    # scores were modified
+    return time.strftime('%Y-%m-%d', time.gmtime(modified))
+
+
+def window_histogram_path(model_path, window, upload=None):
+    # history/<window>.<upload>.histogram.json, where <upload> tells the
+    # uploads in a window apart
+    if upload is not None:
+        window += '.' + hashlib.sha1(json.dumps(upload)).hexdigest()[:12]
+    return os.path.join(model_path, HISTORY_DIR, window + WINDOW_HISTOGRAM_SUFFIX)
+
+
+def history_window(path):
+    # history/2017-01-31.<upload>.histogram.json -> 2017-01-31
+    return os.path.basename(path)[:-len(WINDOW_HISTOGRAM_SUFFIX)].split('.')[0]
+
+
+def part_window(part_path):
+    # scores/part-2017-01-31.tsv -> 2017-01-31
+    return os.path.splitext(os.path.basename(part_path))[0][len(PART_PREFIX):]
+
 
-        self.check_alt_format()
-        return self.data_frame
+def part_histogram_path(part_path):
+    # scores/part-00000.tsv -> scores/part-00000.histogram.json
+    return os.path.splitext(part_path)[0] + PART_HISTOGRAM_SUFFIX
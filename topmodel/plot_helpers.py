@@ -49,19 +49,19 @@ def plot_boxplot(vals, label):
     fig, ax = plt.subplots()
     ax.boxplot(vals)
     plt.setp(ax, xticklabels=label)
-    return save_image()
+    return save_image(fig)
 
 
 def plot_scatter(x, y, xlabel, ylabel, ax=None):
     if ax is None:
         fig, ax = plt.subplots()
     ax.scatter(x, y, marker="o", color="purple")
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.xlim((0.0, 1.0))
-    plt.ylim((0.0, 1.0))
-    plt.tight_layout()
-    return save_image()
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_xlim((0.0, 1.0))
+    ax.set_ylim((0.0, 1.0))
+    ax.figure.tight_layout()
+    return save_image(ax.figure)
 
 
 def plot_xy(xs, ys, thresholds, xlabel, ylabel, labels=True, labels_left=False,
@@ -73,15 +73,15 @@ def plot_xy(xs, ys, thresholds, xlabel, ylabel, labels=True, labels_left=False,
 
     ax.plot(xs, ys, '-o', **plot_kwargs)
     if xlim is not None:
-        plt.xlim(*xlim)
+        ax.set_xlim(*xlim)
     if ylim is not None:
-        plt.ylim(*ylim)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
+        ax.set_ylim(*ylim)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
     if labels:
         draw_labels(ax, xs, ys, thresholds, labels_left=labels_left)
-    plt.tight_layout()
-    return save_image()
+    ax.figure.tight_layout()
+    return save_image(ax.figure)
 
 
 def pretty_point(coord):
@@ -109,75 +109,97 @@ def plot_xy_bootstrapped(xs, ys, thresholds, xlabel, ylabel, labels=False, label
         plugins.connect(fig, plugins.PointHTMLTooltip(scatter[0], label_text))
     if labels:
         draw_labels(ax, xs_, ys_, thresholds_, labels_left=labels_left)
-    plt.xlim(0, 1)
-    plt.ylim(0, 1)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.tight_layout()
+    # The axes' own methods rather than pyplot's, since a figure drawn on
+    # again (eg. one curve per model) has been closed by save_image
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.tight_layout()
     if label is not None:
         handles, labels = ax.get_legend_handles_labels()
         ax.legend(handles[::-1], labels[::-1], loc='best')
-    return save_image()
+    return save_image(fig)
+
+
+def plot_xy_exact(xs, ys, thresholds, xlabel, ylabel):
+    # The whole of a (downsampled) exact curve, with tooltips only on the
+    # points that are far enough apart to read
+    xs, ys = np.array(xs, dtype=float), np.array(ys, dtype=float)
+    fig, ax = plt.subplots()
+    ax.plot(xs, ys, '-', color='b')
+    return plot_xy_bootstrapped([xs], [ys], thresholds, xlabel, ylabel,
+                                ax=ax, fig=fig, color='b')
+
+
+def bin_lefts_widths(thresholds):
+    # The lower edge and width of every bin of a histogram, from its
+    # thresholds (upper edges), which aren't evenly spaced with adaptive bins
+    bin_edges = np.concatenate([[0.0], thresholds])
+    return bin_edges[:-1], np.diff(bin_edges)
 
 
 def plot_scores_histogram_log(thresholds, all_counts, xlabel, true_counts=None, ax=None):
-    plt.figure()
-    # First graph
     if ax is None:
         _, ax = plt.subplots()
-    width = (thresholds[1] - thresholds[0]) / 2
-    offset = [i + width for i in thresholds]
+    lefts, width = bin_lefts_widths(thresholds)
+    width = width / 2
+    offset = lefts + width
     if true_counts is not None:
         falses = [i - j for i, j in zip(all_counts, true_counts)]
-        plt.bar(offset, falses, width=width,
-                log=True, label="False items")
-        plt.bar(thresholds, true_counts, width=width,
-                log=True, color="purple", label="True items")
+        ax.bar(offset, falses, width=width,
+               log=True, label="False items")
+        ax.bar(lefts, true_counts, width=width,
+               log=True, color="purple", label="True items")
     else:
-        plt.bar(thresholds, all_counts, width=width,
-                log=True, color="purple", label="All items")
-    plt.grid(False)
+        ax.bar(lefts, all_counts, width=width,
+               log=True, color="purple", label="All items")
+    ax.grid(False)
     ax.yaxis.set_major_formatter(matplotlib.ticker.ScalarFormatter())
     ax.yaxis.get_major_formatter().set_scientific(False)
-    # Write to image
-    image_data = StringIO()
-    plt.xlim((0.0, 1.0))
-    plt.xlabel(xlabel)
-    plt.legend(loc='best')
-    plt.savefig(image_data, format='svg')
-    image_data.seek(0)
-    return image_data
+    ax.set_xlim((0.0, 1.0))
+    ax.set_xlabel(xlabel)
+    ax.legend(loc='best')
+    return save_svg(ax.figure)
 
 
 def plot_absolute_score_histogram(thresholds, all_counts, xlabel, true_counts=None, ax=None):
-    plt.figure()
-    # First graph
     if ax is None:
         _, ax = plt.subplots()
-    width = (thresholds[1] - thresholds[0]) / 2
-    offset = [i + width for i in thresholds]
+    lefts, width = bin_lefts_widths(thresholds)
+    width = width / 2
+    offset = lefts + width
     if true_counts is not None:
         falses = [i - j for i, j in zip(all_counts, true_counts)]
-        plt.bar(offset, falses , width=width,
-                log=False, label="False items")
-        plt.bar(thresholds, true_counts, width=width,
-                log=False, color="purple", label="True items")
+        ax.bar(offset, falses, width=width,
+               log=False, label="False items")
+        ax.bar(lefts, true_counts, width=width,
+               log=False, color="purple", label="True items")
     else:
-        plt.bar(thresholds, all_counts, width=width,
-                log=False, color="purple", label="All items")
-    plt.grid(False)
-    # Write to image
+        ax.bar(lefts, all_counts, width=width,
+               log=False, color="purple", label="All items")
+    ax.grid(False)
+    ax.set_xlim((0.0, 1.0))
+    ax.set_xlabel(xlabel)
+    ax.legend(loc='best')
+    return save_svg(ax.figure)
+
+
+def save_image(fig=None):
+    # The figure (by default the current one) as mpld3 HTML. The figure is
+    # closed, or pyplot would keep every figure the server ever drew.
+    if fig is None:
+        fig = plt.gcf()
     image_data = StringIO()
-    plt.xlim((0.0, 1.0))
-    plt.xlabel(xlabel)
-    plt.legend(loc='best')
-    plt.savefig(image_data, format='svg')
+    save_html(fig, image_data)
+    plt.close(fig)
     image_data.seek(0)
     return image_data
 
 
-def save_image(ax=None):
+def save_svg(fig):
     image_data = StringIO()
-    save_html(plt.gcf(), image_data)
+    fig.savefig(image_data, format='svg')
+    plt.close(fig)
     image_data.seek(0)
     return image_data
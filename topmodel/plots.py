@@ -1,3 +1,6 @@
+import collections
+import json
+
 import numpy as np
 import pandas as pd
 
@@ -17,6 +20,18 @@ def _metrics_table(cached_data):
     return table
 
 
+def _drift_table(drift, thresholds):
+    columns = collections.OrderedDict([
+        ('Window', [point['window'] for point in drift]),
+        ('Count', [point['count'] for point in drift]),
+        ('AUC', [point['auc'] for point in drift]),
+        ('Log loss', [point['logloss'] for point in drift])])
+    for i, threshold in enumerate(thresholds):
+        columns['Precision at %s' % threshold] = [point['precisions'][i] for point in drift]
+        columns['Recall at %s' % threshold] = [point['recalls'][i] for point in drift]
+    return pd.DataFrame(columns).set_index('Window')
+
+
 def utf8_decode(image_data):
     return image_data.read().decode('utf-8')
 
@@ -41,6 +56,36 @@ def roc_curve(cached_data, ax=None, fig=None, label=None):
     return utf8_decode(image_data)
 
 
+def _compact(values):
+    # 4 decimals are plenty for plotting, and a lot shorter
+    return [None if value is None else round(value, 4) for value in values]
+
+
+def curves_json(cached_data):
+    """
+    The precision/recall and ROC curves of the metrics (the first one, then
+    any bootstrap samples) as compact JSON, for curves.js to draw.
+    """
+    return json.dumps({
+        'thresholds': _compact(cached_data[0]['thresholds']),
+        'precisions': [_compact(x['precisions']) for x in cached_data],
+        'recalls': [_compact(x['recalls']) for x in cached_data],
+        'fprs': [_compact(x['fprs']) for x in cached_data],
+    }, separators=(',', ':'))
+
+
+def exact_precision_recall_curve(exact):
+    image_data = plot_helpers.plot_xy_exact(
+        exact['precisions'], exact['recalls'], exact['thresholds'], 'precision', 'recall')
+    return utf8_decode(image_data)
+
+
+def exact_roc_curve(exact):
+    image_data = plot_helpers.plot_xy_exact(
+        exact['fprs'], exact['recalls'], exact['thresholds'], 'false positive', 'true positive')
+    return utf8_decode(image_data)
+
+
 def marginal_precision_curve(cached_data):
     image_data = plot_helpers.plot_scatter(
         cached_data['thresholds'], cached_data['marginal_precisions'], 'predicted', 'actual')
@@ -49,8 +94,8 @@ def marginal_precision_curve(cached_data):
 
 def thresholds_graph(cached_data):
     table = _metrics_table(cached_data)
-    table.plot(secondary_y='N Predicted')
-    image_data = plot_helpers.save_image()
+    ax = table.plot(secondary_y='N Predicted')
+    image_data = plot_helpers.save_image(ax.figure)
     return utf8_decode(image_data)
 
 
@@ -75,3 +120,20 @@ def absolute_score_distribution(cached_data):
         'Score',
         true_counts=cached_data['trues'])
     return utf8_decode(image_data)
+
+
+def drift_graph(drift, thresholds):
+    table = _drift_table(drift, thresholds).drop('Count', axis=1)
+    # Windows as positions, since the plots can't have text on the x axis
+    table = table.reset_index(drop=True).astype(float)
+    ax = table.plot(secondary_y='Log loss', marker='o')
+    image_data = plot_helpers.save_image(ax.figure)
+    return utf8_decode(image_data)
+
+
+def drift_table(drift, thresholds):
+    table = _drift_table(drift, thresholds)
+    html = table.to_html()
+    return html.replace('class="dataframe"',
+                        'class="table table-striped table-bordered table-condensed"')
+
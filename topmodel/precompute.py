@@ -0,0 +1,178 @@
+# Computes the metrics of models in pools of worker processes: the cached
+# histogram and bootstrap artifacts of models as soon as they are uploaded,
+# so the web server doesn't have to compute them while someone waits for a
+# page, and the metrics of the models a page compares.
+
+import multiprocessing
+import threading
+import time
+import traceback
+
+from topmodel.model_data import ModelDataManager, UNIFORM_BINNING
+
+# Seconds between listings of the file system
+POLL_INTERVAL = 30
+# Bootstrap samples drawn for the model page
+N_BOOTSTRAP_SAMPLES = 50
+
+# The file system of a worker process
+worker_file_system = None
+
+
+def init_worker(file_system_factory):
+    # Every worker opens its own file system, since S3 connections can't be
+    # shared with (or pickled for) another process
+    global worker_file_system
+    worker_file_system = file_system_factory()
+
+
+def precompute_model(model_class, model_path, n_bootstrap_samples, binning=UNIFORM_BINNING):
+    # Runs in a worker process. Returns the error, if there was one, as a
+    # string, since not every exception can be pickled.
+    try:
+        model_data = model_class(worker_file_system, model_path, binning=binning)
+        # histogram.json also has the top thresholds histogram
+        model_data.to_histogram_format()
+        model_data.to_bootstrap_format(n_bootstrap_samples)
+    except Exception:
+        return traceback.format_exc()
+
+
+def model_metrics(model_class, model_path, n_bootstrap_samples, binning=UNIFORM_BINNING):
+    # Runs in a worker process
+    model_data = model_class(worker_file_system, model_path, binning=binning)
+    return model_data.get_metrics(n_bootstrap_samples)
+
+
+def is_loaded(model_data, n_bootstrap_samples):
+    # Whether the model's metrics can be computed without reading anything
+    return model_data.histogram is not None and (
+        not n_bootstrap_samples or n_bootstrap_samples in (model_data.bootstrap or {}))
+
+
+class MetricsComputer(object):
+    """
+    Computes the metrics of several models at once in a process pool (or
+    in this process, for those whose artifacts are loaded already), and
+    keeps them in the models' caches. A computation that takes longer than
+    the caller is willing to wait carries on, and later calls for the same
+    model (and upload) wait for it rather than starting again.
+    """
+
+    def __init__(self, manager, pool):
+        self.manager = manager
+        self.pool = pool
+        # (model path, version, n_bootstrap_samples) -> result
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def get_metrics(self, model_paths, n_bootstrap_samples, timeout=None):
+        """
+        Returns ({model path: metrics}, [model path]) for the models whose
+        metrics were computed within `timeout` seconds, and the ones whose
+        metrics are still being computed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        done, results = {}, []
+        for model_path in model_paths:
+            model_data = self.manager.get_model(model_path)
+            metrics = model_data.metrics or {}
+            if n_bootstrap_samples in metrics:
+                done[model_path] = metrics[n_bootstrap_samples]
+            elif is_loaded(model_data, n_bootstrap_samples):
+                # Its histogram and bootstrap samples are already in memory
+                # (eg. prefetched), so its metrics are quicker to compute
+                # here than in a worker that reads them again
+                done[model_path] = model_data.get_metrics(n_bootstrap_samples)
+            else:
+                results.append((model_data, self.start(model_data, n_bootstrap_samples)))
+
+        computing = []
+        for model_data, (key, result) in results:
+            result.wait(None if deadline is None else max(deadline - time.time(), 0))
+            if not result.ready():
+                computing.append(model_data.model_path)
+                continue
+            with self.lock:
+                self.pending.pop(key, None)
+            done[model_data.model_path] = result.get()
+            metrics = model_data.metrics or {}
+            metrics[n_bootstrap_samples] = done[model_data.model_path]
+            model_data.metrics = metrics
+        return done, computing
+
+    def start(self, model_data, n_bootstrap_samples):
+        key = (model_data.model_path, model_data.modified, n_bootstrap_samples)
+        with self.lock:
+            # Forget uncollected results for older uploads of the model
+            for pending_key, result in self.pending.items():
+                if pending_key[0] == key[0] and pending_key != key and result.ready():
+                    del self.pending[pending_key]
+            if key not in self.pending:
+                self.pending[key] = self.pool.apply_async(
+                    model_metrics, (type(model_data), model_data.model_path,
+                                    n_bootstrap_samples, model_data.binning))
+            return key, self.pending[key]
+
+
+class Precomputer(object):
+    """
+    Precomputes, in a process pool, the models that are new or have changed
+    since the last `poll`. Models whose artifacts are already up to date
+    only cost the workers a check of the artifacts' fingerprints.
+    """
+
+    def __init__(self, manager, pool, n_bootstrap_samples=N_BOOTSTRAP_SAMPLES):
+        self.manager = manager
+        self.pool = pool
+        self.n_bootstrap_samples = n_bootstrap_samples
+        # model path -> version precomputed
+        self.done = {}
+        # model path -> (version, result) being precomputed
+        self.pending = {}
+
+    def poll(self):
+        self.manager.refresh()
+        for model_path, (version, result) in self.pending.items():
+            if result.ready():
+                del self.pending[model_path]
+                self.done[model_path] = version
+                error = result.get()
+                if error is None:
+                    print "Precomputed %s" % model_path
+                else:
+                    print "Failed to precompute %s\n%s" % (model_path, error)
+
+        for model_path in set(self.done) - set(self.manager.models):
+            del self.done[model_path]
+        for model_path, model_data in sorted(self.manager.models.items()):
+            version = self.manager.versions[model_path]
+            # Changed models that are still pending are started again next time
+            if self.done.get(model_path) != version and model_path not in self.pending:
+                result = self.pool.apply_async(
+                    precompute_model,
+                    (type(model_data), model_path, self.n_bootstrap_samples,
+                     model_data.binning))
+                self.pending[model_path] = (version, result)
+
+
+def run(file_system, file_system_factory, processes=None, interval=POLL_INTERVAL,
+        n_bootstrap_samples=N_BOOTSTRAP_SAMPLES, once=False, binning=UNIFORM_BINNING):
+    """
+    Poll the file system every `interval` seconds, precomputing new and
+    changed models in a pool of `processes` workers (by default one per
+    CPU). With `once`, return after precomputing the models there are now.
+    """
+    pool = multiprocessing.Pool(processes, init_worker, (file_system_factory,))
+    precomputer = Precomputer(
+        ModelDataManager(file_system, binning=binning), pool, n_bootstrap_samples)
+    try:
+        while True:
+            precomputer.poll()
+            if once and not precomputer.pending:
+                break
+            time.sleep(min(interval, 1) if once else interval)
+    finally:
+        pool.terminate()
+        pool.join()
+
@@ -1,15 +1,47 @@
 #!/usr/bin/env python
 
 import argparse
+import atexit
+import os
+import subprocess
+import sys
+
+from topmodel.model_data import BINNINGS, UNIFORM_BINNING
 from web import app
 
+
+def start_precompute(remote, binning):
+    # The precompute worker runs in its own process (with its own pool of
+    # workers) for as long as the server does. Only the outermost process
+    # starts it: with the reloader, the server itself runs in a child that
+    # is restarted on every code change.
+    if os.environ.get('WERKZEUG_RUN_MAIN'):
+        return
+    command = [sys.executable, '-m', 'topmodel.cli']
+    if remote:
+        command.append('--remote')
+    command.extend(['precompute', '--binning', binning])
+    worker = subprocess.Popen(command)
+    atexit.register(worker.terminate)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Runs Topmodel Server")
     parser.add_argument(
         "--remote", "-r", action="store_true", default=False, help="Use data from S3")
     parser.add_argument("--development", "-d", action="store_true",
                         default=False, help="Run topmodel in development mode with autoreload")
+    parser.add_argument("--precompute", "-p", action="store_true", default=False,
+                        help="Compute the metrics of new models in the background")
+    parser.add_argument("--binning", choices=BINNINGS, default=UNIFORM_BINNING,
+                        help="Equal width histogram bins, or bins adapted to the scores")
+    parser.add_argument("--lazy", action="store_true", default=False,
+                        help="List the models a directory at a time as they're browsed")
     args = parser.parse_args()
     app.local = not args.remote
+    app.config['BINNING'] = args.binning
+    app.config['LAZY_DISCOVERY'] = args.lazy
+    if args.precompute:
+        start_precompute(args.remote, args.binning)
     app.run(port=9191, host="0.0.0.0",
             debug=True, use_reloader=args.development)
@@ -1,27 +1,74 @@
+import functools
+import multiprocessing
+import threading
+
 from flask import Flask, g
 import pandas as pd
 import matplotlib
 
 matplotlib.use("Agg")  # Must be called before importing pyplot
 
-from topmodel.file_system import LocalFileSystem, S3FileSystem
-from topmodel.model_data import ModelDataManager
-from topmodel import settings
+from topmodel import precompute
+from topmodel.cache import LRUCache
+from topmodel.file_system import get_file_system
+from topmodel.model_data import ModelDataManager, UNIFORM_BINNING
+
+# Seconds before the model catalog is listed again
+CATALOG_TTL = 60
+# Memory for parsed scores, histograms and metrics, shared by all models
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Worker processes computing the metrics of compared models (None for one
+# per CPU), and how many seconds a comparison waits for them
+COMPARE_PROCESSES = None
+COMPARE_TIMEOUT = 30
+# How the models' histograms are binned (see topmodel.model_data)
+BINNING = UNIFORM_BINNING
+# List the models a directory at a time as they're browsed, rather than all
+# of them up front (see ModelDataManager)
+LAZY_DISCOVERY = False
 
 # Make plots pretty
 pd.set_option('display.mpl_style', 'default')
 app = Flask(__name__)
+app.config['COMPARE_PROCESSES'] = COMPARE_PROCESSES
+app.config['COMPARE_TIMEOUT'] = COMPARE_TIMEOUT
+app.config['BINNING'] = BINNING
+app.config['LAZY_DISCOVERY'] = LAZY_DISCOVERY
+app.model_data_manager = None
+app.metrics_computer = None
+catalog_lock = threading.Lock()
+
+
+def get_model_data_manager():
+    # One catalog per process, created on first use since app.local is only
+    # set once the server has parsed its arguments
+    with catalog_lock:
+        if app.model_data_manager is None:
+            app.model_data_manager = ModelDataManager(
+                get_file_system(app.local), ttl=CATALOG_TTL,
+                cache=LRUCache(CACHE_MAX_BYTES), binning=app.config['BINNING'],
+                lazy=app.config['LAZY_DISCOVERY'])
+    return app.model_data_manager
+
+
+def get_metrics_computer():
+    # The process pool is also started on first use, by which time the
+    # catalog exists. Every worker opens its own file system.
+    manager = get_model_data_manager()
+    with catalog_lock:
+        if app.metrics_computer is None:
+            pool = multiprocessing.Pool(
+                app.config['COMPARE_PROCESSES'], precompute.init_worker,
+                (functools.partial(get_file_system, app.local),))
+            app.metrics_computer = precompute.MetricsComputer(manager, pool)
+    return app.metrics_computer
 
 
 @app.before_request
 def before_request():
-    if app.local:
-        g.file_system = LocalFileSystem()
-    else:
-        config = settings.read_config('./config.yaml')
-        g.file_system = S3FileSystem(config['bucket'],
-                                     config['aws_access_key'],
-                                     config['aws_secret_key'])
-    g.model_data_manager = ModelDataManager(g.file_system)
+    g.model_data_manager = get_model_data_manager()
+    g.model_data_manager.refresh_if_stale()
+    g.file_system = g.model_data_manager.file_system
 
 import web.views.pages
+import web.views.api
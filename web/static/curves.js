@@ -0,0 +1,87 @@
+// Draws a curve and its bootstrap samples on a canvas, from the data the
+// model page sends with ?render=client (see plots.curves_json): xs[i] and
+// ys[i] are the coordinates of the ith curve at every threshold, the first
+// one being the curve itself. Undefined points (null) are skipped.
+function drawCurves(container, xs, ys, thresholds, xlabel, ylabel) {
+  var width = 480, height = 360, margin = 45;
+  var canvas = document.createElement('canvas');
+  canvas.width = width;
+  canvas.height = height;
+  container.appendChild(canvas);
+  var ctx = canvas.getContext('2d');
+
+  function px(x) { return margin + x * (width - 2 * margin); }
+  function py(y) { return height - margin - y * (height - 2 * margin); }
+
+  // Axes, with ticks every 0.2
+  ctx.strokeStyle = '#333';
+  ctx.fillStyle = '#333';
+  ctx.font = '11px sans-serif';
+  ctx.strokeRect(px(0), py(1), px(1) - px(0), py(0) - py(1));
+  for (var tick = 0; tick <= 5; tick++) {
+    var value = tick / 5;
+    ctx.textAlign = 'center';
+    ctx.fillText(value.toFixed(1), px(value), py(0) + 15);
+    ctx.textAlign = 'right';
+    ctx.fillText(value.toFixed(1), px(0) - 5, py(value) + 4);
+  }
+  ctx.textAlign = 'center';
+  ctx.fillText(xlabel, px(0.5), height - 8);
+  ctx.save();
+  ctx.translate(12, py(0.5));
+  ctx.rotate(-Math.PI / 2);
+  ctx.fillText(ylabel, 0, 0);
+  ctx.restore();
+
+  function line(curveXs, curveYs) {
+    var drawing = false;
+    ctx.beginPath();
+    for (var i = 0; i < curveXs.length; i++) {
+      if (curveXs[i] === null || curveYs[i] === null) {
+        drawing = false;
+      } else if (drawing) {
+        ctx.lineTo(px(curveXs[i]), py(curveYs[i]));
+      } else {
+        ctx.moveTo(px(curveXs[i]), py(curveYs[i]));
+        drawing = true;
+      }
+    }
+    ctx.stroke();
+  }
+
+  // Bootstrap samples faintly, then the curve and its points
+  ctx.strokeStyle = 'rgba(31, 119, 180, 0.15)';
+  for (var i = 1; i < xs.length; i++) {
+    line(xs[i], ys[i]);
+  }
+  ctx.strokeStyle = '#1f77b4';
+  ctx.fillStyle = '#1f77b4';
+  ctx.lineWidth = 2;
+  line(xs[0], ys[0]);
+  for (var j = 0; j < xs[0].length; j++) {
+    if (xs[0][j] !== null && ys[0][j] !== null) {
+      ctx.beginPath();
+      ctx.arc(px(xs[0][j]), py(ys[0][j]), 2.5, 0, 2 * Math.PI);
+      ctx.fill();
+    }
+  }
+
+  // The threshold of the nearest point as a tooltip
+  canvas.addEventListener('mousemove', function(event) {
+    var rect = canvas.getBoundingClientRect();
+    var x = event.clientX - rect.left, y = event.clientY - rect.top;
+    var nearest = null, nearestDistance = Infinity;
+    for (var k = 0; k < xs[0].length; k++) {
+      if (xs[0][k] === null || ys[0][k] === null) {
+        continue;
+      }
+      var distance = Math.pow(px(xs[0][k]) - x, 2) + Math.pow(py(ys[0][k]) - y, 2);
+      if (distance < nearestDistance) {
+        nearest = k;
+        nearestDistance = distance;
+      }
+    }
+    canvas.title = nearest === null ? '' : 'Threshold: ' + thresholds[nearest] +
+      ' (' + xs[0][nearest].toFixed(2) + ', ' + ys[0][nearest].toFixed(2) + ')';
+  });
+}
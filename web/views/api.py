@@ -0,0 +1,160 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+
+from flask import Response, abort, g, request, jsonify
+import numpy as np
+
+from topmodel.catalog import paginate
+from topmodel.hmetrics import auc
+from web import app
+
+# How the bootstrap samples of /api/model/<path>/metrics are sent
+LIST_ENCODING = 'lists'
+BASE64_ENCODING = 'base64'
+ENCODINGS = [LIST_ENCODING, BASE64_ENCODING]
+# More samples than this are refused, as they'd take minutes to draw
+MAX_BOOTSTRAP_SAMPLES = 1000
+
+
+@app.route("/api/models")
+def models():
+    """
+    A page of the index of the models: the entries in the directory `prefix`
+    (one level of it, so the index loads a directory at a time), or with `q`
+    the models under it whose path contains q.
+    """
+    prefix = request.args.get('prefix', '').strip('/')
+    query = request.args.get('q', '')
+    page = max(1, request.args.get('page', 1, type=int))
+    manager = g.model_data_manager
+    if query:
+        prefix_is_model = None
+        entries = [(path, True, 0) for path in manager.search(query, prefix)]
+    else:
+        prefix_is_model, entries = manager.browse(prefix)
+    entries, pages = paginate(entries, page)
+    return jsonify({
+        'prefix': prefix,
+        'q': query,
+        'model': prefix_is_model,
+        'page': page,
+        'pages': pages,
+        'entries': [{'path': path, 'model': is_model, 'models': n_models}
+                    for path, is_model, n_models in entries],
+    })
+
+
+@app.route("/api/model/<path:path>/metrics")
+def model_metrics(path):
+    """
+    A model's metrics at every threshold and at the top thresholds, and its
+    AUC, with `bootstrap` resampled metrics. With `encoding=base64` each of
+    the bootstrap metrics is a base64 float32 array with a row per sample,
+    rather than the samples being a list of dicts of lists.
+
+    The ETag is a hash of the model's fingerprint, so a client polling with
+    If-None-Match gets a 304, without the metrics even being looked at,
+    until the model's scores change. The gzipped body has an ETag of its
+    own, since it isn't the same bytes.
+    """
+    try:
+        model_data = g.model_data_manager.get_model(path.strip('/'))
+    except KeyError:
+        abort(404)
+    n_bootstrap_samples = request.args.get('bootstrap', 0, type=int)
+    encoding = request.args.get('encoding', LIST_ENCODING)
+    if encoding not in ENCODINGS or not 0 <= n_bootstrap_samples <= MAX_BOOTSTRAP_SAMPLES:
+        abort(400)
+
+    gzipped = 'gzip' in request.accept_encodings
+    etag = hashlib.sha1(json.dumps(
+        [model_data.fingerprint(), n_bootstrap_samples, encoding], sort_keys=True)).hexdigest()
+    if gzipped:
+        etag += '-gzip'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        # Encoded (and compressed) once per upload of the model
+        rendered = model_data.rendered or {}
+        key = ('api', n_bootstrap_samples, encoding)
+        if key not in rendered:
+            body = json.dumps(metrics_json(model_data, n_bootstrap_samples, encoding))
+            rendered[key] = (body, gzip_compress(body))
+            model_data.rendered = rendered
+        body, compressed = rendered[key]
+        if gzipped:
+            response = Response(compressed, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Cached, but checked with the ETag every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def metrics_json(model_data, n_bootstrap_samples, encoding):
+    if n_bootstrap_samples:
+        metrics = model_data.get_metrics(n_bootstrap_samples)
+        base, samples = metrics[0], metrics[1:]
+    else:
+        base, samples = model_data.get_metrics(), []
+    result = {
+        'path': model_data.model_path,
+        'auc': sample_auc(base),
+        'metrics': non_finite_to_none(base),
+        'top_metrics': non_finite_to_none(model_data.get_top_metrics()),
+    }
+    if encoding == BASE64_ENCODING:
+        result['bootstrap'] = encode_samples(samples)
+    else:
+        result['bootstrap'] = [dict(non_finite_to_none(sample), auc=sample_auc(sample))
+                               for sample in samples]
+    return result
+
+
+def sample_auc(metrics):
+    value = auc(np.asarray(metrics['fprs'], dtype=float),
+                np.asarray(metrics['recalls'], dtype=float))
+    return finite_or_none(value)
+
+
+def non_finite_to_none(metrics):
+    return dict((name, finite_or_none(value)) for name, value in metrics.items())
+
+
+def finite_or_none(value):
+    # JSON has no NaN or Infinity, so undefined (and infinite, eg. the
+    # logloss of a false at a threshold of 1) metrics are None
+    if isinstance(value, list):
+        return [finite_or_none(item) for item in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def encode_samples(samples):
+    # {metric: {'dtype', 'shape', 'data'}}, every metric of every sample as
+    # one little endian float32 array, with NaN where a metric is undefined
+    arrays = {'auc': [sample_auc(sample) for sample in samples]}
+    for name in samples[0] if samples else []:
+        if name != 'thresholds':
+            arrays[name] = [sample[name] for sample in samples]
+    return dict((name, encode_array(np.array(values, dtype=float).astype('<f4')))
+                for name, values in arrays.items())
+
+
+def encode_array(array):
+    return {'dtype': 'float32', 'shape': list(array.shape),
+            'data': base64.b64encode(array.tostring())}
+
+
+def gzip_compress(data):
+    with io.BytesIO() as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6) as gz:
+            gz.write(data)
+        return f.getvalue()
@@ -1,50 +1,85 @@
-from flask import render_template, g, request, redirect
+from flask import render_template, g, request, redirect, jsonify
 
 from topmodel import plots
 from topmodel.hmetrics import auc
-from web import app
+from topmodel.model_data import DRIFT_THRESHOLDS, DRIFT_WINDOWS
+from web import app, get_metrics_computer
 
 import matplotlib.pyplot as plt
 
+# Bootstrap samples drawn on the model page
+N_BOOTSTRAP_SAMPLES = 50
+# Segments whose curves are drawn on the segments page
+PLOTTED_SEGMENTS = 10
+
 
 @app.route("/")
 def home():
-    model_paths = sorted(g.model_data_manager.models.keys())
-    return render_template("index.html", model_paths=model_paths)
+    # The models themselves are loaded a directory (or page) at a time from
+    # /api/models
+    if request.args.get('refresh'):
+        g.model_data_manager.invalidate()
+    return render_template("index.html")
 
 
 @app.route("/compare")
 def compare():
-    models = request.args.getlist('model[]')
-    cached_datas = []
-    for path in models:
-        model_data = g.model_data_manager.models[path]
-        cached_datas.append(model_data.get_metrics(10))
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    for name, cached_data in zip(models, cached_datas):
-        prc = plots.precision_recall_curve(cached_data, ax=ax, fig=fig, label=name)
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    for name, cached_data in zip(models, cached_datas):
-        roc = plots.roc_curve(cached_data, ax=ax, fig=fig, label=name)
+    models = [path.rstrip('/') for path in request.args.getlist('model[]')]
+    # Read the models' cached metrics all at once, rather than one by one
+    g.model_data_manager.prefetch(models, n_bootstrap_samples=10)
+    # and compute the metrics of those here, and of the rest in parallel,
+    # for as long as we can wait
+    metrics, computing = get_metrics_computer().get_metrics(
+        models, 10, timeout=app.config['COMPARE_TIMEOUT'])
+    names = [name for name in models if name in metrics]
+
+    prc, roc = None, None
+    if names:
+        fig, ax = plt.subplots(figsize=(12, 6))
+        for name in names:
+            prc = plots.precision_recall_curve(metrics[name], ax=ax, fig=fig, label=name)
+
+        fig, ax = plt.subplots(figsize=(12, 6))
+        for name in names:
+            roc = plots.roc_curve(metrics[name], ax=ax, fig=fig, label=name)
 
     context = {
         'precision_recall_curve': prc,
-        'roc_curve': roc}
+        'roc_curve': roc,
+        'computing': computing}
 
     return render_template("compare.html", **context)
 
 
 @app.route("/model/<path:path>/")
 def training(path):
-    model_data = g.model_data_manager.models[path]
-    cached_data = model_data.get_metrics(50)
-    top_data = model_data.get_top_metrics()
+    model_data = g.model_data_manager.get_model(path)
+    exact = bool(request.args.get('exact'))
+    # Draw the curves in the browser from their data, rather than sending
+    # every bootstrap sample's curve as mpld3 markup
+    client = request.args.get('render') == 'client'
+
+    # The plots only change with the model's metrics, so they are drawn
+    # once per upload of the model (and way of drawing them)
+    rendered = model_data.rendered or {}
+    key = ('model', N_BOOTSTRAP_SAMPLES, exact, client)
+    if key not in rendered:
+        rendered[key] = render_model_plots(model_data, exact, client)
+        model_data.rendered = rendered
+
+    context = dict(rendered[key])
+    context.update({
+        'notes': model_data.get_notes(),
+        'model_metadata': model_data.get_metadata(),
+        'path': path,
+    })
+    return render_template("results.html", **context)
+
 
+def render_model_plots(model_data, exact, client):
+    cached_data = model_data.get_metrics(N_BOOTSTRAP_SAMPLES)
+    top_data = model_data.get_top_metrics()
     context = {
-        'precision_recall_curve': plots.precision_recall_curve(cached_data),
-        'roc_curve': plots.roc_curve(cached_data),
         'score_distribution': plots.score_distribution(cached_data[0]),
         'absolute_score_distribution': plots.absolute_score_distribution(cached_data[0]),
         'marginal_precision_curve': plots.marginal_precision_curve(cached_data[0]),
@@ -53,21 +88,91 @@ def training(path):
         'top_threshold_table': plots.thresholds_table(top_data),
 
         'auc': auc(cached_data[0]['fprs'], cached_data[0]['recalls']),
-        'notes': model_data.get_notes(),
-        'model_metadata': model_data.get_metadata(),
+        'exact': exact,
+        'client': client,
+    }
+    if exact:
+        # Curves through every distinct score, and the exact AUC, instead
+        # of the ones from the 100 bin histogram
+        curves = model_data.get_exact_curves()
+        context.update({
+            'auc': curves['auc'],
+            'average_precision': curves['average_precision'],
+        })
+        if client:
+            context['curves_json'] = plots.curves_json([curves])
+        else:
+            context['precision_recall_curve'] = plots.exact_precision_recall_curve(curves)
+            context['roc_curve'] = plots.exact_roc_curve(curves)
+    elif client:
+        context['curves_json'] = plots.curves_json(cached_data)
+    else:
+        context['precision_recall_curve'] = plots.precision_recall_curve(cached_data)
+        context['roc_curve'] = plots.roc_curve(cached_data)
+    return context
+
+
+@app.route("/model/<path:path>/segments")
+def segments(path):
+    model_data = g.model_data_manager.get_model(path)
+    segment_hists = model_data.get_segment_histograms()
+    columns = [column_hists['column'] for column_hists in segment_hists['columns']]
+    column = request.args.get('column') or (columns[0] if columns else None)
+
+    context = {
+        'columns': columns,
+        'column': column,
+        'skipped': segment_hists['skipped'],
         'path': path,
+        'segments': [],
     }
-    return render_template("results.html", **context)
+    if column in columns:
+        segment_metrics = model_data.get_segment_metrics(column)
+        # Only the largest segments' curves, or the plots are unreadable
+        plotted = [(segment, metrics) for segment, metrics in segment_metrics[:PLOTTED_SEGMENTS]
+                   if sum(metrics['trues'])]
+        if plotted:
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for segment, metrics in plotted:
+                context['precision_recall_curve'] = plots.precision_recall_curve(
+                    [metrics], ax=ax, fig=fig, label=segment)
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for segment, metrics in plotted:
+                context['roc_curve'] = plots.roc_curve(
+                    [metrics], ax=ax, fig=fig, label=segment)
+        context['segments'] = segment_metrics
+        context['n_plotted'] = len(plotted)
+    return render_template("segments.html", **context)
+
+
+@app.route("/model/<path:path>/drift")
+def drift(path):
+    model_data = g.model_data_manager.get_model(path)
+    n_windows = request.args.get('windows', DRIFT_WINDOWS, type=int)
+    drift = model_data.get_drift(n_windows=n_windows, thresholds=DRIFT_THRESHOLDS)
+    context = {
+        'drift_graph': plots.drift_graph(drift, DRIFT_THRESHOLDS),
+        'drift_table': plots.drift_table(drift, DRIFT_THRESHOLDS),
+        'n_windows': n_windows,
+        'path': path,
+    }
+    return render_template("drift.html", **context)
+
+
+@app.route("/cache")
+def cache_stats():
+    return jsonify(g.model_data_manager.cache.stats())
 
 
 @app.route("/model/<path:path>", methods=['DELETE'])
 def delete_path(path):
     g.file_system.remove(path)
+    g.model_data_manager.refresh_removed(path)
     return "Success!"
 
 
 @app.route("/model/<path:path>/notes/", methods=['PUT'])
 def update_notes(path):
-    model_data = g.model_data_manager.models[path]
+    model_data = g.model_data_manager.get_model(path)
     model_data.set_notes(request.form['notes'])
     return "Success!"